@@ -0,0 +1,112 @@
+"""
+Measures the cold start of Python code with and without the bytecode
+precompilation stage of docker.Image(precompile=True): every run is a fresh
+interpreter importing the code, like a training process or a gunicorn worker
+starting in the container (where PYTHONDONTWRITEBYTECODE is set, so nothing
+compiled at import time is ever reused).
+
+Local mode synthesizes a package of user modules (or uses the given directory),
+copies it twice, precompiles one copy and times the imports of both:
+
+    python benchmarks/cold_start.py local [--modules 200] [--runs 20] [--directory DIR --import NAME]
+
+Docker mode times the imports in images built with and without precompile:
+
+    python benchmarks/cold_start.py docker IMAGE [IMAGE ...] [--import NAME] [--runs 10]
+"""
+import argparse
+import compileall
+import os
+import py_compile
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+IMPORT_SNIPPET = "import sys, time; start = time.perf_counter(); sys.path[:0] = {path!r}; " \
+                 "{imports}; print(time.perf_counter() - start)"
+
+
+def write_package(directory, modules, functions=50):
+    package = os.path.join(directory, "userpkg")
+    os.makedirs(package)
+    with open(os.path.join(package, "__init__.py"), "w") as file:
+        file.write("".join("from . import module{}\n".format(index) for index in range(modules)))
+    for index in range(modules):
+        with open(os.path.join(package, "module{}.py".format(index)), "w") as file:
+            for function in range(functions):
+                file.write("def function{0}(x, y=None):\n"
+                           "    values = [value * {0} for value in range(x) if value % 3]\n"
+                           "    return {{'sum': sum(values), 'y': y, 'name': 'function{0}'}}\n\n".format(function))
+    return ["userpkg"]
+
+
+def time_imports(argv, path, imports, runs):
+    snippet = IMPORT_SNIPPET.format(path=path, imports="; ".join("import " + name for name in imports))
+    environment = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output(argv + ["-c", snippet], env=environment)
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return timings
+
+
+def report(name, timings):
+    print("{:>24}: median {:.1f} ms, min {:.1f} ms over {} runs".format(
+        name, statistics.median(timings) * 1000, min(timings) * 1000, len(timings)))
+
+
+def local(arguments):
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "original")
+        if arguments.directory is None:
+            os.makedirs(source)
+            imports = write_package(source, arguments.modules)
+        else:
+            shutil.copytree(arguments.directory, source)
+            imports = arguments.imports
+
+        for variant in ["precompiled", "compiled at import"]:
+            path = os.path.join(directory, variant.replace(" ", "_"))
+            shutil.copytree(source, path, ignore=shutil.ignore_patterns("__pycache__"))
+            if variant == "precompiled":
+                compileall.compile_dir(path, quiet=1, workers=0,
+                                       invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+            report(variant, time_imports([sys.executable], [path], imports, arguments.runs))
+
+
+def docker(arguments):
+    for image in arguments.images:
+        report(image, time_imports(["docker", "run", "--rm", "--entrypoint", "python3.6", image],
+                                   ["/opt/program", "/opt/program/user"], arguments.imports or ["predict"],
+                                   arguments.runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    modes = parser.add_subparsers(dest="mode")
+
+    local_parser = modes.add_parser("local")
+    local_parser.add_argument("--modules", type=int, default=200)
+    local_parser.add_argument("--directory")
+    local_parser.add_argument("--import", dest="imports", action="append", default=[])
+    local_parser.add_argument("--runs", type=int, default=20)
+    local_parser.set_defaults(run=local)
+
+    docker_parser = modes.add_parser("docker")
+    docker_parser.add_argument("images", nargs="+")
+    docker_parser.add_argument("--import", dest="imports", action="append")
+    docker_parser.add_argument("--runs", type=int, default=10)
+    docker_parser.set_defaults(run=docker)
+
+    arguments = parser.parse_args()
+    if arguments.mode is None:
+        parser.print_help()
+        return
+    arguments.run(arguments)
+
+
+if __name__ == "__main__":
+    main()
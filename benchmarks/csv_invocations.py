@@ -0,0 +1,74 @@
+"""
+Benchmarks the CSV parsing and serialization of /invocations: the pandas path
+(decode, StringIO, read_csv, DataFrame.to_csv) against the numpy fast path of
+content_types, used when the model metadata gives the input dtype and columns,
+and against the same rows sent as application/x-npy.
+
+Requires numpy and pandas.
+
+Usage: python benchmarks/csv_invocations.py [body MB] [columns] [runs]
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "valohai_sagemaker",
+                                                "resources", "container-template", "model")))
+
+import numpy
+import pandas as pd
+
+from content_types import parse_csv, format_csv, decode_npy, encode_npy
+
+
+def pandas_path(body, columns):
+    data = pd.read_csv(io.StringIO(body.decode("utf-8")), header=None)
+    predictions = data.values.sum(axis=1)
+    out = io.StringIO()
+    pd.DataFrame({"results": predictions}).to_csv(out, header=False, index=False)
+    return out.getvalue()
+
+
+def fast_path(body, columns):
+    data = parse_csv(body, "float64", columns)
+    return format_csv(data.sum(axis=1))
+
+
+def npy_path(body, columns):
+    data = decode_npy(body, {})
+    return encode_npy(data.sum(axis=1))
+
+
+def best_of(function, runs, *args):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(megabytes=5, columns=20, runs=5):
+    generator = numpy.random.default_rng(0)
+    rows = int(megabytes * 1e6 // (columns * 9))
+    out = io.StringIO()
+    numpy.savetxt(out, generator.random((rows, columns)).round(6), delimiter=",", fmt="%.6f")
+    body = out.getvalue().encode("utf-8")
+    print("body: {} rows x {} columns, {:.1f} MB".format(rows, columns, len(body) / 1e6))
+
+    pandas_seconds, pandas_result = best_of(pandas_path, runs, body, columns)
+    fast_seconds, fast_result = best_of(fast_path, runs, body, columns)
+    assert numpy.allclose(numpy.loadtxt(io.StringIO(pandas_result)), numpy.loadtxt(io.StringIO(fast_result)))
+
+    npy_body = io.BytesIO()
+    numpy.save(npy_body, numpy.loadtxt(io.BytesIO(body), delimiter=","))
+    npy_seconds, _ = best_of(npy_path, runs, npy_body.getvalue(), columns)
+
+    print("pandas: {:.1f} ms".format(pandas_seconds * 1000))
+    print("  fast: {:.1f} ms".format(fast_seconds * 1000))
+    print("   npy: {:.1f} ms ({:.1f} MB body)".format(npy_seconds * 1000, len(npy_body.getvalue()) / 1e6))
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:2]), *map(int, sys.argv[2:]))
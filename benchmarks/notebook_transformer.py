@@ -0,0 +1,87 @@
+"""
+Benchmarks IPythonNotebookFileTransformer on a large synthetic notebook
+(many code cells with base64 image outputs), against the previous
+json.loads + reduce implementation.
+
+Each implementation runs in its own process so peak memory can be compared.
+
+Usage: python benchmarks/notebook_transformer.py [cells] [output KB per cell]
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from functools import reduce
+from itertools import starmap
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from valohai_sagemaker.ipython import IPythonNotebookFileTransformer, BEGIN_TAG, END_TAG
+
+
+def legacy_get_tagged_code(filename):
+    """The extraction as it was before the streaming reader."""
+    with open(filename) as file:
+        content = json.loads(file.read())
+
+    code_cells = filter(lambda x: x["cell_type"] == "code", content["cells"])
+    all_code_lines = reduce(lambda x, y: x + y, map(lambda x: x["source"], code_cells))
+    cleaned_code_lines = tuple(map(lambda line: line if line[-1] == "\n" else line + "\n",
+                                   all_code_lines))
+
+    begin_tag_line_indices = map(lambda pair: pair[0], filter(lambda pair: BEGIN_TAG in pair[1],
+                                                          enumerate(cleaned_code_lines)))
+    end_tag_line_indices = map(lambda pair: pair[0], filter(lambda pair: END_TAG in pair[1],
+                                                        enumerate(cleaned_code_lines)))
+    tagged_line_blocks = starmap(lambda begin, end: cleaned_code_lines[begin+1:end],
+                                 zip(begin_tag_line_indices, end_tag_line_indices))
+
+    return "".join(reduce(lambda x, y: x + y, tagged_line_blocks))
+
+
+def write_notebook(filename, cells, output_kb):
+    image = "iVBORw0KGgo" * (output_kb * 1024 // 11)
+    with open(filename, "w") as file:
+        file.write('{"cells": [')
+        for index in range(cells):
+            cell = {"cell_type": "code", "execution_count": index, "metadata": {},
+                    "outputs": [{"output_type": "display_data", "metadata": {},
+                                 "data": {"image/png": image, "text/plain": ["<Figure>"]}}],
+                    "source": [BEGIN_TAG + "\n"] + ["x_{} = {}\n".format(index, line) for line in range(100)] +
+                              [END_TAG + "\n", "plot(x)"]}
+            file.write(("," if index > 0 else "") + json.dumps(cell))
+        file.write('], "metadata": {}, "nbformat": 4, "nbformat_minor": 2}')
+
+
+def measure(implementation, filename):
+    start = time.perf_counter()
+    if implementation == "legacy":
+        code = legacy_get_tagged_code(filename)
+    else:
+        code = IPythonNotebookFileTransformer().get_tagged_code(filename)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "lines": code.count("\n"),
+                      "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def main(cells=2000, output_kb=64):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "large.ipynb")
+        write_notebook(filename, cells, output_kb)
+        print("notebook: {} cells, {:.1f} MB".format(cells, os.path.getsize(filename) / 1e6))
+
+        for implementation in ["legacy", "streaming"]:
+            result = json.loads(subprocess.check_output(
+                [sys.executable, __file__, "--measure", implementation, filename]))
+            print("{:>9}: {:.2f}s, peak RSS {:.0f} MB, {} lines".format(
+                implementation, result["seconds"], result["max_rss_mb"], result["lines"]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], sys.argv[3])
+    else:
+        main(*map(int, sys.argv[1:]))
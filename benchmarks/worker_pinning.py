@@ -0,0 +1,170 @@
+"""
+Measures the latency of /invocations under concurrent load for several CPU
+layouts of the gunicorn workers of the inference server: the historical one
+(a worker per core, each with the default BLAS thread pool of a thread per
+core, unpinned) against "<workers>x<threads>" layouts (MODEL_SERVER_CPU_LAYOUT:
+each worker pinned to its own threads CPUs and its BLAS pool capped to them).
+
+The workers are launched like serve.py does, on a TCP port instead of behind
+nginx, and serve a numpy model doing a matrix product heavy enough to use the
+BLAS threads.
+
+Requires numpy and gunicorn, and a multi-core machine to be meaningful.
+
+Usage: python benchmarks/worker_pinning.py [--layouts default 8x1 4x2] [--concurrency 32]
+                                           [--requests 2000] [--rows 64] [--features 512]
+"""
+import argparse
+import http.client
+import json
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy
+
+TEMPLATE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "valohai_sagemaker",
+                                        "resources", "container-template", "model"))
+sys.path.insert(0, TEMPLATE)
+
+import serve
+from serving_profile import serving_settings, blas_environment, available_cpus
+
+
+MODEL_MODULE = """import numpy
+
+
+class MatmulModel(object):
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def predict(self, input):
+        return numpy.tanh(numpy.asarray(input, dtype=self.first.dtype) @ self.first) @ self.second
+"""
+
+
+def write_model(directory, features):
+    with open(os.path.join(directory, "bench_model.py"), "w") as file:
+        file.write(MODEL_MODULE)
+    sys.path.insert(0, directory)
+    import bench_model
+
+    generator = numpy.random.default_rng(0)
+    model = bench_model.MatmulModel(generator.standard_normal((features, 2048)),
+                                    generator.standard_normal((2048, 1)))
+    with open(os.path.join(directory, "model.pkl"), "wb") as file:
+        pickle.dump(model, file)
+    with open(os.path.join(directory, "metadata.json"), "w") as file:
+        json.dump({"input_dtype": "float64", "input_columns": features}, file)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(layout, directory, port):
+    environment = dict(os.environ, MODEL_SERVER_PROFILE="sync",
+                       MODEL_SERVER_MODEL_PATH=os.path.join(directory, "model.pkl"),
+                       MODEL_SERVER_METADATA_PATH=os.path.join(directory, "metadata.json"),
+                       PYTHONPATH=directory,
+                       PATH=os.pathsep.join([os.path.dirname(sys.executable), os.environ.get("PATH", "")]))
+    if layout == "default":
+        environment.update(MODEL_SERVER_BLAS_THREADS="0", MODEL_SERVER_CPU_AFFINITY="0")
+    else:
+        environment["MODEL_SERVER_CPU_LAYOUT"] = layout
+    settings = serving_settings(environment, len(available_cpus()))
+
+    server = subprocess.Popen(serve.gunicorn_command(settings, bind="127.0.0.1:{}".format(port)),
+                              cwd=TEMPLATE, env=blas_environment(settings, environment),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/ping")
+            if connection.getresponse().status == 200:
+                return server, settings
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("the server of layout {} did not start".format(layout))
+
+
+def load(port, body, concurrency, requests):
+    """Latencies of requests POSTed by concurrency clients, in seconds."""
+    latencies = []
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            connection.request("POST", "/invocations", body=body, headers={"Content-Type": "text/csv"})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError("/invocations answered {}".format(response.status))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            if response.will_close:
+                connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--layouts", nargs="+",
+                        default=["default", "{}x1".format(cpus)] + (["{}x2".format(cpus // 2)] if cpus >= 2 else []))
+    parser.add_argument("--concurrency", type=int, default=4 * cpus)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=64)
+    parser.add_argument("--features", type=int, default=512)
+    arguments = parser.parse_args()
+
+    rows = numpy.random.default_rng(1).random((arguments.rows, arguments.features)).round(6)
+    body = "".join(",".join(map(str, row)) + "\n" for row in rows.tolist()).encode("utf-8")
+    print("{} CPUs, {} concurrent clients, {} requests of {} rows x {} features".format(
+        cpus, arguments.concurrency, arguments.requests, arguments.rows, arguments.features))
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_model(directory, arguments.features)
+        for layout in arguments.layouts:
+            port = free_port()
+            server, settings = start_server(layout, directory, port)
+            try:
+                load(port, body, arguments.concurrency, 2 * settings["workers"])
+                start = time.perf_counter()
+                latencies = numpy.array(load(port, body, arguments.concurrency, arguments.requests)) * 1000
+                seconds = time.perf_counter() - start
+            finally:
+                server.terminate()
+                server.wait()
+            print("{:>8}: {} workers x {} BLAS threads{}: p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms, "
+                  "{:.0f} requests/s".format(layout, settings["workers"], settings["blas_threads"] or "default",
+                                             ", pinned" if settings["cpu_affinity"] else "",
+                                             numpy.percentile(latencies, 50), numpy.percentile(latencies, 99),
+                                             latencies.max(), len(latencies) / seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+# Puts the serving code of the container template on the path, as it is laid out in the image.
+
+import sys
+import os
+# no __pycache__ in the template, which would be copied into the containers
+sys.dont_write_bytecode = True
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'valohai_sagemaker',
+                                                'resources', 'container-template', 'model')))
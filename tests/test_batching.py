@@ -0,0 +1,103 @@
+from unittest import TestCase, skipUnless
+from . import serving_context
+import importlib.util
+import threading
+
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+if HAS_NUMPY:
+    import numpy
+    from batching import MicroBatcher, Histogram
+
+
+def predict_concurrently(batcher, inputs):
+    """The results of batcher.predict for inputs, called at the same time from a thread each."""
+    results = [None] * len(inputs)
+
+    def call(index):
+        try:
+            results[index] = batcher.predict(inputs[index])
+        except Exception as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class MicroBatcherTest(TestCase):
+
+
+    def setUp(self):
+        self.calls = []
+
+
+    def predict(self, input):
+        self.calls.append(len(input))
+        return input[:, 0] * 10
+
+
+    def test_concurrent_inputs_are_predicted_together_and_sliced_back(self):
+        batcher = MicroBatcher(self.predict, max_rows=1000, window=1.0)
+        inputs = [numpy.full((rows, 2), rows, dtype=float) for rows in [1, 2, 3, 4]]
+
+        results = predict_concurrently(batcher, inputs)
+
+        self.assertEqual([10], self.calls)
+        for input, result in zip(inputs, results):
+            numpy.testing.assert_array_equal(input[:, 0] * 10, result)
+        self.assertEqual(1, batcher.stats()["requests"]["count"])
+        self.assertEqual(4, batcher.stats()["requests"]["mean"])
+        self.assertEqual(10, batcher.stats()["rows"]["mean"])
+
+
+    def test_full_batch_is_predicted_before_the_window_ends(self):
+        batcher = MicroBatcher(self.predict, max_rows=3, window=60.0)
+
+        results = predict_concurrently(batcher, [numpy.ones((2, 2)), numpy.ones((1, 2)) * 2])
+
+        self.assertEqual([3], self.calls)
+        numpy.testing.assert_array_equal([10, 10], results[0])
+        numpy.testing.assert_array_equal([20], results[1])
+
+
+    def test_inputs_of_other_layouts_are_not_batched_together(self):
+        batcher = MicroBatcher(self.predict, max_rows=1000, window=0.2)
+
+        results = predict_concurrently(batcher, [numpy.ones((2, 2)), numpy.ones((2, 3)), numpy.ones((1, 2), dtype=int)])
+
+        self.assertEqual([1, 2, 2], sorted(self.calls))
+        self.assertEqual([2, 2, 1], [len(result) for result in results])
+
+
+    def test_errors_are_raised_to_every_request_of_the_batch(self):
+        batcher = MicroBatcher(lambda input: input[:-1, 0], max_rows=1000, window=1.0)
+
+        results = predict_concurrently(batcher, [numpy.ones((2, 2)), numpy.ones((3, 2))])
+
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
+
+
+    def test_single_request_is_predicted_as_is(self):
+        batcher = MicroBatcher(lambda input: "prediction", window=0)
+
+        self.assertEqual("prediction", batcher.predict(numpy.ones((2, 2))))
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class HistogramTest(TestCase):
+
+
+    def test_values_are_counted_in_power_of_two_buckets(self):
+        histogram = Histogram()
+        for value in [1, 2, 3, 4, 5, 9]:
+            histogram.add(value)
+
+        self.assertEqual({"count": 6, "mean": 4.0, "buckets": {"<=1": 1, "<=2": 1, "<=4": 2, "<=8": 1, "<=16": 1}},
+                         histogram.as_dict())
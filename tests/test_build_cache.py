@@ -0,0 +1,37 @@
+from unittest import TestCase
+from valohai_sagemaker.build_cache import BuildCache
+import os
+import tempfile
+
+
+class BuildCacheTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.json")
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_is_up_to_date_is_false_without_cache_file(self):
+        self.assertFalse(BuildCache(self.path).is_up_to_date("name:tag", "DIGEST"))
+
+
+    def test_stored_digest_is_up_to_date_across_instances(self):
+        BuildCache(self.path).store("name:tag", "DIGEST")
+
+        cache = BuildCache(self.path)
+
+        self.assertTrue(cache.is_up_to_date("name:tag", "DIGEST"))
+        self.assertFalse(cache.is_up_to_date("name:tag", "OTHER_DIGEST"))
+        self.assertFalse(cache.is_up_to_date("name:other", "DIGEST"))
+
+
+    def test_invalidate_forgets_digest(self):
+        BuildCache(self.path).store("name:tag", "DIGEST")
+        BuildCache(self.path).invalidate("name:tag")
+
+        self.assertFalse(BuildCache(self.path).is_up_to_date("name:tag", "DIGEST"))
@@ -0,0 +1,109 @@
+from unittest import TestCase, mock
+from valohai_sagemaker import build_plan
+import os
+
+
+PREAMBLE = [
+    "FROM ubuntu:16.04\n",
+    "RUN apt-get install -y \\\n",
+    "        python3.6\n",
+    "RUN pip3.6 install flask\n"
+]
+
+
+class BuildPlanTest(TestCase):
+
+
+    def create_image(self, name, lines):
+        image = mock.MagicMock()
+        image.tagged_name = "{}:latest".format(name)
+        image.code_container.path = "{}.container".format(name)
+        image.dockerfile_lines = mock.MagicMock(return_value=list(lines))
+        image.build_async = mock.AsyncMock()
+        return image
+
+
+    def create_plan(self, *images):
+        path_delegate = mock.MagicMock()
+        path_delegate.join = os.path.join
+        path_delegate.current_directory = mock.MagicMock(return_value=".")
+        return path_delegate, build_plan.BuildPlan(images, path_delegate=path_delegate)
+
+
+    def test_images_with_same_tagged_name_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.create_plan(self.create_image("a", PREAMBLE), self.create_image("a", PREAMBLE))
+
+
+    def test_shared_lines_stop_at_first_difference(self):
+        _, plan = self.create_plan(
+            self.create_image("a", PREAMBLE + ["RUN a\n"]),
+            self.create_image("b", PREAMBLE + ["RUN b\n"]))
+
+        self.assertEqual(PREAMBLE, plan.shared_lines())
+
+
+    def test_shared_lines_stop_before_context_dependent_instructions(self):
+        lines = PREAMBLE + ["COPY requirements.txt /opt/requirements.txt\n", "RUN a\n"]
+        _, plan = self.create_plan(self.create_image("a", lines), self.create_image("b", lines))
+
+        self.assertEqual(PREAMBLE, plan.shared_lines())
+
+
+    def test_shared_lines_never_end_in_the_middle_of_an_instruction(self):
+        _, plan = self.create_plan(
+            self.create_image("a", PREAMBLE[:2] + ["        python3.6\n"]),
+            self.create_image("b", PREAMBLE[:2] + ["        python3.5\n"]))
+
+        self.assertEqual(PREAMBLE[:1], plan.shared_lines())
+
+
+    def test_shared_lines_are_empty_for_a_single_image(self):
+        _, plan = self.create_plan(self.create_image("a", PREAMBLE))
+
+        self.assertEqual([], plan.shared_lines())
+
+
+    def test_base_tag_depends_on_shared_lines(self):
+        _, plan = self.create_plan()
+
+        self.assertEqual(plan.base_tag(PREAMBLE), plan.base_tag(list(PREAMBLE)))
+        self.assertNotEqual(plan.base_tag(PREAMBLE), plan.base_tag(PREAMBLE[:1]))
+
+
+    @mock.patch.object(build_plan, "AsyncCommandRunner")
+    def test_build_builds_base_then_images_on_top_of_it(self, runner_class):
+        runner_class.return_value.run = mock.AsyncMock(return_value=0)
+        images = [self.create_image("a", PREAMBLE + ["RUN a\n"]),
+                  self.create_image("b", PREAMBLE + ["RUN b\n"])]
+        path_delegate, plan = self.create_plan(*images)
+
+        report = plan.build(verbose=False)
+
+        base_tag = plan.base_tag(PREAMBLE)
+        path_delegate.write_file.assert_called_with("./valohai-sagemaker-base.base/Dockerfile",
+                                                    "".join(PREAMBLE))
+        runner_class.return_value.run.assert_called_with(
+            ["docker", "build", "-t", base_tag, "./valohai-sagemaker-base.base"], verbose=False)
+        for image in images:
+            self.assertEqual((base_tag, len(PREAMBLE)), image.base_image)
+            image.build_async.assert_called_with(verbose=False)
+        self.assertEqual(["a:latest", "b:latest"], list(report.image_seconds.keys()))
+
+
+    @mock.patch.object(build_plan, "AsyncCommandRunner")
+    def test_build_raises_when_base_build_fails(self, runner_class):
+        runner_class.return_value.run = mock.AsyncMock(return_value=1)
+        images = [self.create_image("a", PREAMBLE), self.create_image("b", PREAMBLE)]
+        _, plan = self.create_plan(*images)
+
+        with self.assertRaises(RuntimeError):
+            plan.build(verbose=False)
+
+        images[0].build_async.assert_not_called()
+
+
+    def test_report_estimates_sequential_time_with_base_rebuilt_for_every_image(self):
+        report = build_plan.BuildPlanReport(10.0, {"a": 1.0, "b": 2.0}, 13.0)
+
+        self.assertEqual(23.0, report.estimated_sequential_seconds)
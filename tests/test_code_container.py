@@ -1,6 +1,14 @@
 from unittest import TestCase, mock
 from valohai_sagemaker import code_container, template
+from valohai_sagemaker.file_transformer import FileTransformer, TransformationAwarePathDelegate
+from valohai_sagemaker.transformation_cache import TransformationCache
+from valohai_sagemaker.manifest import PackageManifest
+from valohai_sagemaker.path import PathDelegate
+import io
 import os
+import shutil
+import tarfile
+import tempfile
 
 
 class CodeContainerTest(TestCase):
@@ -18,6 +26,7 @@ class CodeContainerTest(TestCase):
         path_delegate.join = os.path.join
         path_delegate.basename = os.path.basename
         path_delegate.exists = mock.MagicMock(return_value=True)
+        path_delegate.is_directory = mock.MagicMock(return_value=False)
         path_delegate.copy = mock.MagicMock()
         path_delegate.remove = mock.MagicMock()
         path_delegate.write_file = mock.MagicMock()
@@ -54,7 +63,7 @@ class CodeContainerTest(TestCase):
         image.package()
 
         path_delegate.copy.assert_has_calls([
-            mock.call(template.container_template_path(), self.PATH),
+            mock.call(template.container_template_path(), self.PATH, ignored=template.CONTAINER_TEMPLATE_IGNORED),
             mock.call(self.FILES_TO_COPY[0], "PATH/model/user/{}".format(self.FILES_TO_COPY[0])),
             mock.call(self.FILES_TO_COPY[1], "PATH/model/user/{}".format(self.FILES_TO_COPY[1]))
         ])
@@ -105,3 +114,329 @@ class CodeContainerTest(TestCase):
             mock.call(self.FILES_TO_COPY[0], "PATH/model/user/{}".format(self.FILES_TO_COPY[0])),
             mock.call(self.FILES_TO_COPY[1], "PATH/model/user/{}".format("new_name"))
         ])
+
+
+    def test_copy_files_to_container_does_not_copy_transformed_files(self):
+        path_delegate, image = self.create_image()
+        path_delegate.transform_files = mock.MagicMock(
+            return_value={"PATH/model/user/{}".format(self.FILES_TO_COPY[0])})
+
+        image.copy_files_to_container()
+
+        path_delegate.copy.assert_called_once_with(
+            self.FILES_TO_COPY[1], "PATH/model/user/{}".format(self.FILES_TO_COPY[1]))
+
+
+class UppercaseTransformer(FileTransformer):
+
+
+    @property
+    def transforming(self):
+        return ".txt", ".dat"
+
+
+    def transform(self, input_filename, output_filename):
+        with open(input_filename, "rb") as input_file, open(output_filename, "wb") as output_file:
+            output_file.write(input_file.read().upper())
+
+
+class IncrementalCodeContainerTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source")
+        os.mkdir(self.source)
+        for filename in ["train.py", "data.csv"]:
+            with open(os.path.join(self.source, filename), "w") as file:
+                file.write(filename)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def create_container(self, **kwargs):
+        path_delegate = PathDelegate()
+        path_delegate.copy = mock.MagicMock(side_effect=path_delegate.copy)
+
+        container = code_container.CodeContainer(
+            name="NAME",
+            path=os.path.join(self.directory.name, "NAME.container"),
+            files_to_copy=[self.source],
+            incremental=True,
+            path_delegate=path_delegate,
+            **kwargs
+        )
+
+        return path_delegate, container
+
+
+    def user_file(self, container, filename):
+        return os.path.join(container.path, "model", "user", "source", filename)
+
+
+    def test_incremental_package_copies_template_and_files_to_copy(self):
+        _, container = self.create_container()
+
+        container.package()
+
+        self.assertTrue(os.path.exists(os.path.join(container.path, "build.sh")))
+        self.assertTrue(os.path.exists(self.user_file(container, "train.py")))
+        self.assertTrue(os.path.exists(os.path.join(container.path, PackageManifest.FILENAME)))
+
+
+    def test_incremental_package_does_not_copy_unchanged_files_again(self):
+        path_delegate, container = self.create_container()
+        container.package()
+        path_delegate.copy.reset_mock()
+
+        container.package()
+
+        copied = [call[0][0] for call in path_delegate.copy.call_args_list]
+        self.assertNotIn(os.path.join(self.source, "train.py"), copied)
+        self.assertNotIn(os.path.join(self.source, "data.csv"), copied)
+
+
+    def test_incremental_package_copies_nothing_for_unchanged_container(self):
+        _, container = self.create_container()
+        container.package()
+
+        container.package()
+
+        self.assertEqual(0, container.copy_report.files)
+        with open(os.path.join(container.path, "model", "working_directory.txt")) as file:
+            self.assertEqual(container.working_dir, file.read())
+
+
+    def test_incremental_package_copies_modified_files(self):
+        path_delegate, container = self.create_container()
+        container.package()
+        path_delegate.copy.reset_mock()
+
+        with open(os.path.join(self.source, "train.py"), "w") as file:
+            file.write("modified content")
+        container.package()
+
+        path_delegate.copy.assert_any_call(os.path.join(self.source, "train.py"),
+                                           self.user_file(container, "train.py"))
+        with open(self.user_file(container, "train.py")) as file:
+            self.assertEqual("modified content", file.read())
+
+
+    def test_incremental_package_deletes_stale_files(self):
+        _, container = self.create_container()
+        container.package()
+
+        os.remove(os.path.join(self.source, "data.csv"))
+        container.package()
+
+        self.assertFalse(os.path.exists(self.user_file(container, "data.csv")))
+        self.assertTrue(os.path.exists(self.user_file(container, "train.py")))
+
+
+    def test_incremental_package_with_hashing_skips_touched_but_identical_files(self):
+        path_delegate, container = self.create_container(hash_contents=True)
+        container.package()
+        path_delegate.copy.reset_mock()
+
+        stat = os.stat(os.path.join(self.source, "train.py"))
+        os.utime(os.path.join(self.source, "train.py"),
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        container.package()
+
+        copied = [call[0][0] for call in path_delegate.copy.call_args_list]
+        self.assertNotIn(os.path.join(self.source, "train.py"), copied)
+
+
+    def test_content_digest_only_changes_with_container_content(self):
+        _, container = self.create_container()
+        container.package()
+        digest = container.content_digest()
+
+        container.package()
+        with open(os.path.join(container.path, "Dockerfile"), "w") as file:
+            file.write("FROM scratch")
+        self.assertEqual(digest, container.content_digest())
+
+        with open(os.path.join(self.source, "train.py"), "w") as file:
+            file.write("modified content")
+        container.package()
+        self.assertNotEqual(digest, container.content_digest())
+
+
+    def test_incremental_package_keeps_hardlinked_source_rewritten_in_place(self):
+        path = os.path.join(self.source, "data.csv")
+        with open(path, "wb") as file:
+            file.write(os.urandom(2 * 1024 * 1024))
+        _, container = self.create_container(link_mode="hardlink")
+        container.package()
+
+        with open(path, "r+b") as file:
+            file.truncate(1000)
+        container.package()
+
+        self.assertEqual(1000, os.stat(path).st_size)
+        self.assertEqual(1000, os.stat(self.user_file(container, "data.csv")).st_size)
+
+
+    def test_bad_link_mode_raises(self):
+        with self.assertRaises(ValueError):
+            self.create_container(link_mode="hardlinks")
+
+
+    def test_content_digest_is_stable_for_big_transformed_files(self):
+        source = os.path.join(self.directory.name, "big.txt")
+        with open(source, "w") as file:
+            file.write("x" * 2 * code_container.CONTENT_DIGEST_MAX_SIZE)
+
+        for cache in [None, TransformationCache(os.path.join(self.directory.name, "cache"))]:
+            container = code_container.CodeContainer(
+                name="NAME", path=os.path.join(self.directory.name, "NAME.container"),
+                files_to_copy=[{source: "big.dat"}],
+                path_delegate=TransformationAwarePathDelegate([UppercaseTransformer()], cache=cache))
+            container.package()
+            digest = container.content_digest()
+            os.utime(os.path.join(container.path, "model", "user", "big.dat"), (0, 0))
+
+            container.package()
+
+            self.assertEqual(digest, container.content_digest())
+
+
+    def test_full_package_with_copy_workers_copies_every_file(self):
+        _, container = self.create_container(copy_workers=4)
+        container.incremental = False
+
+        container.package()
+
+        self.assertTrue(os.path.exists(os.path.join(container.path, "build.sh")))
+        self.assertTrue(os.path.exists(self.user_file(container, "data.csv")))
+        self.assertGreater(container.copy_report.files, 2)
+
+
+    def test_write_context_tar_lays_out_container_like_package(self):
+        _, container = self.create_container()
+        container.train_script = "source/train.py"
+        stream = io.BytesIO()
+
+        container.write_context_tar(stream, {"Dockerfile": "FROM scratch\n"})
+
+        stream.seek(0)
+        with tarfile.open(fileobj=stream) as tar:
+            names = tar.getnames()
+            self.assertIn("build.sh", names)
+            self.assertIn("model/user/source/data.csv", names)
+            self.assertEqual(b"train.py", tar.extractfile("model/user/source/train.py").read())
+            self.assertEqual(b"source/train.py",
+                             tar.extractfile("model/train_script_location.txt").read())
+            self.assertEqual(b"FROM scratch\n", tar.extractfile("Dockerfile").read())
+            self.assertTrue(tar.getmember("model/train").mode & 0o100)
+        self.assertFalse(os.path.exists(container.path))
+
+
+    def test_write_context_tar_streams_transformed_files(self):
+        source = os.path.join(self.directory.name, "notes.txt")
+        with open(source, "w") as file:
+            file.write("notes")
+
+        for cache in [None, TransformationCache(os.path.join(self.directory.name, "cache"))]:
+            container = code_container.CodeContainer(
+                name="NAME", path=os.path.join(self.directory.name, "NAME.container"),
+                files_to_copy=[{source: "notes.dat"}],
+                path_delegate=TransformationAwarePathDelegate([UppercaseTransformer()], cache=cache))
+            stream = io.BytesIO()
+
+            container.write_context_tar(stream)
+
+            stream.seek(0)
+            with tarfile.open(fileobj=stream) as tar:
+                self.assertEqual(b"NOTES", tar.extractfile("model/user/notes.dat").read())
+
+
+    def test_write_context_tar_archives_linked_files_as_regular_files(self):
+        target = os.path.join(self.directory.name, "outside.csv")
+        with open(target, "w") as file:
+            file.write("linked content")
+        os.symlink(target, os.path.join(self.source, "linked.csv"))
+        os.mkdir(os.path.join(self.directory.name, "outside"))
+        os.symlink(target, os.path.join(self.directory.name, "outside", "nested.csv"))
+        os.symlink(os.path.join(self.directory.name, "outside"), os.path.join(self.source, "linked"))
+        _, container = self.create_container()
+        stream = io.BytesIO()
+
+        container.write_context_tar(stream, {"Dockerfile": "FROM scratch\n"})
+
+        stream.seek(0)
+        with tarfile.open(fileobj=stream) as tar:
+            self.assertTrue(tar.getmember("model/user/source/linked.csv").isfile())
+            self.assertEqual(b"linked content", tar.extractfile("model/user/source/linked.csv").read())
+            self.assertTrue(tar.getmember("model/user/source/linked/nested.csv").isfile())
+
+
+    def test_source_digest_changes_with_sources_and_config(self):
+        _, container = self.create_container()
+        digest = container.source_digest()
+
+        self.assertEqual(digest, container.source_digest())
+        container.working_dir = "other"
+        self.assertNotEqual(digest, container.source_digest())
+        container.working_dir = ""
+        with open(os.path.join(self.source, "train.py"), "w") as file:
+            file.write("modified content")
+        self.assertNotEqual(digest, container.source_digest())
+
+
+    def write_ignored_files(self):
+        os.makedirs(os.path.join(self.source, "__pycache__"))
+        with open(os.path.join(self.source, "__pycache__", "train.pyc"), "w") as file:
+            file.write("bytecode")
+        with open(os.path.join(self.source, "checkpoint.ckpt"), "w") as file:
+            file.write("x" * 100)
+        with open(os.path.join(self.source, ".containerignore"), "w") as file:
+            file.write("# checkpoints\n*.ckpt\n")
+
+
+    def test_package_skips_ignored_files_and_directories(self):
+        self.write_ignored_files()
+        path_delegate, container = self.create_container(ignore_patterns=["__pycache__/"])
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            container.package()
+
+        self.assertFalse(os.path.exists(self.user_file(container, "checkpoint.ckpt")))
+        self.assertFalse(os.path.exists(self.user_file(container, "__pycache__")))
+        self.assertTrue(os.path.exists(self.user_file(container, "train.py")))
+        self.assertEqual(100, container.ignored_size())
+        self.assertIn("ignored 100 bytes in 1 file(s), and 1 directory(ies)", stdout.getvalue())
+
+
+    def test_package_leaves_out_byte_code_of_the_template(self):
+        template_path = os.path.join(self.directory.name, "template")
+        shutil.copytree(template.container_template_path(), template_path)
+        os.mkdir(os.path.join(template_path, "model", "__pycache__"))
+        with open(os.path.join(template_path, "model", "__pycache__", "serve.cpython-36.pyc"), "wb") as file:
+            file.write(b"\0" * 100)
+
+        for incremental in (True, False):
+            _, container = self.create_container()
+            container.incremental = incremental
+            with mock.patch("valohai_sagemaker.code_container.container_template_path", return_value=template_path):
+                container.package()
+
+            self.assertTrue(os.path.exists(os.path.join(container.path, "model", "serve")))
+            self.assertFalse(os.path.exists(os.path.join(container.path, "model", "__pycache__")))
+            self.assertEqual([], container.ignored)
+
+
+    def test_full_package_skips_ignored_files(self):
+        self.write_ignored_files()
+        _, container = self.create_container(ignore_patterns=["__pycache__/"])
+        container.incremental = False
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO):
+            container.package()
+
+        self.assertFalse(os.path.exists(self.user_file(container, "checkpoint.ckpt")))
+        self.assertFalse(os.path.exists(self.user_file(container, "__pycache__")))
+        self.assertTrue(os.path.exists(self.user_file(container, "data.csv")))
@@ -0,0 +1,44 @@
+from unittest import TestCase
+from valohai_sagemaker.concurrency import gather_limited
+import asyncio
+
+
+class GatherLimitedTest(TestCase):
+
+
+    def run_jobs(self, count, concurrency):
+        running = [0]
+        peak = [0]
+
+        async def job(index):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return index
+
+        results = asyncio.run(gather_limited([job(i) for i in range(count)], concurrency=concurrency))
+        return results, peak[0]
+
+
+    def test_results_are_in_order(self):
+        results, _ = self.run_jobs(5, 2)
+
+        self.assertEqual([0, 1, 2, 3, 4], results)
+
+
+    def test_at_most_concurrency_jobs_run_at_once(self):
+        _, peak = self.run_jobs(6, 2)
+
+        self.assertEqual(2, peak)
+
+
+    def test_no_limit_runs_everything_at_once(self):
+        _, peak = self.run_jobs(6, None)
+
+        self.assertEqual(6, peak)
+
+
+    def test_invalid_concurrency_raises(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(gather_limited([], concurrency=0))
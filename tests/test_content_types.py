@@ -0,0 +1,316 @@
+from unittest import TestCase, mock, skipUnless
+from . import serving_context
+import importlib.util
+import io
+import struct
+
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+HAS_PROTOBUF = HAS_NUMPY and importlib.util.find_spec("google") is not None \
+    and importlib.util.find_spec("google.protobuf") is not None
+HAS_PANDAS = HAS_NUMPY and importlib.util.find_spec("pandas") is not None
+HAS_ARROW = HAS_NUMPY and importlib.util.find_spec("pyarrow") is not None
+HAS_WERKZEUG = HAS_NUMPY and importlib.util.find_spec("werkzeug") is not None
+
+if HAS_NUMPY:
+    import numpy
+    import content_types as ct
+
+
+def record_class():
+    """
+    The aialgs.data.Record protobuf message of SageMaker's RecordIO-protobuf format,
+    built from its descriptor.
+    """
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+    field = descriptor_pb2.FieldDescriptorProto
+    file = descriptor_pb2.FileDescriptorProto(name="record.proto", package="aialgs.data", syntax="proto2")
+
+    for name, value_type in [("Float32Tensor", field.TYPE_FLOAT), ("Float64Tensor", field.TYPE_DOUBLE),
+                             ("Int32Tensor", field.TYPE_INT32)]:
+        tensor = file.message_type.add(name=name)
+        for field_name, number, field_type in [("values", 1, value_type), ("keys", 2, field.TYPE_UINT64),
+                                               ("shape", 3, field.TYPE_UINT64)]:
+            tensor.field.add(name=field_name, number=number, type=field_type,
+                             label=field.LABEL_REPEATED).options.packed = True
+
+    value = file.message_type.add(name="Value")
+    for field_name, number, type_name in [("float32_tensor", 2, "Float32Tensor"),
+                                          ("float64_tensor", 3, "Float64Tensor"),
+                                          ("int32_tensor", 7, "Int32Tensor")]:
+        value.field.add(name=field_name, number=number, type=field.TYPE_MESSAGE, label=field.LABEL_OPTIONAL,
+                        type_name=".aialgs.data." + type_name)
+
+    record = file.message_type.add(name="Record")
+    for field_name, number, entry_name in [("features", 1, "FeaturesEntry"), ("label", 2, "LabelEntry")]:
+        entry = record.nested_type.add(name=entry_name)
+        entry.field.add(name="key", number=1, type=field.TYPE_STRING, label=field.LABEL_OPTIONAL)
+        entry.field.add(name="value", number=2, type=field.TYPE_MESSAGE, label=field.LABEL_OPTIONAL,
+                        type_name=".aialgs.data.Value")
+        entry.options.map_entry = True
+        record.field.add(name=field_name, number=number, type=field.TYPE_MESSAGE, label=field.LABEL_REPEATED,
+                         type_name=".aialgs.data.Record." + entry_name)
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName("aialgs.data.Record"))
+
+
+def frame(payload):
+    return struct.pack("<II", ct.RECORDIO_MAGIC, len(payload)) + payload + b"\0" * (-len(payload) % 4)
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class NPYTest(TestCase):
+
+
+    def test_npy_round_trip(self):
+        values = numpy.arange(6, dtype="<f4").reshape(3, 2)
+
+        decoded = ct.decode_npy(ct.encode_npy(values), {})
+
+        numpy.testing.assert_array_equal(values, decoded)
+        self.assertEqual(values.dtype, decoded.dtype)
+
+
+    def test_decode_npy_rejects_truncated_body(self):
+        with self.assertRaises(ValueError):
+            ct.decode_npy(ct.encode_npy(numpy.arange(10.0))[:-8], {})
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class RecordIOProtobufTest(TestCase):
+
+
+    def test_varint_round_trip(self):
+        for value in [0, 1, 127, 128, 300, 2 ** 35]:
+            encoded = ct.write_varint(value)
+
+            self.assertEqual((value, len(encoded)), ct.read_varint(encoded, 0))
+
+
+    def test_decode_rejects_bad_magic_and_truncated_records(self):
+        body = ct.encode_recordio_protobuf(numpy.array([1.0]))
+
+        with self.assertRaises(ValueError):
+            ct.decode_recordio_protobuf(b"\0" * 4 + body[4:], {})
+        with self.assertRaises(ValueError):
+            ct.decode_recordio_protobuf(body[:-8], {})
+
+
+    def test_encoded_records_decode_to_one_row_per_prediction(self):
+        body = ct.encode_recordio_protobuf(numpy.array([[1.0, 2.0], [3.0, 4.0]]))
+
+        # the encoder labels the predictions "score", the decoder reads "values" features
+        records = list(ct.recordio_records(body))
+        self.assertEqual(2, len(records))
+        entry = dict(ct.protobuf_fields(records[0]))[2]
+        self.assertEqual(b"score", bytes(dict(ct.protobuf_fields(entry))[1]))
+
+
+    @skipUnless(HAS_PROTOBUF, "protobuf is not installed")
+    def test_decode_reads_records_written_by_protobuf(self):
+        Record = record_class()
+        dense = Record()
+        dense.features["values"].float32_tensor.values.extend([1.5, 2.5, 3.0])
+        sparse = Record()
+        tensor = sparse.features["values"].float32_tensor
+        tensor.values.extend([7.0])
+        tensor.keys.extend([1])
+        tensor.shape.extend([3])
+
+        decoded = ct.decode_recordio_protobuf(frame(dense.SerializeToString()) +
+                                              frame(sparse.SerializeToString()), {})
+
+        numpy.testing.assert_array_equal([[1.5, 2.5, 3.0], [0.0, 7.0, 0.0]], decoded)
+
+
+    @skipUnless(HAS_PROTOBUF, "protobuf is not installed")
+    def test_decode_reads_integer_and_double_tensors_ignoring_labels(self):
+        Record = record_class()
+        integers = Record()
+        integers.features["values"].int32_tensor.values.extend([-5, 3, 2 ** 31 - 1])
+        integers.label["x"].float64_tensor.values.append(1)
+        doubles = Record()
+        doubles.features["values"].float64_tensor.values.extend([0.1, 0.2])
+
+        numpy.testing.assert_array_equal([[-5, 3, 2 ** 31 - 1]],
+                                         ct.decode_recordio_protobuf(frame(integers.SerializeToString()), {}))
+        numpy.testing.assert_array_equal([[0.1, 0.2]],
+                                         ct.decode_recordio_protobuf(frame(doubles.SerializeToString()), {}))
+
+
+    @skipUnless(HAS_PROTOBUF, "protobuf is not installed")
+    def test_encoded_records_are_read_by_protobuf(self):
+        Record = record_class()
+
+        body = ct.encode_recordio_protobuf(numpy.array([0.5, 2.0]))
+
+        scores = []
+        for record in ct.recordio_records(body):
+            scores.append(list(Record.FromString(bytes(record)).label["score"].float32_tensor.values))
+        self.assertEqual([[0.5], [2.0]], scores)
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class CSVBlocksTest(TestCase):
+
+
+    def test_blocks_end_at_line_ends(self):
+        body = b"".join("{},{}\n".format(row, row * 2).encode() for row in range(100))
+
+        blocks = list(ct.csv_blocks(io.BytesIO(body), 64))
+
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(body, b"".join(blocks))
+        for block in blocks:
+            self.assertTrue(block.endswith(b"\n"))
+            ct.decode_csv(block, {})
+
+
+    def test_lines_longer_than_blocks_are_kept_whole(self):
+        body = b"1," * 50 + b"1\n2,3\n"
+
+        self.assertEqual([b"1," * 50 + b"1\n", b"2,3\n"], list(ct.csv_blocks(io.BytesIO(body), 8)))
+
+
+    def test_last_line_without_line_end_is_yielded(self):
+        self.assertEqual([b"1,2\r\n", b"3,4"], list(ct.csv_blocks(io.BytesIO(b"1,2\r\n3,4"), 5)))
+
+
+    def test_trailing_line_ends_and_empty_bodies_yield_no_empty_block(self):
+        self.assertEqual([b"1,2\r\n"], list(ct.csv_blocks(io.BytesIO(b"1,2\r\n"), 4)))
+        self.assertEqual([], list(ct.csv_blocks(io.BytesIO(b""), 4)))
+
+
+@skipUnless(HAS_ARROW, "numpy or pyarrow is not installed")
+class ArrowTest(TestCase):
+
+
+    def test_arrow_round_trip(self):
+        body = ct.encode_arrow(numpy.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]))
+
+        frame = ct.decode_arrow(body, {})
+
+        self.assertEqual(["results_0", "results_1"], list(frame.columns))
+        numpy.testing.assert_array_equal([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]], frame.values)
+        numpy.testing.assert_array_equal([1.5, 2.5], ct.decode_arrow(ct.encode_arrow([1.5, 2.5]), {})["results"])
+
+
+    def test_decode_arrow_reads_numeric_columns_in_place(self):
+        body = ct.encode_arrow(numpy.array([[1.0, 2.0], [3.0, 4.0]]))
+
+        frame = ct.decode_arrow(body, {})
+
+        for column in frame.columns:
+            self.assertTrue(numpy.shares_memory(frame[column].to_numpy(), numpy.frombuffer(body, dtype=numpy.uint8)))
+
+
+    def test_decode_arrow_rejects_malformed_bodies(self):
+        with self.assertRaises(ValueError):
+            ct.decode_arrow(b"not arrow", {})
+
+
+@skipUnless(HAS_WERKZEUG, "numpy or werkzeug is not installed")
+class ResponseContentTypeTest(TestCase):
+
+
+    def accept(self, *values):
+        from werkzeug.datastructures import MIMEAccept
+        return MIMEAccept(values)
+
+
+    def test_request_content_type_without_accept(self):
+        self.assertEqual("application/x-npy", ct.response_content_type("application/x-npy", self.accept()))
+        self.assertEqual("application/x-npy",
+                         ct.response_content_type("application/x-npy", self.accept(("*/*", 1))))
+
+
+    def test_csv_without_accept_for_content_types_without_encoder(self):
+        self.assertEqual("text/csv", ct.response_content_type("application/json", self.accept()))
+
+
+    def test_best_accepted_content_type(self):
+        accept = self.accept(("text/csv", 0.5), ("application/x-recordio-protobuf", 1))
+
+        self.assertEqual("application/x-recordio-protobuf", ct.response_content_type("text/csv", accept))
+
+
+    def test_request_content_type_is_preferred_among_accepted_ones(self):
+        accept = self.accept(("application/*", 1))
+
+        self.assertEqual("application/vnd.apache.arrow.stream",
+                         ct.response_content_type("application/vnd.apache.arrow.stream", accept))
+
+
+    def test_nothing_acceptable(self):
+        # answered with a 406 by the prediction server
+        self.assertIsNone(ct.response_content_type("text/csv", self.accept(("application/json", 1))))
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class CSVTest(TestCase):
+
+    METADATA = {"input_dtype": "float32", "input_columns": 3}
+
+
+    def test_decode_with_metadata_parses_numpy_arrays(self):
+        for fast_loadtxt in (True, False):
+            with mock.patch("content_types.FAST_LOADTXT", fast_loadtxt):
+                values = ct.decode_csv(b"1,2,3\n4.5,5,-6\n", self.METADATA)
+
+            self.assertIsInstance(values, numpy.ndarray)
+            self.assertEqual(numpy.float32, values.dtype)
+            numpy.testing.assert_array_equal([[1, 2, 3], [4.5, 5, -6]], values)
+
+
+    @skipUnless(HAS_PANDAS, "pandas is not installed")
+    def test_decode_without_metadata_reads_data_frames(self):
+        frame = ct.decode_csv(b"1,2,3\n4.5,5,-6\n", {})
+
+        self.assertEqual((2, 3), frame.shape)
+        numpy.testing.assert_array_equal([[1, 2, 3], [4.5, 5, -6]], frame.values)
+
+
+    def test_parse_crlf_bodies(self):
+        for fast_loadtxt in (True, False):
+            with mock.patch("content_types.FAST_LOADTXT", fast_loadtxt):
+                values = ct.parse_csv(b"1,2,3\r\n4,5,6\r\n", "float64", 3)
+
+            numpy.testing.assert_array_equal([[1, 2, 3], [4, 5, 6]], values)
+
+
+    def test_parse_single_row(self):
+        numpy.testing.assert_array_equal([[1, 2, 3]], ct.parse_csv(b"1,2,3", "int64", 3))
+
+
+    def test_parse_rejects_other_column_counts(self):
+        for fast_loadtxt in (True, False):
+            with mock.patch("content_types.FAST_LOADTXT", fast_loadtxt):
+                for body in (b"1,2\n3,4\n", b"1,2,3,4\n", b"1,2,3\n4,5\n"):
+                    with self.assertRaises(ValueError, msg=body):
+                        ct.parse_csv(body, "float64", 3)
+
+
+    def test_parse_rejects_values_that_are_not_numbers(self):
+        with self.assertRaises(ValueError):
+            ct.parse_csv(b"1,two,3\n", "float64", 3)
+
+
+    def test_parse_empty_body(self):
+        for body in (b"", b"\r\n"):
+            values = ct.parse_csv(body, "float32", 3)
+
+            self.assertEqual((0, 3), values.shape)
+            self.assertEqual(numpy.float32, values.dtype)
+
+
+    def test_format_one_value_per_prediction(self):
+        self.assertEqual("1\n2\n", ct.format_csv(numpy.array([1, 2])))
+        self.assertEqual("0.5\n", ct.format_csv(0.5))
+        self.assertEqual("", ct.format_csv([]))
+
+
+    def test_format_rows_of_values(self):
+        self.assertEqual("1,2\n3,4\n", ct.format_csv([[1, 2], [3, 4]]))
@@ -0,0 +1,61 @@
+from unittest import TestCase, mock
+from valohai_sagemaker.copy_engine import CopyEngine, CopyReport
+from valohai_sagemaker.path import PathDelegate
+import os
+import tempfile
+
+
+class CopyEngineTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for index in range(8):
+            source = os.path.join(self.directory.name, "source", "file{}".format(index))
+            os.makedirs(os.path.dirname(source), exist_ok=True)
+            with open(source, "w") as file:
+                file.write("x" * (index + 1) * 1000)
+            destination = os.path.join(self.directory.name, "destination", str(index % 3),
+                                       "file{}".format(index))
+            self.files.append((source, destination))
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_copy_copies_every_file_with_its_metadata(self):
+        CopyEngine(workers=4).copy(self.files)
+
+        for source, destination in self.files:
+            with open(source) as source_file, open(destination) as destination_file:
+                self.assertEqual(source_file.read(), destination_file.read())
+            self.assertEqual(os.stat(source).st_mtime_ns, os.stat(destination).st_mtime_ns)
+
+
+    def test_copy_reports_copied_size(self):
+        report = CopyEngine(workers=4).copy(self.files)
+
+        self.assertEqual(8, report.files)
+        self.assertEqual(sum(range(1, 9)) * 1000, report.size)
+
+
+    def test_copy_goes_through_path_delegate(self):
+        path_delegate = PathDelegate()
+        path_delegate.copy = mock.MagicMock(side_effect=path_delegate.copy)
+
+        CopyEngine(workers=2, path_delegate=path_delegate).copy(self.files)
+
+        self.assertEqual(len(self.files), path_delegate.copy.call_count)
+
+
+    def test_copy_raises_copy_errors(self):
+        with self.assertRaises(FileNotFoundError):
+            CopyEngine(workers=2).copy([(os.path.join(self.directory.name, "missing"),
+                                         os.path.join(self.directory.name, "destination"))])
+
+
+    def test_report_bytes_per_second(self):
+        self.assertEqual(500.0, CopyReport(1, 1000, 2.0).bytes_per_second)
+        self.assertEqual(0.0, CopyReport(0, 0, 0.0).bytes_per_second)
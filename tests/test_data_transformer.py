@@ -0,0 +1,118 @@
+from unittest import TestCase, mock, skipUnless
+from valohai_sagemaker import data_transformer as dt
+import ast
+import importlib.util
+import os
+import struct
+import tempfile
+
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def parse_npy_header(content):
+    length, = struct.unpack("<H", content[8:10])
+    return 10 + length, ast.literal_eval(content[10:10 + length].decode("latin1"))
+
+
+class NPYHeaderTest(TestCase):
+
+
+    def test_header_is_aligned_on_64_bytes(self):
+        header = dt.npy_header("<f4", (3, 2))
+
+        self.assertEqual(0, len(header) % 64)
+        self.assertTrue(header.startswith(dt.NPY_MAGIC))
+        self.assertEqual((len(header), {"descr": "<f4", "fortran_order": False, "shape": (3, 2)}),
+                         parse_npy_header(header))
+
+
+    def test_header_is_padded_to_the_reserved_length(self):
+        reserved = len(dt.npy_header("<f8", (dt.NPY_MAX_ROWS, 10)))
+
+        header = dt.npy_header("<f8", (1, 10), length=reserved)
+
+        self.assertEqual(reserved, len(header))
+        self.assertEqual((1, 10), parse_npy_header(header)[1]["shape"])
+
+
+    def test_header_too_long_for_the_reserved_length_raises(self):
+        with self.assertRaises(ValueError):
+            dt.npy_header("<f8", (dt.NPY_MAX_ROWS, 10), length=64)
+
+
+class ImportOptionalTest(TestCase):
+
+
+    def test_missing_dependency_tells_what_to_install(self):
+        with mock.patch("importlib.import_module", side_effect=ImportError("missing")):
+            with self.assertRaisesRegex(ImportError, "pip install pyarrow"):
+                dt.import_optional("pyarrow.csv", "pyarrow")
+
+
+class DataTransformerTestCase(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "data.csv")
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def write_source(self, content):
+        with open(self.source, "w") as file:
+            file.write(content)
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class CSVToNPYTransformerTest(DataTransformerTestCase):
+
+
+    def transform(self, content, **kwargs):
+        import numpy
+        self.write_source(content)
+        destination = os.path.join(self.directory.name, "data.npy")
+        dt.CSVToNPYTransformer(**kwargs).transform(self.source, destination)
+        return numpy.load(destination, mmap_mode="r")
+
+
+    def test_rows_are_converted_across_chunks(self):
+        rows = ["{},{}".format(index, index / 2) for index in range(10)]
+
+        array = self.transform("a,b\n" + "\n".join(rows) + "\n", chunk_rows=3)
+
+        self.assertEqual((10, 2), array.shape)
+        self.assertEqual("float32", str(array.dtype))
+        self.assertEqual([9.0, 4.5], list(array[9]))
+
+
+    def test_dtype_and_headerless_files(self):
+        array = self.transform("1;2\n3;4\n", dtype="int64", delimiter=";", header=False)
+
+        self.assertEqual([[1, 2], [3, 4]], array.tolist())
+
+
+    def test_ragged_rows_raise(self):
+        with self.assertRaises(ValueError):
+            self.transform("a,b\n1,2\n3\n")
+
+
+@skipUnless(HAS_PYARROW, "pyarrow is not installed")
+class CSVToParquetTransformerTest(DataTransformerTestCase):
+
+
+    def test_columns_are_typed_and_kept_across_blocks(self):
+        import pyarrow.parquet
+        rows = ["{},name{}".format(index, index) for index in range(1000)]
+        self.write_source("id,name\n" + "\n".join(rows) + "\n")
+        destination = os.path.join(self.directory.name, "data.parquet")
+
+        dt.CSVToParquetTransformer(block_size=1024).transform(self.source, destination)
+
+        table = pyarrow.parquet.read_table(destination)
+        self.assertEqual(["id", "name"], table.column_names)
+        self.assertEqual(list(range(1000)), table.column("id").to_pylist())
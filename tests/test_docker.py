@@ -1,5 +1,7 @@
 from unittest import TestCase, mock
-from valohai_sagemaker import docker
+from valohai_sagemaker import docker, template
+from valohai_sagemaker.path import PathDelegate
+import asyncio
 import os
 
 
@@ -14,10 +16,12 @@ class ImageTest(TestCase):
     OUTPUT_DIR = "OUTPUT_DIR"
 
 
-    def create_image(self):
+    def create_image(self, cache_builds=False, stream_context=False, precompile=False, serving_profile=None):
         cmd_runner = mock.MagicMock()
         cmd_runner.run = mock.MagicMock(return_value=0)
         cmd_runner.reset = mock.MagicMock()
+        cmd_runner.stdout = ""
+        cmd_runner.stderr = ""
 
         path_delegate = mock.MagicMock()
         path_delegate.join = os.path.join
@@ -34,11 +38,18 @@ class ImageTest(TestCase):
         container.pip_packages = self.PIP_PACKAGES
         container.package = mock.MagicMock()
         container.copy_files_to_container = mock.MagicMock()
+        container.content_digest = mock.MagicMock(return_value="CONTENT_DIGEST")
+
+        build_cache = mock.MagicMock()
+        build_cache.is_up_to_date = mock.MagicMock(return_value=False)
 
         image = docker.Image(container,
                              froms=self.DOCKER_FROMS, build_commands=self.COMMANDS,
                              tag=self.TAG, output_dir=self.OUTPUT_DIR,
-                             path_delegate=path_delegate, command_runner=cmd_runner)
+                             cache_builds=cache_builds, stream_context=stream_context,
+                             precompile=precompile, serving_profile=serving_profile,
+                             path_delegate=path_delegate, command_runner=cmd_runner,
+                             build_cache=build_cache)
 
         return container, cmd_runner, path_delegate, image
 
@@ -66,12 +77,131 @@ class ImageTest(TestCase):
         for docker_from in self.DOCKER_FROMS:
             self.assertIn("FROM {}".format(docker_from), content)
 
-        self.assertIn("install {}".format(" ".join(self.PIP_PACKAGES)), content)
+        self.assertIn("COPY requirements.txt /opt/requirements.txt", content)
+        self.assertIn("install -r /opt/requirements.txt", content)
 
         for command in self.COMMANDS:
             self.assertIn("RUN {}".format(command), content)
 
 
+    def test_dockerfile_content_starts_from_base_image_when_set(self):
+        _, _, path_delegate, image = self.create_image()
+        path_delegate.read_file_lines = mock.MagicMock(return_value=[
+            "FROM ubuntu\n",
+            "RUN apt-get update\n",
+            "## FROM_TAG ##\n",
+            "## INSTALL_TAG ##\n",
+            "## COMMANDS_TAG ##\n"
+        ])
+        image.base_image = ("base:tag", 2)
+
+        content = image.dockerfile_content()
+
+        self.assertTrue(content.startswith("FROM base:tag\n## FROM_TAG ##\n"))
+        self.assertNotIn("apt-get", content)
+
+
+    def test_dockerfile_content_installs_requirements_before_commands(self):
+        _, _, path_delegate, image = self.create_image()
+        path_delegate.read_file_lines = mock.MagicMock(return_value=[
+            "## FROM_TAG ##\n",
+            "## INSTALL_TAG ##\n",
+            "## COMMANDS_TAG ##\n",
+            "COPY model /opt/program\n"
+        ])
+
+        content = image.dockerfile_content()
+
+        self.assertLess(content.index("requirements.txt"), content.index(self.COMMANDS[0]))
+        self.assertLess(content.index(self.COMMANDS[-1]), content.index("COPY model"))
+
+
+    def test_dockerfile_content_does_not_precompile_by_default(self):
+        _, _, path_delegate, image = self.create_image()
+        path_delegate.read_file_lines = PathDelegate().read_file_lines
+
+        self.assertNotIn("compileall", image.dockerfile_content())
+
+
+    def test_dockerfile_content_precompiles_code_after_copying_it(self):
+        _, _, path_delegate, image = self.create_image(precompile=True)
+        path_delegate.read_file_lines = PathDelegate().read_file_lines
+
+        content = image.dockerfile_content()
+
+        self.assertIn("RUN {}\n".format(docker.PRECOMPILE_COMMAND), content)
+        self.assertLess(content.index("COPY model /opt/program"), content.index("compileall"))
+        self.assertLess(content.index("compileall"), content.index("WORKDIR /opt/program"))
+
+
+    def test_dockerfile_content_sets_serving_profile_name(self):
+        _, _, path_delegate, image = self.create_image(serving_profile="auto")
+        path_delegate.read_file_lines = PathDelegate().read_file_lines
+
+        content = image.dockerfile_content()
+
+        self.assertTrue(content.endswith("ENV MODEL_SERVER_PROFILE=auto\n"))
+        self.assertLess(content.index("WORKDIR /opt/program"), content.index("MODEL_SERVER_PROFILE"))
+
+
+    def test_dockerfile_content_sets_serving_profile_settings(self):
+        _, _, path_delegate, image = self.create_image(serving_profile={"profile": "gthread", "threads": 8})
+        path_delegate.read_file_lines = PathDelegate().read_file_lines
+
+        content = image.dockerfile_content()
+
+        self.assertIn("ENV MODEL_SERVER_PROFILE=gthread\nENV MODEL_SERVER_THREADS=8\n", content)
+
+
+    def test_dockerfile_content_leaves_serving_profile_unset_by_default(self):
+        _, _, path_delegate, image = self.create_image()
+        path_delegate.read_file_lines = PathDelegate().read_file_lines
+
+        self.assertNotIn("MODEL_SERVER_", image.dockerfile_content())
+
+
+    def test_requirements_content_is_sorted_and_deduplicated(self):
+        container, _, _, image = self.create_image()
+        container.pip_packages = ["b-package", "A-package==1.0", "b-package"]
+
+        self.assertEqual("A-package==1.0\nb-package\n", image.requirements_content())
+
+
+    def test_build_writes_requirements_file(self):
+        container, _, path_delegate, image = self.create_image()
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+
+        image.build()
+
+        path_delegate.write_file.assert_any_call("{}/requirements.txt".format(self.PATH),
+                                                 image.requirements_content())
+
+
+    def test_build_reports_layer_cache_hits(self):
+        _, cmd_runner, _, image = self.create_image()
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+        cmd_runner.stdout = "Step 1/3 : FROM ubuntu\n ---> Using cache\nStep 2/3 : COPY model /opt/program\n"
+
+        image.build(verbose=False)
+
+        self.assertEqual(["FROM ubuntu"], image.layer_report.hits)
+        self.assertEqual(["COPY model /opt/program"], image.layer_report.misses)
+
+
+    def test_layer_cache_report_parses_buildkit_output(self):
+        report = docker.LayerCacheReport.from_build_output("\n".join([
+            "#4 [1/3] FROM docker.io/library/ubuntu:16.04",
+            "#5 [2/3] RUN apt-get update",
+            "#5 CACHED",
+            "#6 [3/3] COPY model /opt/program",
+            "#6 DONE 0.1s"
+        ]))
+
+        self.assertEqual(["RUN apt-get update"], report.hits)
+        self.assertEqual(["FROM docker.io/library/ubuntu:16.04", "COPY model /opt/program"],
+                         report.misses)
+
+
     def test_build_calls_package_on_container(self):
         container, _, _, image = self.create_image()
         image.dockerfile_content = mock.MagicMock(return_value="APPROPRIATE_CONTENT")
@@ -97,7 +227,7 @@ class ImageTest(TestCase):
         image.build(verbose=True)
 
         cmd_runner.run.asser_called_with([
-            "bash", "{}/{}".format(self.PATH, "build.sh"), self.NAME
+            "bash", "{}/{}".format(self.PATH, "build.sh"), image.tagged_name
         ], verbose=True)
 
 
@@ -130,6 +260,80 @@ class ImageTest(TestCase):
         cmd_runner.reset.assert_not_called()
 
 
+    def test_build_digest_changes_with_build_inputs(self):
+        container, _, _, image = self.create_image()
+
+        digest = image.build_digest("CONTENT")
+
+        self.assertEqual(digest, image.build_digest("CONTENT"))
+        self.assertNotEqual(digest, image.build_digest("OTHER_CONTENT"))
+        image.commands = ["othercommand"]
+        self.assertNotEqual(digest, image.build_digest("CONTENT"))
+        image.commands = list(self.COMMANDS)
+        container.content_digest = mock.MagicMock(return_value="OTHER_DIGEST")
+        self.assertNotEqual(digest, image.build_digest("CONTENT"))
+
+
+    def test_build_does_not_use_build_cache_by_default(self):
+        _, cmd_runner, _, image = self.create_image()
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+
+        image.build()
+
+        image.build_cache.is_up_to_date.assert_not_called()
+        image.build_cache.store.assert_not_called()
+        cmd_runner.run.assert_called()
+
+
+    def test_build_skips_docker_build_when_build_cache_is_up_to_date(self):
+        _, cmd_runner, path_delegate, image = self.create_image(cache_builds=True)
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+        image.build_cache.is_up_to_date = mock.MagicMock(return_value=True)
+
+        image.build(verbose=False)
+
+        image.build_cache.is_up_to_date.assert_called_with(image.tagged_name,
+                                                           image.build_digest("CONTENT"))
+        cmd_runner.run.assert_called_once_with(["docker", "image", "inspect", image.tagged_name],
+                                               verbose=False)
+        self.assertNotIn("{}/Dockerfile".format(self.PATH),
+                         [call[0][0] for call in path_delegate.write_file.call_args_list])
+
+
+    def test_build_rebuilds_up_to_date_image_removed_from_docker(self):
+        _, cmd_runner, _, image = self.create_image(cache_builds=True)
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+        image.build_cache.is_up_to_date = mock.MagicMock(return_value=True)
+        cmd_runner.run = mock.MagicMock(side_effect=[1, 0])
+
+        image.build(verbose=False)
+
+        self.assertEqual(2, cmd_runner.run.call_count)
+        image.build_cache.store.assert_called_with(image.tagged_name, image.build_digest("CONTENT"))
+
+
+    def test_build_stores_digest_in_build_cache_after_successful_build(self):
+        _, cmd_runner, _, image = self.create_image(cache_builds=True)
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+
+        image.build()
+
+        cmd_runner.run.assert_called()
+        image.build_cache.store.assert_called_with(image.tagged_name,
+                                                   image.build_digest("CONTENT"))
+
+
+    def test_build_does_not_store_digest_in_build_cache_after_unsuccessful_build(self):
+        _, cmd_runner, _, image = self.create_image(cache_builds=True)
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+        cmd_runner.run = mock.MagicMock(return_value=1)
+
+        with self.assertRaises(RuntimeError):
+            image.build()
+
+        image.build_cache.store.assert_not_called()
+
+
     def test_push_calls_build_first(self):
         _, _, _, image = self.create_image()
         image.build = mock.MagicMock()
@@ -147,7 +351,7 @@ class ImageTest(TestCase):
         image.push()
 
         cmd_runner.run.assert_called_with([
-            "bash", "{}/{}".format(self.PATH, "push.sh"), self.NAME
+            "bash", "{}/{}".format(self.PATH, "push.sh"), image.tagged_name
         ], verbose=True)
 
 
@@ -242,3 +446,104 @@ class ImageTest(TestCase):
             image.train()
 
         cmd_runner.reset.assert_not_called()
+
+
+    def create_async_command_runner(self, returncode=0):
+        cmd_runner = mock.MagicMock()
+        cmd_runner.run = mock.AsyncMock(return_value=returncode)
+        cmd_runner.stdout = ""
+        cmd_runner.stderr = ""
+        return cmd_runner
+
+
+    def test_build_async_runs_build_script_with_given_command_runner(self):
+        _, cmd_runner, _, image = self.create_image()
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+        async_cmd_runner = self.create_async_command_runner()
+
+        asyncio.run(image.build_async(command_runner=async_cmd_runner))
+
+        async_cmd_runner.run.assert_called_with([
+            "bash", "{}/{}".format(self.PATH, "build.sh"), image.tagged_name
+        ], verbose=True)
+        async_cmd_runner.reset.assert_called()
+        cmd_runner.run.assert_not_called()
+
+
+    def test_build_async_raises_when_build_script_call_fails(self):
+        _, _, _, image = self.create_image()
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(image.build_async(command_runner=self.create_async_command_runner(1)))
+
+
+    def test_push_async_builds_then_pushes(self):
+        _, _, _, image = self.create_image()
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+        async_cmd_runner = self.create_async_command_runner()
+
+        asyncio.run(image.push_async(command_runner=async_cmd_runner))
+
+        self.assertEqual(2, async_cmd_runner.run.call_count)
+        async_cmd_runner.run.assert_called_with([
+            "bash", "{}/{}".format(self.PATH, "push.sh"), image.tagged_name
+        ], verbose=True)
+
+
+    def test_train_async_calls_train_script_with_timeout(self):
+        _, _, path_delegate, image = self.create_image()
+        image.build_async = mock.AsyncMock()
+        async_cmd_runner = self.create_async_command_runner()
+
+        asyncio.run(image.train_async(command_runner=async_cmd_runner, timeout=10))
+
+        path_delegate.create_directory.assert_called_with(self.OUTPUT_DIR)
+        async_cmd_runner.run.assert_called_with([
+            "bash",
+            "{}/{}/{}".format(self.PATH, "local_test", "train_local.sh"),
+            "{}:{}".format(self.NAME, self.TAG),
+            self.OUTPUT_DIR
+        ], verbose=True, timeout=10)
+
+
+    def test_build_streams_context_to_docker_without_packaging(self):
+        container, cmd_runner, path_delegate, image = self.create_image(stream_context=True)
+        image.dockerfile_content = mock.MagicMock(return_value="CONTENT")
+
+        image.build()
+
+        container.package.assert_not_called()
+        path_delegate.write_file.assert_not_called()
+        argv = cmd_runner.run.call_args[0][0]
+        self.assertEqual(["docker", "build", "-t", image.tagged_name, "-"], argv)
+
+        stream = mock.MagicMock()
+        cmd_runner.run.call_args[1]["stdin_writer"](stream)
+        container.write_context_tar.assert_called_with(stream, {
+            "Dockerfile": "CONTENT", "requirements.txt": image.requirements_content()
+        })
+
+
+    def test_build_digest_uses_source_digest_when_streaming_context(self):
+        container, _, _, image = self.create_image(stream_context=True)
+        container.source_digest = mock.MagicMock(return_value="SOURCE_DIGEST")
+
+        image.build_digest("CONTENT")
+
+        container.source_digest.assert_called()
+        container.content_digest.assert_not_called()
+
+
+    def test_train_uses_template_scripts_when_streaming_context(self):
+        _, cmd_runner, _, image = self.create_image(stream_context=True)
+        image.build = mock.MagicMock()
+
+        image.train()
+
+        cmd_runner.run.assert_called_with([
+            "bash",
+            os.path.join(template.container_template_path(), "local_test", "train_local.sh"),
+            "{}:{}".format(self.NAME, self.TAG),
+            self.OUTPUT_DIR
+        ], verbose=True)
@@ -1,5 +1,9 @@
 from unittest import TestCase, mock
 from valohai_sagemaker import file_transformer as ft
+from valohai_sagemaker.transformation_cache import TransformationCache
+import io
+import os
+import tempfile
 
 
 EXT1 = ".ext1"
@@ -39,7 +43,7 @@ class TransformerAwarePathDelegateTest(TestCase):
         path_delegate.copy(self.FILENAME0, self.FILENAME0)
 
         path_delegate._original_copy.assert_has_calls([
-            mock.call(self.FILENAME0, self.FILENAME0)
+            mock.call(self.FILENAME0, self.FILENAME0, ignored=())
         ])
         path_delegate.remove.assert_not_called()
         self.assertEqual(0, transformer.transformed_called)
@@ -54,7 +58,7 @@ class TransformerAwarePathDelegateTest(TestCase):
         path_delegate.copy(self.FILENAME0, self.FILENAME1)
 
         path_delegate._original_copy.assert_has_calls([
-            mock.call(self.FILENAME0, self.FILENAME1)
+            mock.call(self.FILENAME0, self.FILENAME1, ignored=())
         ])
         path_delegate.remove.assert_not_called()
         self.assertEqual(0, transformer.transformed_called)
@@ -69,7 +73,7 @@ class TransformerAwarePathDelegateTest(TestCase):
         path_delegate.copy(self.FILENAME1, self.FILENAME0)
 
         path_delegate._original_copy.assert_has_calls([
-            mock.call(self.FILENAME1, self.FILENAME0)
+            mock.call(self.FILENAME1, self.FILENAME0, ignored=())
         ])
         path_delegate.remove.assert_not_called()
         self.assertEqual(0, transformer.transformed_called)
@@ -84,7 +88,7 @@ class TransformerAwarePathDelegateTest(TestCase):
         path_delegate.copy(self.FILENAME1, self.FILENAME1)
 
         path_delegate._original_copy.assert_has_calls([
-            mock.call(self.FILENAME1, self.FILENAME1)
+            mock.call(self.FILENAME1, self.FILENAME1, ignored=())
         ])
         path_delegate.remove.assert_not_called()
         self.assertEqual(0, transformer.transformed_called)
@@ -98,9 +102,299 @@ class TransformerAwarePathDelegateTest(TestCase):
 
         path_delegate.copy(self.FILENAME1, self.FILENAME2)
 
-        transformed = "{}.transformed{}".format(self.FILENAME1, EXT2)
-        path_delegate._original_copy.assert_has_calls([
-            mock.call(transformed, self.FILENAME2)
-        ])
-        path_delegate.remove.assert_called_with(transformed)
+        self.assertEqual([(self.FILENAME1, self.FILENAME2)], transformer.arguments)
+        path_delegate._original_copy.assert_not_called()
+        path_delegate.remove.assert_not_called()
+
+
+    def test_copy_copies_cached_transformation_if_extension_is_different(self):
+        transformer = TransformerMock()
+        cache = mock.MagicMock()
+        cache.transformed_file = mock.MagicMock(return_value="CACHED")
+        path_delegate = ft.TransformationAwarePathDelegate([transformer], cache=cache)
+        path_delegate._original_copy = mock.MagicMock()
+
+        path_delegate.copy(self.FILENAME1, self.FILENAME2)
+
+        cache.transformed_file.assert_called_with(transformer, self.FILENAME1)
+        path_delegate._original_copy.assert_called_with("CACHED", self.FILENAME2)
+        self.assertEqual(0, transformer.transformed_called)
+
+
+    def test_transformed_file_is_none_without_transformation(self):
+        path_delegate = ft.TransformationAwarePathDelegate([TransformerMock()])
+
+        with path_delegate.transformed_file(self.FILENAME1, self.FILENAME1) as transformed:
+            self.assertIsNone(transformed)
+        with path_delegate.transformed_file(self.FILENAME0, self.FILENAME2) as transformed:
+            self.assertIsNone(transformed)
+
+
+    def test_transformed_file_is_a_temporary_file_removed_after_use_by_default(self):
+        class WritingTransformerMock(TransformerMock):
+            def transform(self, _in, _out):
+                super().transform(_in, _out)
+                with open(_out, "w") as file:
+                    file.write("transformed")
+
+        transformer = WritingTransformerMock()
+        path_delegate = ft.TransformationAwarePathDelegate([transformer])
+
+        with path_delegate.transformed_file(self.FILENAME1, self.FILENAME2) as transformed:
+            with open(transformed) as file:
+                self.assertEqual("transformed", file.read())
+
         self.assertEqual(1, transformer.transformed_called)
+        self.assertFalse(os.path.exists(transformed))
+
+
+    def test_transformed_file_is_the_cache_entry_with_a_cache(self):
+        transformer = TransformerMock()
+        cache = mock.MagicMock()
+        cache.transformed_file = mock.MagicMock(return_value="CACHED")
+        path_delegate = ft.TransformationAwarePathDelegate([transformer], cache=cache)
+
+        with path_delegate.transformed_file(self.FILENAME1, self.FILENAME2) as transformed:
+            self.assertEqual("CACHED", transformed)
+
+        cache.transformed_file.assert_called_with(transformer, self.FILENAME1)
+        self.assertEqual(0, transformer.transformed_called)
+
+
+class StreamTransformer(ft.FileTransformer):
+
+
+    def __init__(self, ext1, ext2, function=bytes.upper):
+        self.exts = ext1, ext2
+        self.function = function
+
+
+    @property
+    def transforming(self):
+        return self.exts
+
+
+    def transform(self, _in, _out):
+        with open(_in, "rb") as input_file, open(_out, "wb") as output_file:
+            self.transform_stream(input_file, output_file)
+
+
+    def transform_stream(self, input_stream, output_stream):
+        for line in input_stream:
+            output_stream.write(self.function(line))
+
+
+class FileTransformerContainerTest(TestCase):
+
+
+    def setUp(self):
+        self.container = ft.FileTransformerContainer()
+        self.a_b = StreamTransformer(".a", ".b")
+        self.b_c = StreamTransformer(".b", ".c")
+        self.c_d = StreamTransformer(".c", ".d")
+        self.a_d = StreamTransformer(".a", ".d")
+        for transformer in [self.a_b, self.b_c, self.c_d]:
+            self.container[transformer.transforming] = transformer
+
+
+    def test_direct_transformer_is_returned_as_is(self):
+        self.assertIs(self.b_c, self.container[".b", ".c"])
+
+
+    def test_chain_is_the_shortest_path_of_extensions(self):
+        self.assertEqual([self.a_b, self.b_c, self.c_d], self.container.chain(".a", ".d"))
+
+        self.container[".a", ".d"] = self.a_d
+
+        self.assertEqual([self.a_d], self.container.chain(".a", ".d"))
+        self.assertIs(self.a_d, self.container[".a", ".d"])
+
+
+    def test_chained_transformer_is_cached(self):
+        chained = self.container[".a", ".c"]
+
+        self.assertEqual([self.a_b, self.b_c], chained.transformers)
+        self.assertEqual((".a", ".c"), chained.transforming)
+        self.assertIs(chained, self.container[".a", ".c"])
+
+
+    def test_unreachable_extension_raises_key_error(self):
+        self.assertNotIn((".d", ".a"), self.container)
+        with self.assertRaises(KeyError):
+            self.container[".d", ".a"]
+
+
+class ChainedFileTransformerTest(TestCase):
+
+
+    def test_steps_must_have_matching_extensions(self):
+        with self.assertRaises(ValueError):
+            ft.ChainedFileTransformer([StreamTransformer(".a", ".b"), StreamTransformer(".c", ".d")])
+
+
+    def test_version_changes_with_any_step(self):
+        first, second = StreamTransformer(".a", ".b"), StreamTransformer(".b", ".c")
+        version = ft.ChainedFileTransformer([first, second]).version
+
+        second.version = "2"
+
+        self.assertNotEqual(version, ft.ChainedFileTransformer([first, second]).version)
+
+
+    def test_transform_stream_pipes_every_step(self):
+        chained = ft.ChainedFileTransformer([
+            StreamTransformer(".a", ".b", bytes.upper),
+            StreamTransformer(".b", ".c", lambda line: line.replace(b"A", b"4")),
+            StreamTransformer(".c", ".d", lambda line: line * 2),
+        ])
+        content = b"".join(b"abc %d\n" % index for index in range(100000))
+        output = io.BytesIO()
+
+        chained.transform_stream(io.BytesIO(content), output)
+
+        self.assertEqual(b"".join(line.upper().replace(b"A", b"4") * 2 for line in content.splitlines(True)),
+                         output.getvalue())
+
+
+    def test_transform_stream_raises_the_failing_step_error(self):
+        def fail(line):
+            raise RuntimeError("failed")
+
+        chained = ft.ChainedFileTransformer([
+            StreamTransformer(".a", ".b"),
+            StreamTransformer(".b", ".c", fail),
+        ])
+
+        with self.assertRaisesRegex(RuntimeError, "failed"):
+            chained.transform_stream(io.BytesIO(b"line\n" * 100000), io.BytesIO())
+
+
+    def test_default_transform_stream_goes_through_temporary_files(self):
+        class FileOnlyTransformer(TransformerMock):
+            def transform(self, _in, _out):
+                super().transform(_in, _out)
+                with open(_in, "rb") as input_file, open(_out, "wb") as output_file:
+                    output_file.write(input_file.read()[::-1])
+
+        transformer = FileOnlyTransformer()
+        output = io.BytesIO()
+
+        transformer.transform_stream(io.BytesIO(b"abc"), output)
+
+        self.assertEqual(b"cba", output.getvalue())
+        self.assertFalse(any(os.path.exists(filename) for filename in transformer.arguments[0]))
+
+
+class ChainingPathDelegateTest(TestCase):
+
+
+    def test_copy_runs_the_chain_of_transformers(self):
+        path_delegate = ft.TransformationAwarePathDelegate([
+            StreamTransformer(".a", ".b", bytes.upper),
+            StreamTransformer(".b", ".c", bytes.strip),
+        ])
+
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "file.a")
+            destination = os.path.join(directory, "file.c")
+            with open(source, "wb") as file:
+                file.write(b"a\nb\n")
+
+            path_delegate.copy(source, destination)
+
+            with open(destination, "rb") as file:
+                self.assertEqual(b"AB", file.read())
+            self.assertEqual(["file.a", "file.c"], sorted(os.listdir(directory)))
+
+
+def fail_on_bad(line):
+    if line.startswith(b"bad"):
+        raise ValueError("bad line")
+    return line.upper()
+
+
+class TransformFilesTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def files(self, contents, ext2=".b"):
+        files = []
+        for index, content in enumerate(contents):
+            source = os.path.join(self.directory.name, "file{}.a".format(index))
+            with open(source, "wb") as file:
+                file.write(content)
+            files.append((source, os.path.join(self.directory.name, "out{}{}".format(index, ext2))))
+        return files
+
+
+    def read(self, filename):
+        with open(filename, "rb") as file:
+            return file.read()
+
+
+    def test_transforms_only_files_needing_it(self):
+        path_delegate = ft.TransformationAwarePathDelegate([StreamTransformer(".a", ".b")])
+        files = self.files([b"x", b"y"])
+        files.append((files[0][0], os.path.join(self.directory.name, "copy.a")))
+
+        transformed = path_delegate.transform_files(files)
+
+        self.assertEqual({files[0][1], files[1][1]}, transformed)
+        self.assertEqual(b"X", self.read(files[0][1]))
+        self.assertFalse(os.path.exists(files[2][1]))
+
+
+    def test_transforms_files_in_worker_processes(self):
+        path_delegate = ft.TransformationAwarePathDelegate([StreamTransformer(".a", ".b")],
+                                                           transform_workers=2)
+        files = self.files([b"content %d" % index for index in range(4)])
+
+        transformed = path_delegate.transform_files(files)
+
+        self.assertEqual(set(destination for _, destination in files), transformed)
+        for index, (_, destination) in enumerate(files):
+            self.assertEqual(b"CONTENT %d" % index, self.read(destination))
+
+
+    def test_reports_every_failing_file_once_the_others_are_transformed(self):
+        path_delegate = ft.TransformationAwarePathDelegate([StreamTransformer(".a", ".b", fail_on_bad)],
+                                                           transform_workers=2)
+        files = self.files([b"bad 0", b"good", b"bad 2"])
+
+        with self.assertRaises(ft.TransformationError) as context:
+            path_delegate.transform_files(files)
+
+        self.assertEqual([files[0][0], files[2][0]], [source for source, _ in context.exception.errors])
+        self.assertIsInstance(context.exception.errors[0][1], ValueError)
+        self.assertEqual(b"GOOD", self.read(files[1][1]))
+
+
+    def test_missing_transformer_is_reported_per_file(self):
+        path_delegate = ft.TransformationAwarePathDelegate([StreamTransformer(".a", ".b")])
+
+        with self.assertRaises(ft.TransformationError) as context:
+            path_delegate.transform_files(self.files([b"x"], ext2=".c"))
+
+        self.assertIsInstance(context.exception.errors[0][1], KeyError)
+
+
+    def test_cached_transformations_are_copied_from_the_cache(self):
+        cache = TransformationCache(os.path.join(self.directory.name, "cache"))
+        path_delegate = ft.TransformationAwarePathDelegate([StreamTransformer(".a", ".b")], cache=cache,
+                                                           transform_workers=2)
+        files = self.files([b"x", b"y"])
+
+        path_delegate.transform_files(files)
+        for _, destination in files:
+            os.remove(destination)
+        path_delegate.transform_files(files)
+
+        self.assertEqual((2, 2), (cache.hits, cache.misses))
+        self.assertEqual(b"Y", self.read(files[1][1]))
@@ -0,0 +1,110 @@
+from unittest import TestCase, mock
+from . import serving_context
+
+import gunicorn_config
+
+
+class Worker(object):
+    pid = 1
+
+
+class Server(object):
+    def __init__(self, *workers):
+        self.WORKERS = dict(enumerate(workers))
+
+
+def forked_worker(server):
+    worker = Worker()
+    with mock.patch("gunicorn_config.gc.freeze", create=True):
+        gunicorn_config.pre_fork(server, worker)
+    return worker
+
+
+@mock.patch("gunicorn_config.cpu_sets", [[0, 1], [2, 3]])
+class CPUSlotTest(TestCase):
+
+
+    def test_workers_take_the_first_free_slot(self):
+        first = forked_worker(Server())
+        second = forked_worker(Server(first))
+
+        self.assertEqual((0, 1), (first.cpu_slot, second.cpu_slot))
+
+
+    def test_restarted_worker_takes_over_the_slot_of_the_one_it_replaces(self):
+        first, second, third = Worker(), Worker(), Worker()
+        first.cpu_slot, second.cpu_slot, third.cpu_slot = 0, 1, 2
+
+        self.assertEqual(1, forked_worker(Server(first, third)).cpu_slot)
+
+
+    def test_workers_are_pinned_to_the_cpu_set_of_their_slot(self):
+        worker = Worker()
+        worker.cpu_slot = 3
+
+        with mock.patch("gunicorn_config.os.sched_setaffinity", create=True) as sched_setaffinity:
+            gunicorn_config.post_fork(Server(), worker)
+
+        sched_setaffinity.assert_called_once_with(0, [2, 3])
+
+
+    def test_workers_are_not_pinned_without_cpu_sets(self):
+        with mock.patch("gunicorn_config.cpu_sets", []), \
+                mock.patch("gunicorn_config.os.sched_setaffinity", create=True) as sched_setaffinity:
+            worker = forked_worker(Server())
+            gunicorn_config.post_fork(Server(), worker)
+
+        self.assertFalse(hasattr(worker, "cpu_slot"))
+        sched_setaffinity.assert_not_called()
+
+
+SMAPS_ROLLUP = """00400000-7ffc5a1f1000 ---p 00000000 00:00 0                          [rollup]
+Rss:              204800 kB
+Pss:               51200 kB
+Shared_Clean:     153600 kB
+Shared_Dirty:          0 kB
+Private_Clean:      1024 kB
+Private_Dirty:     50176 kB
+Swap:                  0 kB
+"""
+
+
+class GarbageCollectionTest(TestCase):
+
+
+    def test_pre_fork_freezes_objects_of_the_master(self):
+        with mock.patch("gunicorn_config.gc") as gc:
+            gunicorn_config.pre_fork(Server(), Worker())
+
+        gc.freeze.assert_called_once_with()
+
+
+    def test_pre_fork_without_gc_freeze(self):
+        with mock.patch("gunicorn_config.gc", mock.Mock(spec=["enable", "collect"])) as gc:
+            gunicorn_config.pre_fork(Server(), Worker())
+
+        gc.collect.assert_not_called()
+
+
+    @mock.patch("gunicorn_config.cpu_sets", [])
+    def test_post_fork_enables_garbage_collection_in_workers(self):
+        with mock.patch("gunicorn_config.gc") as gc:
+            gunicorn_config.post_fork(Server(), Worker())
+
+        gc.enable.assert_called_once_with()
+
+
+class MemoryUsageTest(TestCase):
+
+
+    def test_memory_usage_reads_smaps_rollup(self):
+        with mock.patch("builtins.open", mock.mock_open(read_data=SMAPS_ROLLUP)) as smaps:
+            usage = gunicorn_config.memory_usage()
+
+        smaps.assert_called_once_with("/proc/self/smaps_rollup")
+        self.assertEqual({"rss": 200.0, "pss": 50.0, "shared": 150.0, "private": 50.0}, usage)
+
+
+    def test_memory_usage_is_empty_without_smaps_rollup(self):
+        with mock.patch("builtins.open", side_effect=FileNotFoundError):
+            self.assertEqual({}, gunicorn_config.memory_usage())
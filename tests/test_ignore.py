@@ -0,0 +1,82 @@
+from unittest import TestCase
+from valohai_sagemaker.ignore import IgnoreMatcher
+import os
+import tempfile
+
+
+class IgnoreMatcherTest(TestCase):
+
+
+    def test_empty_matcher_ignores_nothing(self):
+        matcher = IgnoreMatcher(["", "# comment"])
+
+        self.assertFalse(matcher)
+        self.assertFalse(matcher.ignored("file.py"))
+
+
+    def test_pattern_without_slash_matches_at_any_depth(self):
+        matcher = IgnoreMatcher(["*.pyc"])
+
+        self.assertTrue(matcher.ignored("file.pyc"))
+        self.assertTrue(matcher.ignored("some/dir/file.pyc"))
+        self.assertFalse(matcher.ignored("file.py"))
+
+
+    def test_pattern_with_slash_is_anchored_to_the_root(self):
+        matcher = IgnoreMatcher(["/data", "logs/*.txt"])
+
+        self.assertTrue(matcher.ignored("data", True))
+        self.assertFalse(matcher.ignored("sub/data", True))
+        self.assertTrue(matcher.ignored("logs/a.txt"))
+        self.assertFalse(matcher.ignored("sub/logs/a.txt"))
+        self.assertFalse(matcher.ignored("logs/sub/a.txt"))
+
+
+    def test_trailing_slash_only_matches_directories(self):
+        matcher = IgnoreMatcher(["build/"])
+
+        self.assertTrue(matcher.ignored("build", True))
+        self.assertTrue(matcher.ignored("sub/build", True))
+        self.assertFalse(matcher.ignored("build", False))
+
+
+    def test_double_star_matches_any_number_of_directories(self):
+        matcher = IgnoreMatcher(["docs/**/*.md", "out/**"])
+
+        self.assertTrue(matcher.ignored("docs/a.md"))
+        self.assertTrue(matcher.ignored("docs/a/b/c.md"))
+        self.assertTrue(matcher.ignored("out/anything/at/all"))
+        self.assertFalse(matcher.ignored("a.md"))
+
+
+    def test_question_mark_and_character_classes(self):
+        matcher = IgnoreMatcher(["file?.txt", "model[0-9].bin", "x[!a].y"])
+
+        self.assertTrue(matcher.ignored("file1.txt"))
+        self.assertFalse(matcher.ignored("file10.txt"))
+        self.assertTrue(matcher.ignored("model3.bin"))
+        self.assertFalse(matcher.ignored("modelA.bin"))
+        self.assertTrue(matcher.ignored("xb.y"))
+        self.assertFalse(matcher.ignored("xa.y"))
+
+
+    def test_last_matching_pattern_wins_with_negations(self):
+        matcher = IgnoreMatcher(["*.csv", "!keep.csv"])
+
+        self.assertTrue(matcher.ignored("data.csv"))
+        self.assertFalse(matcher.ignored("keep.csv"))
+        self.assertTrue(IgnoreMatcher(["!keep.csv", "*.csv"]).ignored("keep.csv"))
+
+
+    def test_from_file_appends_file_patterns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, ".containerignore")
+            with open(filename, "w") as file:
+                file.write("*.csv\n")
+
+            matcher = IgnoreMatcher.from_file(filename, ["*.pyc"])
+            missing = IgnoreMatcher.from_file(os.path.join(directory, "missing"), ["*.pyc"])
+
+        self.assertTrue(matcher.ignored("a.csv"))
+        self.assertTrue(matcher.ignored("a.pyc"))
+        self.assertFalse(missing.ignored("a.csv"))
@@ -0,0 +1,80 @@
+from unittest import TestCase
+from valohai_sagemaker.ipython import IPythonNotebookFileTransformer, BEGIN_TAG, END_TAG
+import io
+import json
+import os
+import tempfile
+
+
+def notebook(*cells):
+    return json.dumps({
+        "cells": list(cells),
+        "metadata": {"kernelspec": {"name": "python3"}},
+        "nbformat": 4,
+        "nbformat_minor": 2
+    })
+
+
+def code_cell(source, outputs=[]):
+    return {"cell_type": "code", "execution_count": 1, "metadata": {},
+            "outputs": list(outputs), "source": source}
+
+
+def markdown_cell(source):
+    return {"cell_type": "markdown", "metadata": {}, "source": source}
+
+
+IMAGE_OUTPUT = {"output_type": "display_data", "data": {"image/png": "iVBORw0KGgo" * 1000}}
+
+
+class IPythonNotebookFileTransformerTest(TestCase):
+
+
+    def tagged_code(self, content):
+        output = io.StringIO()
+        IPythonNotebookFileTransformer().write_tagged_code(io.StringIO(content), output)
+        return output.getvalue()
+
+
+    def test_extracts_lines_in_between_tags(self):
+        content = notebook(code_cell(["import os\n", BEGIN_TAG + "\n", "x = 1\n", "y = 2\n",
+                                      END_TAG + "\n", "print(x)"]))
+
+        self.assertEqual("x = 1\ny = 2\n", self.tagged_code(content))
+
+
+    def test_extracts_every_tagged_block_across_cells(self):
+        content = notebook(
+            code_cell([BEGIN_TAG + "\n", "a = 1"], [IMAGE_OUTPUT]),
+            markdown_cell([BEGIN_TAG + "\n", "not code\n", END_TAG]),
+            code_cell(["b = 2\n", END_TAG + "\n", "skipped = 3\n"]),
+            code_cell("# " + BEGIN_TAG + "\nc = 3\n# " + END_TAG))
+
+        self.assertEqual("a = 1\nb = 2\nc = 3\n", self.tagged_code(content))
+
+
+    def test_returns_nothing_without_tags(self):
+        self.assertEqual("", self.tagged_code(notebook(code_cell(["x = 1\n"]))))
+
+
+    def test_transform_writes_script(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_filename = os.path.join(directory, "notebook.ipynb")
+            output_filename = os.path.join(directory, "script.py")
+            with open(input_filename, "w") as file:
+                file.write(notebook(code_cell([BEGIN_TAG + "\n", "x = 1\n", END_TAG])))
+
+            IPythonNotebookFileTransformer().transform(input_filename, output_filename)
+
+            with open(output_filename) as file:
+                self.assertEqual("x = 1\n", file.read())
+
+
+    def test_transform_stream_works_on_binary_streams(self):
+        content = notebook(code_cell([BEGIN_TAG + "\n", "text = \"é\"\n", END_TAG]))
+        output = io.BytesIO()
+
+        IPythonNotebookFileTransformer().transform_stream(io.BytesIO(content.encode("utf8")), output)
+
+        self.assertEqual("text = \"é\"\n".encode("utf8"), output.getvalue())
+        self.assertFalse(output.closed)
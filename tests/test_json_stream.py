@@ -0,0 +1,66 @@
+from unittest import TestCase
+from valohai_sagemaker.json_stream import JSONStreamReader
+import io
+import json
+
+
+DOCUMENT = {
+    "skipped": {"nested": [1, 2.5, {"deep": "va\"lue\\\\"}], "flag": True, "none": None},
+    "wanted": ["a é \\n", "b\"c"],
+    "number": -12.5e3
+}
+
+
+class JSONStreamReaderTest(TestCase):
+
+
+    def read_document(self, chunk_size):
+        reader = JSONStreamReader(io.StringIO(json.dumps(DOCUMENT, indent=1)), chunk_size=chunk_size)
+        values = {}
+        for key in reader.iterate_object():
+            if key == "skipped":
+                reader.skip_value()
+            else:
+                values[key] = reader.read_value()
+        return values
+
+
+    def test_reads_wanted_values_and_skips_others(self):
+        self.assertEqual({"wanted": DOCUMENT["wanted"], "number": DOCUMENT["number"]},
+                         self.read_document(1 << 20))
+
+
+    def test_reads_across_chunk_boundaries(self):
+        for chunk_size in [1, 2, 3, 7]:
+            self.assertEqual({"wanted": DOCUMENT["wanted"], "number": DOCUMENT["number"]},
+                             self.read_document(chunk_size))
+
+
+    def test_iterate_array_yields_every_element(self):
+        reader = JSONStreamReader(io.StringIO('[{"a": 1}, [], "x", 3]'), chunk_size=2)
+
+        values = [reader.read_value() for _ in reader.iterate_array()]
+
+        self.assertEqual([{"a": 1}, [], "x", 3], values)
+
+
+    def test_empty_containers(self):
+        reader = JSONStreamReader(io.StringIO('{"a": [], "b": {}}'))
+
+        for key in reader.iterate_object():
+            self.assertEqual([], list(reader.iterate_array()) if key == "a" else list(reader.iterate_object()))
+
+
+    def test_invalid_document_raises(self):
+        reader = JSONStreamReader(io.StringIO('{"a" 1}'))
+
+        with self.assertRaises(ValueError):
+            list(reader.iterate_object())
+
+
+    def test_truncated_string_raises(self):
+        reader = JSONStreamReader(io.StringIO('["abc'), chunk_size=2)
+
+        with self.assertRaises(ValueError):
+            for _ in reader.iterate_array():
+                reader.skip_value()
@@ -0,0 +1,70 @@
+from unittest import TestCase
+from valohai_sagemaker.manifest import PackageManifest
+import os
+import tempfile
+
+
+class PackageManifestTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source.txt")
+        self.destination = os.path.join(self.directory.name, "destination.txt")
+        for filename in [self.source, self.destination]:
+            with open(filename, "w") as file:
+                file.write("content")
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def test_load_returns_false_when_there_is_no_manifest(self):
+        manifest = PackageManifest(self.directory.name)
+
+        self.assertFalse(manifest.load())
+
+
+    def test_saved_entries_are_loaded_back(self):
+        manifest = PackageManifest(self.directory.name)
+        manifest.record(self.source, self.destination)
+        manifest.save()
+
+        loaded = PackageManifest(self.directory.name)
+
+        self.assertTrue(loaded.load())
+        self.assertTrue(loaded.is_up_to_date(self.source, self.destination))
+
+
+    def test_is_up_to_date_is_false_for_unknown_destination(self):
+        manifest = PackageManifest(self.directory.name)
+
+        self.assertFalse(manifest.is_up_to_date(self.source, self.destination))
+
+
+    def test_is_up_to_date_is_false_when_source_changed(self):
+        manifest = PackageManifest(self.directory.name)
+        manifest.record(self.source, self.destination)
+
+        with open(self.source, "w") as file:
+            file.write("other content")
+
+        self.assertFalse(manifest.is_up_to_date(self.source, self.destination))
+
+
+    def test_is_up_to_date_is_false_when_destination_was_deleted(self):
+        manifest = PackageManifest(self.directory.name)
+        manifest.record(self.source, self.destination)
+
+        os.remove(self.destination)
+
+        self.assertFalse(manifest.is_up_to_date(self.source, self.destination))
+
+
+    def test_stale_lists_recorded_destinations_that_are_not_expected_anymore(self):
+        manifest = PackageManifest(self.directory.name)
+        manifest.record(self.source, self.destination)
+
+        self.assertEqual([self.destination], manifest.stale([]))
+        self.assertEqual([], manifest.stale([self.destination]))
@@ -0,0 +1,108 @@
+from unittest import TestCase, mock, skipUnless
+from . import serving_context
+import importlib.util
+import os
+import pickle
+import tempfile
+
+import model_loader
+
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+class ModelLoaderTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.prefix = self.directory.name
+        self.model_directory = os.path.join(self.prefix, "model")
+        os.mkdir(self.model_directory)
+        environ = {key: value for key, value in os.environ.items()
+                   if key not in ("MODEL_SERVER_MODEL_PATH", "MODEL_SERVER_METADATA_PATH")}
+        for patcher in [mock.patch("model_loader.prefix", self.prefix),
+                        mock.patch("model_loader.model_directory", self.model_directory),
+                        mock.patch.dict("model_loader.model_loaders"),
+                        mock.patch.dict(os.environ, environ, clear=True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def write(self, path, model=None):
+        with open(path, "wb") as file:
+            pickle.dump(model, file)
+        return path
+
+
+    def test_find_model_file_prefers_model_server_model_path(self):
+        self.write(os.path.join(self.prefix, "model.pkl"))
+        os.environ["MODEL_SERVER_MODEL_PATH"] = "/models/model.onnx"
+
+        self.assertEqual("/models/model.onnx", model_loader.find_model_file())
+
+
+    def test_find_model_file_prefers_the_historical_pickle(self):
+        path = self.write(os.path.join(self.prefix, "model.pkl"))
+        self.write(os.path.join(self.model_directory, "model.joblib"))
+
+        self.assertEqual(path, model_loader.find_model_file())
+
+
+    def test_find_model_file_tries_registered_extensions_in_order(self):
+        self.write(os.path.join(self.model_directory, "model.pkl"))
+        path = self.write(os.path.join(self.model_directory, "model.npy"))
+
+        self.assertEqual(path, model_loader.find_model_file())
+
+
+    def test_find_model_file_raises_without_model(self):
+        with self.assertRaises(IOError):
+            model_loader.find_model_file()
+
+
+    def test_load_model_unpickles_pickles(self):
+        path = self.write(os.path.join(self.model_directory, "model.pkl"), {"weights": [1, 2]})
+
+        self.assertEqual({"weights": [1, 2]}, model_loader.load_model())
+        self.assertEqual({"weights": [1, 2]}, model_loader.load_model(path))
+
+
+    def test_load_model_of_unknown_extension_raises(self):
+        with self.assertRaises(ValueError):
+            model_loader.load_model(self.write(os.path.join(self.model_directory, "model.onnx")))
+
+
+    def test_later_registered_loader_replaces_earlier_one(self):
+        path = self.write(os.path.join(self.model_directory, "model.onnx"))
+        model_loader.register_model_loader(".onnx", lambda path: "first")
+        model_loader.register_model_loader(".onnx", lambda path: "second")
+
+        self.assertEqual("second", model_loader.load_model(path))
+        self.assertEqual(path, model_loader.find_model_file())
+
+
+    @skipUnless(HAS_NUMPY, "numpy is not installed")
+    def test_numpy_arrays_are_read_only_memory_maps_by_default(self):
+        import numpy
+        path = os.path.join(self.model_directory, "model.npy")
+        numpy.save(path, numpy.arange(10.0))
+
+        model = model_loader.load_model(path)
+
+        self.assertIsInstance(model, numpy.memmap)
+        self.assertFalse(model.flags.writeable)
+        numpy.testing.assert_array_equal(numpy.arange(10.0), model)
+
+
+    def test_load_model_metadata(self):
+        self.assertEqual({}, model_loader.load_model_metadata())
+
+        with open(os.path.join(self.model_directory, "metadata.json"), "w") as file:
+            file.write('{"input_dtype": "float32", "input_columns": 12}')
+
+        self.assertEqual({"input_dtype": "float32", "input_columns": 12}, model_loader.load_model_metadata())
@@ -0,0 +1,95 @@
+from unittest import TestCase
+from valohai_sagemaker.path import PathDelegate
+import os
+import tempfile
+
+
+class PathDelegateTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source.bin")
+        self.destination = os.path.join(self.directory.name, "destination.bin")
+        with open(self.source, "wb") as file:
+            file.write(os.urandom(4096))
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def assert_same_content(self, first, second):
+        with open(first, "rb") as first_file, open(second, "rb") as second_file:
+            self.assertEqual(first_file.read(), second_file.read())
+
+
+    def test_copy_file_copies_content_and_modification_time(self):
+        PathDelegate().copy_file(self.source, self.destination)
+
+        self.assert_same_content(self.source, self.destination)
+        self.assertEqual(os.stat(self.source).st_mtime_ns, os.stat(self.destination).st_mtime_ns)
+        self.assertNotEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+
+
+    def test_copy_file_into_directory_keeps_basename(self):
+        os.mkdir(self.destination)
+
+        destination = PathDelegate().copy_file(self.source, self.destination)
+
+        self.assertEqual(os.path.join(self.destination, "source.bin"), destination)
+        self.assert_same_content(self.source, destination)
+
+
+    def test_copy_file_hardlinks_big_files_in_hardlink_mode(self):
+        PathDelegate(link_mode="hardlink", link_min_size=1024).copy_file(self.source, self.destination)
+
+        self.assertEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+
+
+    def test_copy_file_replaces_existing_destination_in_hardlink_mode(self):
+        with open(self.destination, "w") as file:
+            file.write("previous")
+
+        PathDelegate(link_mode="hardlink", link_min_size=1024).copy_file(self.source, self.destination)
+
+        self.assertEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+
+
+    def test_copy_file_copies_small_files_in_hardlink_mode(self):
+        PathDelegate(link_mode="hardlink", link_min_size=8192).copy_file(self.source, self.destination)
+
+        self.assertNotEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+        self.assert_same_content(self.source, self.destination)
+
+
+    def test_copy_file_in_reflink_mode_falls_back_to_copy(self):
+        PathDelegate(link_mode="reflink", link_min_size=1024).copy_file(self.source, self.destination)
+
+        self.assert_same_content(self.source, self.destination)
+
+
+    def test_copy_file_does_not_truncate_source_hardlinked_by_previous_copy(self):
+        PathDelegate(link_mode="hardlink", link_min_size=1024).copy_file(self.source, self.destination)
+        with open(self.source, "r+b") as file:
+            file.truncate(1000)
+
+        PathDelegate(link_mode="hardlink", link_min_size=1024).copy_file(self.source, self.destination)
+
+        self.assertEqual(1000, os.stat(self.source).st_size)
+        self.assertNotEqual(os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+        self.assert_same_content(self.source, self.destination)
+
+
+    def test_bad_link_mode_raises(self):
+        with self.assertRaises(ValueError):
+            PathDelegate(link_mode="symlink")
+
+
+    def test_walk_files_lists_relative_paths_in_order(self):
+        os.makedirs(os.path.join(self.directory.name, "b"))
+        open(os.path.join(self.directory.name, "b", "c"), "w").close()
+
+        self.assertEqual(["source.bin", "b/c"],
+                         list(PathDelegate().walk_files(self.directory.name)))
+        self.assertEqual([""], list(PathDelegate().walk_files(self.source)))
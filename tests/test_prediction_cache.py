@@ -0,0 +1,110 @@
+from unittest import TestCase, mock, skipUnless
+from . import serving_context
+import importlib.util
+
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+HAS_PANDAS = HAS_NUMPY and importlib.util.find_spec("pandas") is not None
+
+if HAS_NUMPY:
+    import numpy
+    from prediction_cache import PredictionCache, ENTRY_OVERHEAD
+
+
+@skipUnless(HAS_NUMPY, "numpy is not installed")
+class PredictionCacheTest(TestCase):
+
+
+    def setUp(self):
+        self.predicted = []
+
+
+    def predict(self, input):
+        self.predicted.append(input[:, 0].tolist())
+        return input.sum(axis=1)
+
+
+    def test_cached_and_predicted_rows_are_merged_in_input_order(self):
+        cache = PredictionCache(10 ** 6)
+        cache.predict(numpy.array([[1.0, 1.0], [3.0, 3.0]]), self.predict)
+
+        result = cache.predict(numpy.array([[2.0, 2.0], [3.0, 3.0], [4.0, 4.0], [1.0, 1.0]]), self.predict)
+
+        numpy.testing.assert_array_equal([4.0, 6.0, 8.0, 2.0], result)
+        self.assertEqual([[1.0, 3.0], [2.0, 4.0]], self.predicted)
+        self.assertEqual({"hits": 2, "misses": 4, "entries": 4},
+                         {key: cache.stats()[key] for key in ("hits", "misses", "entries")})
+
+
+    def test_fully_cached_input_is_not_predicted(self):
+        cache = PredictionCache(10 ** 6)
+        input = numpy.array([[1.0, 2.0], [3.0, 4.0]])
+        cache.predict(input, self.predict)
+
+        numpy.testing.assert_array_equal([3.0, 7.0], cache.predict(input, self.predict))
+        self.assertEqual(1, len(self.predicted))
+
+
+    def test_duplicate_rows_are_predicted_once(self):
+        cache = PredictionCache(10 ** 6)
+
+        result = cache.predict(numpy.array([[5.0, 0.0], [6.0, 0.0], [5.0, 0.0]]), self.predict)
+
+        numpy.testing.assert_array_equal([5.0, 6.0, 5.0], result)
+        self.assertEqual([[5.0, 6.0]], self.predicted)
+
+
+    def test_multidimensional_predictions_are_merged(self):
+        cache = PredictionCache(10 ** 6)
+        predict = lambda input: numpy.stack([input[:, 0], -input[:, 0]], axis=1)
+        cache.predict(numpy.array([[1.0]]), predict)
+
+        result = cache.predict(numpy.array([[2.0], [1.0]]), predict)
+
+        numpy.testing.assert_array_equal([[2.0, -2.0], [1.0, -1.0]], result)
+
+
+    def test_wrong_prediction_count_raises(self):
+        with self.assertRaises(RuntimeError):
+            PredictionCache(10 ** 6).predict(numpy.eye(2), lambda input: numpy.ones(1))
+
+
+    def test_least_recently_used_entries_are_evicted_beyond_max_bytes(self):
+        entry_size = ENTRY_OVERHEAD + 8 + 16
+        cache = PredictionCache(2 * entry_size)
+        cache.predict(numpy.array([[1.0, 0.0], [2.0, 0.0]]), self.predict)
+        cache.predict(numpy.array([[1.0, 0.0]]), self.predict)
+
+        cache.predict(numpy.array([[3.0, 0.0]]), self.predict)
+        cache.predict(numpy.array([[1.0, 0.0], [2.0, 0.0]]), self.predict)
+
+        self.assertEqual([[1.0, 2.0], [3.0], [2.0]], self.predicted)
+        self.assertEqual(2 * entry_size, cache.stats()["bytes"])
+
+
+    def test_expired_entries_are_predicted_again(self):
+        cache = PredictionCache(10 ** 6, ttl=10)
+        input = numpy.array([[1.0, 0.0]])
+
+        with mock.patch("prediction_cache.time.time", return_value=100.0):
+            cache.predict(input, self.predict)
+        with mock.patch("prediction_cache.time.time", return_value=105.0):
+            cache.predict(input, self.predict)
+        with mock.patch("prediction_cache.time.time", return_value=120.0):
+            cache.predict(input, self.predict)
+
+        self.assertEqual(2, len(self.predicted))
+        self.assertEqual(1, cache.stats()["entries"])
+
+
+    @skipUnless(HAS_PANDAS, "pandas is not installed")
+    def test_data_frame_rows_are_cached(self):
+        import pandas as pd
+        cache = PredictionCache(10 ** 6)
+        predict = lambda frame: frame["a"].values * 2
+        cache.predict(pd.DataFrame({"a": [1, 2]}), predict)
+
+        result = cache.predict(pd.DataFrame({"a": [3, 2]}), predict)
+
+        numpy.testing.assert_array_equal([6, 4], result)
+        self.assertEqual(1, cache.stats()["hits"])
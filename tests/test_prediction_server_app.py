@@ -0,0 +1,37 @@
+from unittest import TestCase, mock, skipUnless
+from . import serving_context
+import importlib.util
+
+
+HAS_SERVER = all(importlib.util.find_spec(module) is not None for module in ("numpy", "flask"))
+
+if HAS_SERVER:
+    import prediction_server_app
+
+
+@skipUnless(HAS_SERVER, "numpy or flask is not installed")
+class PreloadTest(TestCase):
+
+
+    def setUp(self):
+        patcher = mock.patch.object(prediction_server_app.ScoringService, "get_model")
+        self.get_model = patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def test_preload_model_loads_the_model_with_garbage_collection_disabled(self):
+        with mock.patch("prediction_server_app.gc") as gc:
+            gc.disable.side_effect = lambda: self.get_model.assert_not_called()
+            prediction_server_app.preload_model()
+
+        gc.disable.assert_called_once_with()
+        self.get_model.assert_called_once_with()
+        gc.collect.assert_not_called()
+
+
+    def test_preload_model_moves_the_model_to_the_oldest_generation_without_gc_freeze(self):
+        with mock.patch("prediction_server_app.gc", mock.Mock(spec=["disable", "collect"])) as gc:
+            prediction_server_app.preload_model()
+
+        self.get_model.assert_called_once_with()
+        gc.collect.assert_called_once_with()
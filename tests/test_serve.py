@@ -0,0 +1,48 @@
+from unittest import TestCase, mock
+from . import serving_context
+import importlib
+import os
+
+import serve
+
+
+class GunicornCommandTest(TestCase):
+
+
+    def reload_serve(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            importlib.reload(serve)
+        self.addCleanup(importlib.reload, serve)
+        return serve
+
+
+    def test_command_runs_the_profile_settings(self):
+        serve = self.reload_serve(MODEL_SERVER_PROFILE="gthread", MODEL_SERVER_WORKERS="3")
+
+        command = serve.gunicorn_command(serve.model_server_settings)
+
+        self.assertEqual(["gunicorn", "-c", serve.gunicorn_config], command[:3])
+        self.assertEqual("gthread", command[command.index("-k") + 1])
+        self.assertEqual("3", command[command.index("-w") + 1])
+        self.assertEqual("wsgi:app", command[-1])
+
+
+    def test_command_preloads_the_model_when_asked_to(self):
+        serve = self.reload_serve(MODEL_SERVER_PRELOAD="true")
+
+        self.assertIn("--preload", serve.gunicorn_command(serve.model_server_settings))
+
+
+    def test_command_does_not_preload_by_default(self):
+        serve = self.reload_serve(MODEL_SERVER_PRELOAD="")
+
+        self.assertNotIn("--preload", serve.gunicorn_command(serve.model_server_settings))
+
+
+    def test_command_keeps_connections_alive_longer_than_nginx_reuses_them(self):
+        serve = self.reload_serve(MODEL_SERVER_PROFILE="sync", MODEL_SERVER_UPSTREAM_KEEPALIVE="16")
+
+        command = serve.gunicorn_command(serve.model_server_settings)
+
+        self.assertEqual(str(serve.gunicorn_keepalive), command[command.index("--keep-alive") + 1])
+        self.assertIn("keepalive 16;", serve.nginx_settings["upstream_keepalive"])
@@ -0,0 +1,181 @@
+from unittest import TestCase, mock
+from . import serving_context
+import os
+import tempfile
+
+import serving_profile
+from serving_profile import profiles, auto_profile, serving_settings, blas_environment, LARGE_MODEL_BYTES
+
+
+class ServingProfileTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def model_file(self, name, size):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as file:
+            file.truncate(size)
+        return path
+
+
+    def test_profiles_share_the_cores(self):
+        settings = profiles(8)
+
+        self.assertEqual(("gevent", 8, 0), (settings["gevent"]["worker_class"], settings["gevent"]["workers"],
+                                             settings["gevent"]["blas_threads"]))
+        self.assertEqual(("sync", 8, 1, 1), (settings["sync"]["worker_class"], settings["sync"]["workers"],
+                                              settings["sync"]["blas_threads"], settings["sync"]["cpu_affinity"]))
+        self.assertEqual(("gthread", 4, 4, 2, 16),
+                         tuple(settings["gthread"][setting]
+                               for setting in ("worker_class", "workers", "threads", "blas_threads",
+                                               "upstream_keepalive")))
+
+
+    def test_gthread_profile_of_a_single_core(self):
+        settings = profiles(1)["gthread"]
+
+        self.assertEqual((1, 1), (settings["workers"], settings["blas_threads"]))
+
+
+    def test_auto_profile_of_a_single_core_runs_threads(self):
+        settings = auto_profile(1, self.model_file("model.pkl", 10))
+
+        self.assertEqual(("gthread", 1, 4), (settings["worker_class"], settings["workers"], settings["threads"]))
+
+
+    def test_auto_profile_of_small_models_runs_a_pinned_sync_worker_per_core(self):
+        settings = auto_profile(8, self.model_file("model.pkl", 10))
+
+        self.assertEqual(("sync", 8, 1, 1, 2), tuple(settings[setting] for setting in (
+            "worker_class", "workers", "blas_threads", "cpu_affinity", "nginx_workers")))
+
+
+    def test_auto_profile_of_large_pickled_models_runs_fewer_workers(self):
+        settings = auto_profile(8, self.model_file("model.pkl", LARGE_MODEL_BYTES))
+
+        self.assertEqual(("gthread", 2, 4, 4, 8), tuple(settings[setting] for setting in (
+            "worker_class", "workers", "threads", "blas_threads", "upstream_keepalive")))
+
+
+    def test_auto_profile_of_large_memory_mapped_models_runs_a_worker_per_core(self):
+        for name in ("model.npy", "model.joblib"):
+            settings = auto_profile(4, self.model_file(name, LARGE_MODEL_BYTES))
+
+            self.assertEqual(("sync", 4, 1), (settings["worker_class"], settings["workers"],
+                                               settings["nginx_workers"]))
+
+
+    def test_auto_profile_without_model(self):
+        settings = auto_profile(2, os.path.join(self.directory.name, "missing.pkl"))
+
+        self.assertEqual(("sync", 2), (settings["worker_class"], settings["workers"]))
+
+
+    def test_default_profile_is_gevent(self):
+        self.assertEqual(profiles(4)["gevent"], serving_settings({}, 4))
+
+
+    def test_auto_profile_finds_the_model(self):
+        environ = {"MODEL_SERVER_PROFILE": "AUTO",
+                   "MODEL_SERVER_MODEL_PATH": self.model_file("model.pkl", LARGE_MODEL_BYTES)}
+
+        with mock.patch.dict(os.environ, environ):
+            settings = serving_settings(environ, 4)
+
+        self.assertEqual(("gthread", 1), (settings["worker_class"], settings["workers"]))
+
+
+    def test_environment_overrides_profile_settings(self):
+        settings = serving_settings({"MODEL_SERVER_PROFILE": "sync", "MODEL_SERVER_WORKERS": "3",
+                                     "MODEL_SERVER_WORKER_CLASS": "gthread", "MODEL_SERVER_THREADS": "",
+                                     "MODEL_SERVER_UPSTREAM_KEEPALIVE": "32"}, 8)
+
+        self.assertEqual(("gthread", 3, 1, 32), tuple(settings[setting] for setting in (
+            "worker_class", "workers", "threads", "upstream_keepalive")))
+
+
+    def test_unknown_profile_or_worker_class_raises(self):
+        with self.assertRaises(ValueError):
+            serving_settings({"MODEL_SERVER_PROFILE": "fast"}, 4)
+        with self.assertRaises(ValueError):
+            serving_settings({"MODEL_SERVER_WORKER_CLASS": "eventlet"}, 4)
+
+
+    def test_blas_environment_caps_thread_pools_unless_set(self):
+        environ = blas_environment(profiles(8)["gthread"], {"MKL_NUM_THREADS": "8", "PATH": "/bin"})
+
+        self.assertEqual("2", environ["OMP_NUM_THREADS"])
+        self.assertEqual("2", environ["OPENBLAS_NUM_THREADS"])
+        self.assertEqual("8", environ["MKL_NUM_THREADS"])
+        self.assertEqual("/bin", environ["PATH"])
+        self.assertNotIn("MODEL_SERVER_CPU_SETS", environ)
+
+
+    def test_blas_environment_leaves_default_thread_pools(self):
+        environ = blas_environment(profiles(8)["gevent"], {})
+
+        for variable in serving_profile.BLAS_THREAD_VARIABLES:
+            self.assertNotIn(variable, environ)
+
+
+class CPULayoutTest(TestCase):
+
+
+    def test_boolean_values_of_cpu_affinity(self):
+        for value, expected in [("1", 1), ("true", 1), ("Yes", 1), ("0", 0), ("false", 0), ("no", 0)]:
+            settings = serving_settings({"MODEL_SERVER_PROFILE": "sync", "MODEL_SERVER_CPU_AFFINITY": value}, 4)
+
+            self.assertEqual(expected, settings["cpu_affinity"], value)
+
+
+    def test_parse_cpu_layout(self):
+        self.assertEqual((4, 2), serving_profile.parse_cpu_layout("4x2"))
+        self.assertEqual((3, 1), serving_profile.parse_cpu_layout("3X1"))
+        for layout in ("4", "4x", "ax2", "0x2", "4x2x1"):
+            with self.assertRaises(ValueError):
+                serving_profile.parse_cpu_layout(layout)
+
+
+    def test_cpu_layout_sets_pinned_workers_and_blas_threads(self):
+        settings = serving_settings({"MODEL_SERVER_CPU_LAYOUT": "2x3", "MODEL_SERVER_BLAS_THREADS": "2"}, 8)
+
+        self.assertEqual(("gevent", 2, 2, 1), tuple(settings[setting] for setting in (
+            "worker_class", "workers", "blas_threads", "cpu_affinity")))
+
+
+    def test_cpu_sets_are_disjoint_when_the_cpus_suffice(self):
+        with mock.patch("builtins.print") as print:
+            sets = serving_profile.cpu_sets([2, 3, 4, 5, 6], 2, 2)
+
+        self.assertEqual([[2, 3], [4, 5]], sets)
+        print.assert_not_called()
+
+
+    def test_cpu_sets_wrap_around_with_a_warning(self):
+        with mock.patch("builtins.print") as print:
+            sets = serving_profile.cpu_sets([0, 1, 2], 2, 2)
+
+        self.assertEqual([[0, 1], [2, 0]], sets)
+        self.assertIn("share CPUs", print.call_args[0][0])
+
+
+    def test_blas_environment_lists_cpu_sets_of_pinned_workers(self):
+        settings = serving_settings({"MODEL_SERVER_CPU_LAYOUT": "2x2"}, 4)
+
+        environ = blas_environment(settings, {}, cpus=[0, 1, 2, 3])
+
+        self.assertEqual("0,1;2,3", environ["MODEL_SERVER_CPU_SETS"])
+        self.assertEqual("2", environ["OMP_NUM_THREADS"])
+
+
+    def test_blas_environment_pins_workers_without_blas_threads_to_a_cpu(self):
+        settings = serving_settings({"MODEL_SERVER_CPU_AFFINITY": "true"}, 2)
+
+        self.assertEqual("0;1", blas_environment(settings, {}, cpus=[0, 1])["MODEL_SERVER_CPU_SETS"])
@@ -0,0 +1,202 @@
+from unittest import TestCase
+from valohai_sagemaker.shell import CommandRunner, AsyncCommandRunner
+import asyncio
+import io
+import sys
+import time
+
+
+class FailingStream(object):
+    """Text stream of a process whose reading fails after its first line."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = stream.buffer
+        self.read_lines = 0
+
+    def readline(self):
+        self.read_lines += 1
+        if self.read_lines > 1:
+            raise UnicodeError("bad output")
+        return self.stream.readline()
+
+
+class FailingCommandRunner(CommandRunner):
+    """CommandRunner failing to read the stdout of the processes after its first line."""
+
+    def _pump(self, istream, name, lines, errors):
+        super()._pump(FailingStream(istream) if name == "stdout" else istream, name, lines, errors)
+
+
+class CommandRunnerTest(TestCase):
+
+
+    def run_python(self, runner, code, **kwargs):
+        return runner.run([sys.executable, "-c", code], **kwargs)
+
+
+    def test_run_returns_process_return_code(self):
+        runner = CommandRunner()
+
+        self.assertEqual(3, self.run_python(runner, "import sys; sys.exit(3)", verbose=False))
+
+
+    def test_run_collects_stdout_and_stderr_separately(self):
+        runner = CommandRunner()
+
+        self.run_python(runner, "import sys; print('out'); print('err', file=sys.stderr)",
+                        verbose=False)
+
+        self.assertEqual("out\n", runner.stdout)
+        self.assertEqual("err\n", runner.stderr)
+
+
+    def test_run_does_not_block_when_stderr_fills_its_pipe_before_stdout_ends(self):
+        runner = CommandRunner()
+        code = "import sys; sys.stderr.write('e' * 10**6 + '\\n'); sys.stderr.flush(); print('done')"
+
+        self.assertEqual(0, self.run_python(runner, code, verbose=False))
+
+        self.assertEqual("done\n", runner.stdout)
+        self.assertEqual(10**6 + 1, len(runner.stderr))
+
+
+    def test_run_writes_output_when_verbose(self):
+        runner = CommandRunner()
+        output = io.StringIO()
+
+        self.run_python(runner, "print('line')", output=output)
+
+        self.assertEqual("line\n", output.getvalue())
+
+
+    def test_run_prefixes_timestamps_when_asked_to(self):
+        runner = CommandRunner(timestamps=True)
+        output = io.StringIO()
+
+        self.run_python(runner, "print('line')", output=output)
+
+        self.assertRegex(output.getvalue(), r"^\[\d\d:\d\d:\d\d\.\d{3}\] line\n$")
+        self.assertEqual("stdout", runner.lines[0][1])
+
+
+    def test_run_keeps_lines_only_once_without_timestamps(self):
+        runner = CommandRunner()
+
+        self.run_python(runner, "print('line')", verbose=False)
+
+        self.assertEqual("line\n", runner.stdout)
+        self.assertIsNone(runner.lines)
+
+
+    def test_run_replaces_output_that_is_not_utf8(self):
+        runner = CommandRunner()
+        code = "import sys\nfor i in range(10**5): sys.stdout.buffer.write(b'ok\\n\\xff\\xfe bad\\n')"
+
+        self.assertEqual(0, self.run_python(runner, code, verbose=False))
+
+        self.assertEqual(2 * 10**5, len(runner.out))
+        self.assertEqual("\ufffd\ufffd bad\n", runner.out[-1])
+
+
+    def test_run_drains_and_raises_errors_reading_output(self):
+        runner = FailingCommandRunner()
+        code = "import sys; sys.stdout.write('line\\n' * 10**5); print('err', file=sys.stderr)"
+
+        with self.assertRaises(UnicodeError):
+            self.run_python(runner, code, verbose=False)
+
+        self.assertEqual("line\n", runner.stdout)
+        self.assertEqual("err\n", runner.stderr)
+
+
+    def test_run_keeps_only_last_lines_with_max_lines(self):
+        runner = CommandRunner(max_lines=2)
+
+        self.run_python(runner, "for i in range(10): print(i)", verbose=False)
+
+        self.assertEqual("8\n9\n", runner.stdout)
+
+
+    def test_run_feeds_standard_input_from_stdin_writer(self):
+        runner = CommandRunner()
+
+        def write(stream):
+            for _ in range(100):
+                stream.write(b"x" * 10000)
+
+        self.run_python(runner, "import sys; print(len(sys.stdin.buffer.read()))",
+                        verbose=False, stdin_writer=write)
+
+        self.assertEqual("1000000\n", runner.stdout)
+
+
+    def test_run_raises_stdin_writer_errors(self):
+        runner = CommandRunner()
+
+        def write(stream):
+            raise IOError("cannot read input")
+
+        with self.assertRaises(IOError):
+            self.run_python(runner, "import sys; sys.stdin.read()", verbose=False, stdin_writer=write)
+
+
+    def test_reset_clears_collected_output(self):
+        runner = CommandRunner()
+        self.run_python(runner, "print('line')", verbose=False)
+
+        runner.reset()
+
+        self.assertEqual("", runner.stdout)
+        self.assertEqual("", runner.stderr)
+
+
+class AsyncCommandRunnerTest(TestCase):
+
+
+    def run_python(self, runner, code, **kwargs):
+        return asyncio.run(runner.run([sys.executable, "-c", code], **kwargs))
+
+
+    def test_run_returns_process_return_code(self):
+        runner = AsyncCommandRunner()
+
+        self.assertEqual(3, self.run_python(runner, "import sys; sys.exit(3)", verbose=False))
+
+
+    def test_run_collects_stdout_and_stderr_separately(self):
+        runner = AsyncCommandRunner()
+
+        self.run_python(runner, "import sys; print('out'); print('err', file=sys.stderr)",
+                        verbose=False)
+
+        self.assertEqual("out\n", runner.stdout)
+        self.assertEqual("err\n", runner.stderr)
+
+
+    def test_run_feeds_standard_input_from_stdin_writer(self):
+        runner = AsyncCommandRunner()
+
+        self.run_python(runner, "import sys; print(sys.stdin.read())", verbose=False,
+                        stdin_writer=lambda stream: stream.write(b"input"))
+
+        self.assertEqual("input\n", runner.stdout)
+
+
+    def test_run_kills_process_on_timeout(self):
+        runner = AsyncCommandRunner()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_python(runner, "import time; time.sleep(30)", verbose=False, timeout=0.2)
+
+
+    def test_runs_are_concurrent(self):
+        async def run_all():
+            return await asyncio.gather(*[
+                AsyncCommandRunner().run([sys.executable, "-c", "import time; time.sleep(0.5)"],
+                                         verbose=False)
+                for _ in range(4)])
+
+        start = time.monotonic()
+        self.assertEqual([0, 0, 0, 0], asyncio.run(run_all()))
+        self.assertLess(time.monotonic() - start, 1.9)
@@ -0,0 +1,105 @@
+from unittest import TestCase
+from valohai_sagemaker.file_transformer import FileTransformer
+from valohai_sagemaker.transformation_cache import TransformationCache
+import os
+import tempfile
+
+
+class UpperCaseTransformer(FileTransformer):
+
+
+    def __init__(self):
+        self.transformed_called = 0
+
+
+    @property
+    def transforming(self):
+        return ".txt", ".upper"
+
+
+    def transform(self, input_filename, output_filename):
+        self.transformed_called += 1
+        with open(input_filename) as input_file, open(output_filename, "w") as output_file:
+            output_file.write(input_file.read().upper())
+
+
+class TransformationCacheTest(TestCase):
+
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_directory = os.path.join(self.directory.name, "cache")
+        self.source = os.path.join(self.directory.name, "source.txt")
+        self.write_source("content")
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def write_source(self, content):
+        with open(self.source, "w") as file:
+            file.write(content)
+
+
+    def read(self, filename):
+        with open(filename) as file:
+            return file.read()
+
+
+    def test_transformed_file_holds_transformation_result(self):
+        cache = TransformationCache(self.cache_directory)
+
+        self.assertEqual("CONTENT", self.read(cache.transformed_file(UpperCaseTransformer(), self.source)))
+
+
+    def test_unchanged_file_is_transformed_once(self):
+        cache = TransformationCache(self.cache_directory)
+        transformer = UpperCaseTransformer()
+
+        first = cache.transformed_file(transformer, self.source)
+        second = TransformationCache(self.cache_directory).transformed_file(transformer, self.source)
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, transformer.transformed_called)
+        self.assertEqual(1, cache.misses)
+
+
+    def test_changed_file_is_transformed_again(self):
+        cache = TransformationCache(self.cache_directory)
+        transformer = UpperCaseTransformer()
+        cache.transformed_file(transformer, self.source)
+
+        self.write_source("other")
+
+        self.assertEqual("OTHER", self.read(cache.transformed_file(transformer, self.source)))
+        self.assertEqual(2, transformer.transformed_called)
+
+
+    def test_transformer_version_is_part_of_the_key(self):
+        cache = TransformationCache(self.cache_directory)
+        transformer = UpperCaseTransformer()
+        key = cache.key(transformer, self.source)
+
+        transformer.version = "2"
+
+        self.assertNotEqual(key, cache.key(transformer, self.source))
+
+
+    def test_least_recently_used_entries_are_evicted_above_max_size(self):
+        cache = TransformationCache(self.cache_directory, max_size=15)
+        transformer = UpperCaseTransformer()
+
+        first = cache.transformed_file(transformer, self.source)
+        os.utime(first, ns=(0, 0))
+        self.write_source("other content")
+        second = cache.transformed_file(transformer, self.source)
+
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+
+    def test_no_file_is_written_next_to_the_source(self):
+        TransformationCache(self.cache_directory).transformed_file(UpperCaseTransformer(), self.source)
+
+        self.assertEqual(["cache", "source.txt"], sorted(os.listdir(self.directory.name)))
@@ -0,0 +1,59 @@
+import json
+from .path import PathDelegate
+
+
+class BuildCache(object):
+    """
+    A local record of the digest each image tag was last built from.
+    It is used by Image.build to skip "docker build" when nothing changed.
+    """
+
+
+    def __init__(self, path, path_delegate=None):
+        """
+        :param path: json file in which the digests are stored.
+        :param path_delegate: path handling abstraction class,
+                              you most likely don't need to use it.
+        """
+        self.path = path
+        self.path_delegate = path_delegate
+        self.digests = None
+
+        if self.path_delegate is None:
+            self.path_delegate = PathDelegate()
+
+
+    def load(self):
+        if self.digests is not None:
+            return self.digests
+
+        self.digests = {}
+        if self.path_delegate.exists(self.path):
+            try:
+                self.digests = json.loads(self.path_delegate.read_file(self.path))
+            except ValueError:
+                pass
+        return self.digests
+
+
+    def is_up_to_date(self, tagged_name, digest):
+        """
+        :returns: bool -- whether :param tagged_name: was last built from :param digest:.
+        """
+        return self.load().get(tagged_name) == digest
+
+
+    def store(self, tagged_name, digest):
+        self.load()[tagged_name] = digest
+        self.path_delegate.write_file(self.path, json.dumps(self.digests, sort_keys=True, indent=2))
+
+
+    def invalidate(self, tagged_name=None):
+        """
+        Forgets the digest of :param tagged_name:, or of every image if None.
+        """
+        if tagged_name is None:
+            self.digests = {}
+        else:
+            self.load().pop(tagged_name, None)
+        self.path_delegate.write_file(self.path, json.dumps(self.digests, sort_keys=True, indent=2))
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import re
+import sys
+import time
+from collections import OrderedDict
+from .concurrency import gather_limited
+from .path import PathDelegate
+from .shell import AsyncCommandRunner
+
+
+# Instructions that depend on the build context, which differs between images.
+CONTEXT_INSTRUCTION = re.compile(r"^\s*(COPY|ADD)\s", re.IGNORECASE)
+FROM_INSTRUCTION = re.compile(r"^\s*FROM\s", re.IGNORECASE)
+
+
+class BuildPlanReport(object):
+    """
+    Timings of a BuildPlan build, in seconds.
+    """
+
+
+    def __init__(self, base_seconds, image_seconds, wall_seconds):
+        """
+        :param base_seconds: time spent building the shared base image (0 if none).
+        :param image_seconds: {tagged name: time spent building the image on top of the base}.
+        :param wall_seconds: total time of the batch build.
+        """
+        self.base_seconds = base_seconds
+        self.image_seconds = image_seconds
+        self.wall_seconds = wall_seconds
+
+
+    @property
+    def estimated_sequential_seconds(self):
+        """
+        Estimation of building the images one after the other without a shared base,
+        each of them rebuilding the base layers.
+        """
+        return sum(self.base_seconds + seconds for seconds in self.image_seconds.values())
+
+
+    def __str__(self):
+        lines = ["shared base: {:.1f}s".format(self.base_seconds)]
+        for tagged_name, seconds in self.image_seconds.items():
+            lines.append("{}: {:.1f}s".format(tagged_name, seconds))
+        lines.append("wall time: {:.1f}s, estimated sequential time: {:.1f}s".format(
+            self.wall_seconds, self.estimated_sequential_seconds))
+        return "\n".join(lines) + "\n"
+
+
+class BuildPlan(object):
+    """
+    Builds a batch of docker.Image objects (e.g. variants of a sweep differing
+    in pip_packages or build_commands) by building once, as a shared base image,
+    the Dockerfile lines they have in common, then building every image on top
+    of that base concurrently.
+    """
+
+
+    def __init__(self, images, base_name="valohai-sagemaker-base", concurrency=None,
+                 path_delegate=None):
+        """
+        :param images: list of docker.Image objects to build.
+        :param base_name: docker name of the shared base image, tagged with the
+                          digest of its Dockerfile.
+        :param concurrency: maximum number of images built at once, None for no limit.
+                            Images sharing a code container are always built one
+                            after the other.
+        :param path_delegate: path handling abstraction class,
+                              you most likely don't need to use it.
+        :raises: ValueError -- if two images have the same docker name and tag,
+                 as the last one built would replace the other.
+        """
+        self.images = list(images)
+
+        tagged_names = [image.tagged_name for image in self.images]
+        duplicates = sorted(set(name for name in tagged_names if tagged_names.count(name) > 1))
+        if len(duplicates) > 0:
+            raise ValueError("images must have different tags, several are named {}".format(
+                ", ".join(duplicates)))
+        self.base_name = base_name
+        self.concurrency = concurrency
+        self.path_delegate = path_delegate
+        self.report = None
+
+        if self.path_delegate is None:
+            self.path_delegate = PathDelegate()
+
+
+    def shared_lines(self):
+        """
+        The Dockerfile lines every image starts with, up to the first instruction
+        depending on the build context and never in the middle of an instruction.
+
+        :returns: list -- the shared lines, empty if there is nothing worth sharing.
+        """
+        if len(self.images) < 2:
+            return []
+
+        all_lines = [image.dockerfile_lines() for image in self.images]
+
+        shared = []
+        for lines in zip(*all_lines):
+            if any(line != lines[0] for line in lines) or CONTEXT_INSTRUCTION.match(lines[0]):
+                break
+            shared.append(lines[0])
+
+        while len(shared) > 0 and shared[-1].rstrip().endswith("\\"):
+            shared.pop()
+
+        if not any(FROM_INSTRUCTION.match(line) for line in shared):
+            return []
+
+        return shared
+
+
+    def base_tag(self, shared_lines):
+        """
+        :returns: str -- docker name of the base image built from :param shared_lines:.
+        """
+        digest = hashlib.sha256("".join(shared_lines).encode("utf8")).hexdigest()
+        return "{}:{}".format(self.base_name, digest[:12])
+
+
+    async def build_base_async(self, shared_lines, verbose=True):
+        """
+        Builds the base image from :param shared_lines: and points every image to it.
+
+        :raises: RuntimeError
+        """
+        base_tag = self.base_tag(shared_lines)
+        base_path = self.path_delegate.join(self.path_delegate.current_directory(),
+                                            "{}.base".format(self.base_name))
+        self.path_delegate.create_directories(base_path)
+        self.path_delegate.write_file(self.path_delegate.join(base_path, "Dockerfile"),
+                                      "".join(shared_lines))
+
+        cmd = AsyncCommandRunner()
+        returncode = await cmd.run(["docker", "build", "-t", base_tag, base_path], verbose=verbose)
+
+        if returncode != 0:
+            raise RuntimeError("docker could not build the base image: {}".format(cmd.stderr))
+
+        for image in self.images:
+            image.base_image = (base_tag, len(shared_lines))
+
+
+    async def build_async(self, verbose=True):
+        """
+        Builds the shared base image, then every image on top of it.
+        The timings are kept in report.
+
+        :raises: RuntimeError
+        """
+        start = time.monotonic()
+
+        shared_lines = self.shared_lines()
+        if len(shared_lines) > 0:
+            await self.build_base_async(shared_lines, verbose=verbose)
+        base_seconds = time.monotonic() - start
+
+        image_seconds = OrderedDict((image.tagged_name, 0.0) for image in self.images)
+        groups = OrderedDict()
+        for image in self.images:
+            groups.setdefault(image.code_container.path, []).append(image)
+
+        async def build_group(images):
+            """nodoc"""
+            for image in images:
+                image_start = time.monotonic()
+                await image.build_async(verbose=verbose)
+                image_seconds[image.tagged_name] = time.monotonic() - image_start
+
+        await gather_limited([build_group(images) for images in groups.values()],
+                             concurrency=self.concurrency)
+
+        self.report = BuildPlanReport(base_seconds, image_seconds, time.monotonic() - start)
+        if verbose:
+            sys.stdout.write(str(self.report))
+
+        return self.report
+
+
+    def build(self, verbose=True):
+        """
+        Synchronous version of build_async.
+
+        :raises: RuntimeError
+        """
+        return asyncio.run(self.build_async(verbose=verbose))
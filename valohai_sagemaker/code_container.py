@@ -1,5 +1,22 @@
-from .path import PathDelegate
-from .template import container_template_path
+import hashlib
+import io
+import sys
+import tarfile
+import time
+from collections import OrderedDict
+from .path import PathDelegate, check_link_mode
+from .manifest import PackageManifest
+from .copy_engine import CopyEngine
+from .ignore import IgnoreMatcher, IGNORE_FILENAME
+from .template import container_template_path, CONTAINER_TEMPLATE_IGNORED
+
+
+# Packaged files up to this size are digested by content, bigger ones by
+# size and modification time (copies preserve the latter).
+CONTENT_DIGEST_MAX_SIZE = 64 * 1024
+
+# Container files that must be executable in the image.
+EXECUTABLE_FILES = ("model/train", "model/serve")
 
 
 class CodeContainer(object):
@@ -11,6 +28,8 @@ class CodeContainer(object):
     def __init__(self, name, path=None,
                  files_to_copy=[], pip_packages=[],
                  train_script="train.py", working_dir="", python_path="",
+                 incremental=False, hash_contents=False, copy_workers=None,
+                 link_mode=None, ignore_patterns=[], ignore_filename=IGNORE_FILENAME,
                  path_delegate=None):
         """
         Instantiate the object's attributes.
@@ -36,6 +55,23 @@ class CodeContainer(object):
                             inside the container.
         :param python_path: Append the python path
                             (considering the container relative paths) if needed.
+        :param incremental: when True, package() synchronizes the existing
+                            .container directory instead of recreating it:
+                            only new or modified files are copied and files
+                            that are no longer part of the container are deleted.
+        :param hash_contents: in incremental mode, compare file contents
+                              (sha256) when size or modification time changed.
+        :param copy_workers: number of threads copying files concurrently.
+                             By default, a full packaging copies whole directories
+                             one after the other and an incremental one uses a
+                             single thread.
+        :param link_mode: "hardlink" or "reflink" to link big files into the
+                          container instead of copying them, see PathDelegate.
+                          By default, the path delegate's mode ("copy") is kept.
+        :param ignore_patterns: gitignore-like patterns of files not to copy from
+                                the directories of files_to_copy, e.g. "__pycache__/".
+        :param ignore_filename: name of the file, at the root of the directories of
+                                files_to_copy, holding more ignore patterns.
         :param path_delegate: path handling abstraction class, you most likely
                               don't need to use it.
         """
@@ -48,12 +84,24 @@ class CodeContainer(object):
         self.working_dir = working_dir
         self.python_path = python_path
 
+        self.incremental = incremental
+        self.hash_contents = hash_contents
+        self.copy_workers = copy_workers
+        self.copy_report = None
+        self.ignore_patterns = list(ignore_patterns)
+        self.ignore_filename = ignore_filename
+        self.ignored = []
+
         self.path = path
         self.path_delegate = path_delegate
 
         if self.path_delegate is None:
             self.path_delegate = PathDelegate()
 
+        if link_mode is not None:
+            check_link_mode(link_mode)
+            self.path_delegate.link_mode = link_mode
+
         if self.path is None:
             self.path = "{}/{}.container".format(self.path_delegate.current_directory(), self.name)
 
@@ -84,19 +132,257 @@ class CodeContainer(object):
 
     def copy_files_to_container(self):
         """nodoc"""
+        self.ignored = []
+        files = []
         for input_filename, output_filename in self.process_files_to_copy():
             output_filepath = self.path_delegate.join(self.path, "model", "user", output_filename)
-            self.path_delegate.copy(input_filename, output_filepath)
+            ignore = self.ignore_matcher(input_filename)
+            if ignore:
+                self.copy_engine().copy((source, destination) for destination, source in
+                                        self.walk_root(input_filename, output_filepath, ignore,
+                                                       self.ignored))
+            else:
+                files.append((input_filename, output_filepath))
+
+        transformed = self.path_delegate.transform_files(files)
+        for input_filename, output_filepath in files:
+            if output_filepath not in transformed:
+                self.path_delegate.copy(input_filename, output_filepath)
+
+
+    def ignore_matcher(self, source_root):
+        """
+        :returns: IgnoreMatcher -- the ignore_patterns followed by the patterns of
+                  the ignore file at the root of the :param source_root: directory,
+                  or None if :param source_root: is not a directory.
+        """
+        if not self.path_delegate.is_directory(source_root):
+            return None
+
+        return IgnoreMatcher.from_file(self.path_delegate.join(source_root, self.ignore_filename),
+                                       self.ignore_patterns, path_delegate=self.path_delegate)
+
+
+    def walk_root(self, source_root, destination_root, ignore=None, skipped=None):
+        """
+        Yields (destination file path, source file path) for every file under
+        :param source_root:, or for :param source_root: itself if it is a file.
+        Ignored files and directories are appended to :param skipped:.
+        """
+        for relative in self.path_delegate.walk_files(source_root, ignore=ignore, skipped=skipped):
+            if relative == "":
+                yield destination_root, source_root
+            else:
+                yield self.path_delegate.join(destination_root, relative), \
+                    self.path_delegate.join(source_root, relative)
+
+
+    def ignored_size(self):
+        """
+        :returns: int -- total size, in bytes, of the files ignored by the last packaging
+                  (ignored directories are not descended into, so not measured).
+        """
+        return sum(self.path_delegate.stat(path).st_size
+                   for path, is_directory in self.ignored if not is_directory)
+
+
+    def config_files(self):
+        """
+        :returns: list -- [filename, content] of the config files of the model directory.
+        """
+        return [["append_python_path.txt", self.python_path],
+                ["working_directory.txt", self.working_dir],
+                ["train_script_location.txt", self.train_script]]
 
 
     def write_config_files(self):
-        for filename, variable in [["append_python_path.txt", self.python_path],
-                                   ["working_directory.txt", self.working_dir],
-                                   ["train_script_location.txt", self.train_script]]:
+        for filename, variable in self.config_files():
             self.path_delegate.write_file(
                 self.path_delegate.join(self.path, "model", filename), variable)
 
 
+    def container_files(self):
+        """
+        Lists every file making up the container, the template first and then the
+        files to copy, the latter overriding the former on identical destinations.
+        Files and directories excluded by the ignore patterns are left out.
+
+        :returns: OrderedDict -- {destination file path: source file path}
+        """
+        self.ignored = []
+        files = OrderedDict(self.walk_root(container_template_path(), self.path,
+                                           IgnoreMatcher(CONTAINER_TEMPLATE_IGNORED)))
+
+        for input_filename, output_filename in self.process_files_to_copy():
+            files.update(self.walk_root(
+                input_filename, self.path_delegate.join(self.path, "model", "user", output_filename),
+                self.ignore_matcher(input_filename), self.ignored))
+        return files
+
+
+    def sync_container(self):
+        """
+        Brings the .container directory up to date with the template and the files
+        to copy, using the manifest stored in it to only copy what changed
+        and to delete what is no longer part of the container.
+        """
+        manifest = PackageManifest(self.path, hash_contents=self.hash_contents,
+                                   path_delegate=self.path_delegate)
+
+        if not manifest.load() and self.path_delegate.exists(self.path):
+            self.path_delegate.remove(self.path)
+
+        files = self.container_files()
+        # the config files are rewritten by write_config_files after every packaging
+        for filename, _ in self.config_files():
+            files.pop(self.path_delegate.join(self.path, "model", filename), None)
+
+        for destination in manifest.stale(files.keys()):
+            if self.path_delegate.exists(destination):
+                self.path_delegate.remove(destination)
+                self.path_delegate.prune_empty_directories(
+                    self.path_delegate.dirname(destination), self.path)
+            manifest.forget(destination)
+
+        outdated = [(source, destination) for destination, source in files.items()
+                    if not manifest.is_up_to_date(source, destination)]
+        self.copy_report = self.copy_engine().copy(outdated)
+
+        for source, destination in outdated:
+            manifest.record(source, destination)
+
+        manifest.save()
+
+
+    def copy_engine(self):
+        """
+        :returns: CopyEngine -- the engine copying the container files.
+        """
+        return CopyEngine(workers=self.copy_workers if self.copy_workers is not None else 1,
+                          path_delegate=self.path_delegate)
+
+
+    def file_fingerprint(self, filename):
+        """
+        :returns: tuple -- the size of :param filename: and its content digest
+                  (small files or hash_contents) or modification time.
+        """
+        stat = self.path_delegate.stat(filename)
+
+        if self.hash_contents or stat.st_size <= CONTENT_DIGEST_MAX_SIZE:
+            return stat.st_size, self.path_delegate.file_digest(filename)
+        return stat.st_size, stat.st_mtime_ns
+
+
+    def transformed_fingerprints(self):
+        """
+        Fingerprints the container files written by a file transformer by their
+        source and transformer, as their modification time changes on every
+        packaging.
+
+        :returns: dict -- {destination file path: (source size, source fingerprint
+                  and transformer identity)}.
+        """
+        fingerprints = {}
+
+        for destination, source in self.container_files().items():
+            transformer = self.path_delegate.transformer(source, destination)
+            if transformer is not None:
+                size, fingerprint = self.file_fingerprint(source)
+                fingerprints[destination] = size, "{}:{}.{}:{}".format(
+                    fingerprint, type(transformer).__module__, type(transformer).__name__, transformer.version)
+        return fingerprints
+
+
+    def content_digest(self, excluded=("Dockerfile", PackageManifest.FILENAME)):
+        """
+        Digests the packaged .container directory: relative paths, sizes, and the
+        content of small files (or of every file with hash_contents) or the
+        modification time of big ones. Transformed files are digested by their
+        source and transformer (see transformed_fingerprints). Must be called
+        after package().
+
+        :param excluded: container-relative paths left out of the digest.
+        :returns: str -- hexadecimal sha256 digest.
+        """
+        digest = hashlib.sha256()
+        transformed = self.transformed_fingerprints()
+
+        for relative in self.path_delegate.walk_files(self.path):
+            if relative in excluded:
+                continue
+
+            filename = self.path_delegate.join(self.path, relative)
+            size, fingerprint = transformed[filename] if filename in transformed \
+                else self.file_fingerprint(filename)
+            digest.update("{}\0{}\0{}\n".format(relative, size, fingerprint).encode("utf8"))
+
+        return digest.hexdigest()
+
+
+    def source_digest(self):
+        """
+        Digests what the container is made of, like content_digest, but from the
+        source files and config values, without requiring package().
+
+        :returns: str -- hexadecimal sha256 digest.
+        """
+        digest = hashlib.sha256()
+
+        for destination, source in self.container_files().items():
+            size, fingerprint = self.file_fingerprint(source)
+            digest.update("{}\0{}\0{}\n".format(self.path_delegate.relative_path(destination, self.path),
+                                                 size, fingerprint).encode("utf8"))
+
+        for filename, variable in self.config_files():
+            digest.update("{}\0{}\n".format(filename, variable).encode("utf8"))
+
+        return digest.hexdigest()
+
+
+    def write_context_tar(self, stream, extra_files={}):
+        """
+        Writes the container, laid out as package() would write it, as a tar stream
+        to :param stream: (e.g. the input of "docker build -"), without writing
+        the .container directory. Files are read, or transformed, one at a time.
+
+        :param extra_files: {path in the archive: str or bytes content} of additional
+                            files, like the Dockerfile.
+        """
+        def add_content(tar, arcname, content):
+            """nodoc"""
+            if isinstance(content, str):
+                content = content.encode("utf8")
+            info = tarfile.TarInfo(arcname)
+            info.size = len(content)
+            info.mtime = int(time.time())
+            info.mode = 0o755 if arcname in EXECUTABLE_FILES else 0o644
+            tar.addfile(info, io.BytesIO(content))
+
+        contents = OrderedDict((self.path_delegate.join("model", filename), variable)
+                               for filename, variable in self.config_files())
+        contents.update(extra_files)
+
+        with tarfile.open(fileobj=stream, mode="w|") as tar:
+            for destination, source in self.container_files().items():
+                arcname = self.path_delegate.relative_path(destination, self.path)
+                if arcname in contents:
+                    continue
+
+                # transformed files are streamed from the cache or a temporary file,
+                # symbolic links archived as the files they point to, like package() copies them
+                with self.path_delegate.transformed_file(source, destination) as transformed:
+                    filename = transformed or self.path_delegate.realpath(source)
+                    info = tar.gettarinfo(filename, arcname)
+                    if arcname in EXECUTABLE_FILES:
+                        info.mode |= 0o755
+                    with open(filename, "rb") as source_file:
+                        tar.addfile(info, source_file)
+
+            for arcname, content in contents.items():
+                add_content(tar, arcname, content)
+
+
     def package(self):
         """
         Writes the container directory and its content to a .container directory.
@@ -108,8 +394,21 @@ class CodeContainer(object):
                                "could not find template resource directory: {}"\
                                .format("container_template_path()"))
 
-        if self.path_delegate.exists(self.path):
-            self.path_delegate.remove(self.path)
-        self.path_delegate.copy(container_template_path(), self.path)
-        self.copy_files_to_container()
+        if self.incremental:
+            self.sync_container()
+        else:
+            if self.path_delegate.exists(self.path):
+                self.path_delegate.remove(self.path)
+            if self.copy_workers is None:
+                self.path_delegate.copy(container_template_path(), self.path, ignored=CONTAINER_TEMPLATE_IGNORED)
+                self.copy_files_to_container()
+            else:
+                self.copy_report = self.copy_engine().copy(
+                    (source, destination) for destination, source in self.container_files().items())
         self.write_config_files()
+
+        if len(self.ignored) > 0:
+            sys.stdout.write("{}: ignored {} bytes in {} file(s), and {} directory(ies)\n".format(
+                self.name, self.ignored_size(),
+                len([path for path, is_directory in self.ignored if not is_directory]),
+                len([path for path, is_directory in self.ignored if is_directory])))
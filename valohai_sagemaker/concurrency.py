@@ -0,0 +1,27 @@
+import asyncio
+
+
+async def gather_limited(awaitables, concurrency=None, return_exceptions=False):
+    """
+    Awaits :param awaitables: together, like asyncio.gather, but with at most
+    :param concurrency: of them running at once (None for no limit).
+    Useful to fan out builds, pushes or executions, e.g.:
+
+    asyncio.run(gather_limited([image.train_async() for image in images], concurrency=2))
+
+    :returns: list -- the results, in the order of :param awaitables:.
+    """
+    if concurrency is None:
+        return await asyncio.gather(*awaitables, return_exceptions=return_exceptions)
+
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1, got {}".format(concurrency))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(awaitable):
+        """nodoc"""
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*map(limited, awaitables), return_exceptions=return_exceptions)
@@ -0,0 +1,82 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .path import PathDelegate
+
+
+class CopyReport(object):
+    """
+    Amount of data copied by a CopyEngine and how long it took.
+    """
+
+
+    def __init__(self, files, size, seconds):
+        self.files = files
+        self.size = size
+        self.seconds = seconds
+
+
+    @property
+    def bytes_per_second(self):
+        return self.size / self.seconds if self.seconds > 0 else 0.0
+
+
+    def __str__(self):
+        return "copied {} file(s), {:.1f} MB in {:.2f}s ({:.1f} MB/s)".format(
+            self.files, self.size / 1e6, self.seconds, self.bytes_per_second / 1e6)
+
+
+class CopyEngine(object):
+    """
+    Copies many files at once with a pool of threads, copying being mostly
+    I/O bound. The list of files is known up front (see CodeContainer.container_files),
+    so destination directories are created and the files needing a transformation
+    transformed (see PathDelegate.transform_files) before any copy starts.
+    """
+
+
+    def __init__(self, workers=None, path_delegate=None):
+        """
+        :param workers: number of copying threads, by default
+                        twice the number of CPUs (at most 32).
+        :param path_delegate: path handling abstraction class,
+                              you most likely don't need to use it.
+        """
+        self.workers = workers
+        self.path_delegate = path_delegate
+
+        if self.workers is None:
+            self.workers = min(32, 2 * (os.cpu_count() or 1))
+
+        if self.path_delegate is None:
+            self.path_delegate = PathDelegate()
+
+
+    def copy(self, files):
+        """
+        :param files: iterable of (source file, destination file) pairs.
+        :returns: CopyReport
+        """
+        files = list(files)
+        start = time.monotonic()
+
+        for directory in sorted(set(self.path_delegate.dirname(destination)
+                                    for _, destination in files)):
+            self.path_delegate.create_directories(directory)
+
+        transformed = self.path_delegate.transform_files(files)
+
+        def copy_one(pair):
+            """nodoc"""
+            source, destination = pair
+            if destination not in transformed:
+                self.path_delegate.copy(source, destination)
+            return self.path_delegate.stat(source).st_size
+
+        if self.workers > 1 and len(files) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                size = sum(pool.map(copy_one, files))
+        else:
+            size = sum(map(copy_one, files))
+
+        return CopyReport(len(files), size, time.monotonic() - start)
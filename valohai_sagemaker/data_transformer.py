@@ -0,0 +1,171 @@
+import csv
+import importlib
+import struct
+from .file_transformer import FileTransformer
+
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+# largest shape the header space is reserved for, the row count being known last
+NPY_MAX_ROWS = 2 ** 63 - 1
+
+
+def import_optional(module_name, package_name):
+    """
+    Imports a module of an optional dependency.
+
+    :raises: ImportError -- telling which package to install.
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as error:
+        raise ImportError("this transformation requires {0}, install it with: pip install {0}".format(
+            package_name)) from error
+
+
+def npy_header(descr, shape, length=None):
+    """
+    Builds a version 1.0 .npy header.
+
+    :param descr: numpy dtype string, e.g. "<f4".
+    :param shape: tuple -- shape of the array.
+    :param length: total header length to pad to, by default the smallest
+                   one keeping the data aligned on 64 bytes.
+    :returns: bytes
+    """
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(descr, tuple(shape))
+    header_length = len(NPY_MAGIC) + 2 + len(header) + 1
+    if length is None:
+        length = header_length + (-header_length % 64)
+    if header_length > length:
+        raise ValueError("the .npy header of shape {} does not fit in {} bytes".format(shape, length))
+
+    header += " " * (length - header_length) + "\n"
+    return NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class CSVToNPYTransformer(FileTransformer):
+    """
+    Transforms a numeric CSV file (.csv) to a 2D numpy array file (.npy),
+    which the training script can open without parsing nor copying it:
+    numpy.load(filename, mmap_mode="r").
+    The CSV file is converted a chunk of rows at a time, never loaded whole.
+    Requires numpy.
+    """
+
+
+    def __init__(self, dtype="float32", delimiter=",", header=True, chunk_rows=65536):
+        """
+        :param dtype: numpy dtype of the array.
+        :param delimiter: CSV field delimiter.
+        :param header: whether the first CSV row holds column names, skipped.
+        :param chunk_rows: number of rows converted at once.
+        """
+        self.dtype = dtype
+        self.delimiter = delimiter
+        self.header = header
+        self.chunk_rows = chunk_rows
+
+
+    @property
+    def transforming(self):
+        return ".csv", ".npy"
+
+
+    @property
+    def version(self):
+        return "1:{}:{}:{}".format(self.dtype, self.delimiter, self.header)
+
+
+    def transform(self, input_filename, output_filename):
+        """
+        :raises: ValueError -- if the rows do not all have the same number of columns.
+        """
+        numpy = import_optional("numpy", "numpy")
+        descr = numpy.dtype(self.dtype).str
+
+        with open(input_filename, "r", newline="", encoding="utf8") as input_file, \
+                open(output_filename, "wb") as output_file:
+            reader = csv.reader(input_file, delimiter=self.delimiter)
+            if self.header:
+                next(reader, None)
+
+            columns, rows, chunk = None, 0, []
+
+            def write_chunk():
+                """nodoc"""
+                output_file.write(numpy.asarray(chunk, dtype=descr).tobytes())
+                chunk.clear()
+
+            for row in reader:
+                if len(row) == 0:
+                    continue
+                if columns is None:
+                    columns = len(row)
+                    reserved = len(npy_header(descr, (NPY_MAX_ROWS, columns)))
+                    output_file.write(b"\0" * reserved)
+                elif len(row) != columns:
+                    raise ValueError("{}: row {} has {} columns, {} expected".format(
+                        input_filename, rows + 1, len(row), columns))
+
+                chunk.append(row)
+                rows += 1
+                if len(chunk) >= self.chunk_rows:
+                    write_chunk()
+
+            if columns is None:
+                output_file.write(npy_header(descr, (0, 0)))
+                return
+            if len(chunk) > 0:
+                write_chunk()
+
+            output_file.seek(0)
+            output_file.write(npy_header(descr, (rows, columns), length=reserved))
+
+
+class CSVToParquetTransformer(FileTransformer):
+    """
+    Transforms a CSV file (.csv) to a compressed, columnar Parquet file (.parquet),
+    with column types inferred from the data. The CSV file is read and written
+    a block at a time, each block becoming a row group, so it is never loaded whole
+    and the transformation can stream in a chain of transformers.
+    Requires pyarrow.
+    """
+
+
+    def __init__(self, delimiter=",", block_size=1 << 24, compression="snappy"):
+        """
+        :param delimiter: CSV field delimiter.
+        :param block_size: bytes of CSV read at once.
+        :param compression: Parquet compression codec.
+        """
+        self.delimiter = delimiter
+        self.block_size = block_size
+        self.compression = compression
+
+
+    @property
+    def transforming(self):
+        return ".csv", ".parquet"
+
+
+    @property
+    def version(self):
+        return "1:{}:{}".format(self.delimiter, self.compression)
+
+
+    def transform(self, input_filename, output_filename):
+        with open(input_filename, "rb") as input_stream, open(output_filename, "wb") as output_stream:
+            self.transform_stream(input_stream, output_stream)
+
+
+    def transform_stream(self, input_stream, output_stream):
+        pyarrow_csv = import_optional("pyarrow.csv", "pyarrow")
+        parquet = import_optional("pyarrow.parquet", "pyarrow")
+
+        reader = pyarrow_csv.open_csv(input_stream,
+                                      read_options=pyarrow_csv.ReadOptions(block_size=self.block_size),
+                                      parse_options=pyarrow_csv.ParseOptions(delimiter=self.delimiter))
+
+        with parquet.ParquetWriter(output_stream, reader.schema, compression=self.compression) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
@@ -1,6 +1,90 @@
-from .shell import CommandRunner
+import asyncio
+import functools
+import hashlib
+import json
+import re
+import sys
+from .shell import CommandRunner, AsyncCommandRunner
 from .path import PathDelegate
-from .template import docker_template_path
+from .build_cache import BuildCache
+from .template import container_template_path, docker_template_path
+
+
+REQUIREMENTS_FILENAME = "requirements.txt"
+# Compiles the model and user code to .pyc files at build time: unchecked-hash
+# .pyc files (never validated against their source) when the interpreter knows
+# them (python >= 3.7), timestamp ones otherwise. Code that does not compile is
+# reported and left to fail at import time.
+PRECOMPILE_COMMAND = "python3.6 -m compileall -q -j 0 $(python3.6 -c 'import sys; " \
+                     "print(\"--invalidation-mode unchecked-hash\" if sys.version_info >= (3, 7) else \"\")') " \
+                     "/opt/program || true"
+
+
+class LayerCacheReport(object):
+    """
+    Which Dockerfile instructions of a build were served from docker's layer cache,
+    as parsed from the output of either the classic builder or BuildKit.
+    """
+
+
+    CLASSIC_STEP = re.compile(r"^Step \d+/\d+ : (.*)$")
+    CLASSIC_CACHED = re.compile(r"^ ---> Using cache$")
+    BUILDKIT_STEP = re.compile(r"^#(\d+) \[[^\]]*\d+/\d+\] (.*)$")
+    BUILDKIT_CACHED = re.compile(r"^#(\d+) CACHED$")
+
+
+    def __init__(self, layers=[]):
+        """
+        :param layers: list of [instruction, cached] pairs, in build order.
+        """
+        self.layers = [list(layer) for layer in layers]
+
+
+    @classmethod
+    def from_build_output(cls, output):
+        report = cls()
+        buildkit_steps = {}
+
+        for line in output.splitlines():
+            line = line.rstrip()
+
+            match = cls.CLASSIC_STEP.match(line)
+            if match:
+                report.layers.append([match.group(1), False])
+                continue
+
+            if cls.CLASSIC_CACHED.match(line) and len(report.layers) > 0:
+                report.layers[-1][1] = True
+                continue
+
+            match = cls.BUILDKIT_STEP.match(line)
+            if match and match.group(1) not in buildkit_steps:
+                buildkit_steps[match.group(1)] = len(report.layers)
+                report.layers.append([match.group(2), False])
+                continue
+
+            match = cls.BUILDKIT_CACHED.match(line)
+            if match and match.group(1) in buildkit_steps:
+                report.layers[buildkit_steps[match.group(1)]][1] = True
+
+        return report
+
+
+    @property
+    def hits(self):
+        return [instruction for instruction, cached in self.layers if cached]
+
+
+    @property
+    def misses(self):
+        return [instruction for instruction, cached in self.layers if not cached]
+
+
+    def __str__(self):
+        lines = ["layer cache: {} hit(s), {} miss(es)".format(len(self.hits), len(self.misses))]
+        for instruction, cached in self.layers:
+            lines.append("  {} {}".format("HIT " if cached else "MISS", instruction))
+        return "\n".join(lines) + "\n"
 
 
 class Image(object):
@@ -12,8 +96,9 @@ class Image(object):
 
     def __init__(self, code_container,
                  froms=[], build_commands=[],
-                 tag="latest", output_dir=None,
-                 path_delegate=None, command_runner=None):
+                 tag="latest", output_dir=None, cache_builds=False, stream_context=False,
+                 precompile=False, serving_profile=None, path_delegate=None, command_runner=None,
+                 build_cache=None):
         """
         :param code_container: a CodeContainer object that will represent
                                the docker image content.
@@ -24,18 +109,40 @@ class Image(object):
         :param output_dir: output directory to be used for local training and serving,
                            you may leave empty for a
                            default-in-current-working-directory directory to be created.
+        :param cache_builds: when True, build skips running docker if the image
+                             was already built from an identical Dockerfile and
+                             container content (see build_digest).
+        :param stream_context: when True, build does not write the .container
+                               directory: the build context is streamed as a tar
+                               archive to "docker build -" (see
+                               CodeContainer.write_context_tar).
+        :param precompile: when True, the model and user code are compiled to .pyc
+                           files in the image, so that training and serving
+                           processes do not compile them on every start.
+        :param serving_profile: the serving topology of the image: the name of a
+                                profile of the inference server (gevent, the
+                                default, sync, gthread or auto), or a dict of its
+                                settings, e.g. {"profile": "gthread", "threads": 8}
+                                (see serving_profile.py in the container template).
         :param path_delegate: path handling abstraction class,
                               you most likely don't need to use it.
         :param command_runner: command running abstraction class,
                                you most likely don't need to use it.
+        :param build_cache: BuildCache object storing the build digests, by default
+                            in a "<name>.build-cache.json" file in the current directory.
         """
         self.code_container = code_container
         self.docker_froms = list(froms)
         self.commands = list(build_commands)
         self.tag = tag
         self.output_dir = output_dir
+        self.cache_builds = cache_builds
+        self.stream_context = stream_context
+        self.precompile = precompile
+        self.serving_profile = serving_profile
         self.cmd = command_runner
         self.path_delegate = path_delegate
+        self.build_cache = build_cache
 
         if self.path_delegate is None:
             self.path_delegate = PathDelegate()
@@ -46,6 +153,13 @@ class Image(object):
         if self.cmd is None:
             self.cmd = CommandRunner()
 
+        self.layer_report = None
+        self.base_image = None
+
+        if self.build_cache is None:
+            self.build_cache = BuildCache("{}.build-cache.json".format(self.code_container.name),
+                                          path_delegate=self.path_delegate)
+
 
     @property
     def tagged_name(self):
@@ -55,12 +169,27 @@ class Image(object):
         return '{}:{}'.format(self.code_container.name, self.tag)
 
 
-    def dockerfile_content(self):
+    def requirements_content(self):
         """
-        Generates on-the-fly the image's Dockerfile using the package's template file
-        and the image arguments.
+        The pip requirements of the image, deduplicated and sorted so that
+        reordering pip_packages does not invalidate the install layer.
 
-        :raises: RuntimeError
+        :returns: str -- content of the requirements file.
+        """
+        packages = sorted(set(self.code_container.pip_packages), key=lambda package: package.lower())
+        return "".join("{}\n".format(package) for package in packages)
+
+
+    def dockerfile_lines(self):
+        """
+        Generates on-the-fly the image's Dockerfile lines using the package's
+        template file and the image arguments, ignoring base_image.
+        Layers are ordered from the least to the most frequently changing:
+        the template preamble, the requirements file and its install,
+        the build commands, and finally the model and user code,
+        compiled when precompile is set, and the serving profile environment.
+
+        :returns: list -- the lines of the Dockerfile, newlines included.
         """
         content = self.path_delegate.\
             read_file_lines(self.path_delegate.join(docker_template_path(),
@@ -81,9 +210,10 @@ class Image(object):
         pip_tag_line = find_line(content, lambda line: "INSTALL_TAG" in line) + 1
 
         if len(self.code_container.pip_packages) > 0:
-            content.insert(pip_tag_line,
-                           "RUN pip3.6 install {} && rm -rf /root/.cache\n"\
-                           .format(" ".join(self.code_container.pip_packages)))
+            content[pip_tag_line:pip_tag_line] = [
+                "COPY {} /opt/{}\n".format(REQUIREMENTS_FILENAME, REQUIREMENTS_FILENAME),
+                "RUN pip3.6 install -r /opt/{} && rm -rf /root/.cache\n".format(REQUIREMENTS_FILENAME)
+            ]
 
         commands_tag_line = find_line(content, lambda line: "COMMANDS_TAG" in line) + 1
 
@@ -92,30 +222,190 @@ class Image(object):
                            "\n".join(map(lambda line: "RUN {}".format(line),
                                          self.commands)))
 
-        return "".join(content)
+        if self.precompile:
+            precompile_tag_line = find_line(content, lambda line: "PRECOMPILE_TAG" in line)
+            if precompile_tag_line is None:
+                content.append("\nRUN {}\n".format(PRECOMPILE_COMMAND))
+            else:
+                content.insert(precompile_tag_line + 1, "RUN {}\n".format(PRECOMPILE_COMMAND))
 
+        serving_environment = self.serving_environment()
+        if len(serving_environment) > 0:
+            content.append("\n" + "".join("ENV {}={}\n".format(name, value)
+                                          for name, value in serving_environment))
 
-    def build(self, verbose=True):
+        return "".join(content).splitlines(True)
+
+
+    def serving_environment(self):
         """
-        Generates and builds the Docker image.
+        The environment variables setting the serving profile of the image.
+
+        :returns: list -- sorted (name, value) pairs.
+        """
+        if self.serving_profile is None:
+            return []
+        settings = self.serving_profile
+        if not isinstance(settings, dict):
+            settings = {"profile": settings}
+        return sorted(("MODEL_SERVER_{}".format(setting.upper()), value) for setting, value in settings.items())
+
+
+    def dockerfile_content(self):
+        """
+        Generates on-the-fly the image's Dockerfile. When base_image is set, to a
+        (tag, line count) pair, the first line count lines of the Dockerfile are
+        replaced by "FROM tag", the base image being built from those lines.
 
         :raises: RuntimeError
         """
-        self.code_container.package()
+        content = self.dockerfile_lines()
+
+        if self.base_image is not None:
+            base_tag, base_length = self.base_image
+            content = ["FROM {}\n".format(base_tag)] + content[base_length:]
+
+        return "".join(content)
+
+
+    def build_digest(self, dockerfile_content):
+        """
+        Digests every input of a build: the rendered Dockerfile, the image arguments
+        and the packaged container content. Must be called after packaging,
+        unless the build context is streamed.
+
+        :returns: str -- hexadecimal sha256 digest.
+        """
+        inputs = json.dumps({
+            "dockerfile": dockerfile_content,
+            "froms": self.docker_froms,
+            "pip_packages": self.code_container.pip_packages,
+            "build_commands": self.commands,
+            "container": self.code_container.source_digest() if self.stream_context
+                         else self.code_container.content_digest()
+        }, sort_keys=True)
+
+        return hashlib.sha256(inputs.encode("utf8")).hexdigest()
+
+
+    def script_path(self, *path):
+        """
+        :returns: str -- path of a container script, in the .container directory,
+                  or in the template when the build context is streamed.
+        """
+        root = container_template_path() if self.stream_context else self.code_container.path
+        return self.path_delegate.join(root, *path)
+
+
+    def image_exists(self):
+        """
+        :returns: bool -- whether docker has the image, which may have been removed
+                  (docker rmi, docker image prune) since the build cache recorded it.
+        """
+        exists = self.cmd.run(["docker", "image", "inspect", self.tagged_name], verbose=False) == 0
+        self.cmd.reset()
+        return exists
+
+
+    def prepare_build(self, verbose=True):
+        """
+        Packages the container and writes the build files, everything build does
+        before running docker. When streaming the build context, nothing is written.
+
+        :returns: tuple -- (argv of the build command, build digest or None,
+                  keyword arguments for the command runner), or None if the
+                  build cache says the image is up to date and docker still has it.
+        """
+        if self.stream_context:
+            dockerfile_content = self.dockerfile_content()
+        else:
+            self.code_container.package()
+            self.path_delegate.write_file(self.path_delegate.join(self.code_container.path,
+                                                                  REQUIREMENTS_FILENAME),
+                                          self.requirements_content())
+            dockerfile_content = self.dockerfile_content()
+
+        digest = None
+        if self.cache_builds:
+            digest = self.build_digest(dockerfile_content)
+            if self.build_cache.is_up_to_date(self.tagged_name, digest) and self.image_exists():
+                if verbose:
+                    sys.stdout.write("{} is up to date, skipping build\n".format(self.tagged_name))
+                return None
+
+        if self.stream_context:
+            extra_files = {"Dockerfile": dockerfile_content,
+                           REQUIREMENTS_FILENAME: self.requirements_content()}
+            return ["docker", "build", "-t", self.tagged_name, "-"], digest, {
+                "stdin_writer": lambda stream: self.code_container.write_context_tar(stream, extra_files)
+            }
+
         self.path_delegate.write_file(self.path_delegate.join(self.code_container.path,
                                                               "Dockerfile"),
-                                      self.dockerfile_content())
+                                      dockerfile_content)
 
-        returncode = self.cmd.run([
+        return [
             "bash",
             self.path_delegate.join(self.code_container.path, "build.sh"),
-            self.code_container.name
-        ], verbose=verbose)
+            self.tagged_name
+        ], digest, {}
+
+
+    def finish_build(self, cmd, returncode, digest, verbose=True):
+        """
+        Checks the build script result collected by :param cmd: and records the build.
 
+        :raises: RuntimeError
+        """
         if returncode != 0:
-            raise RuntimeError("docker could not build the image: {}".format(self.cmd.stderr))
+            raise RuntimeError("docker could not build the image: {}".format(cmd.stderr))
 
-        self.cmd.reset()
+        self.layer_report = LayerCacheReport.from_build_output(cmd.stdout + cmd.stderr)
+        if verbose:
+            sys.stdout.write(str(self.layer_report))
+
+        if digest is not None:
+            self.build_cache.store(self.tagged_name, digest)
+
+        cmd.reset()
+
+
+    def build(self, verbose=True):
+        """
+        Generates and builds the Docker image.
+        With cache_builds, the docker build is skipped if the image was already
+        built from the same inputs.
+        Once built, layer_report tells which layers docker took from its cache.
+
+        :raises: RuntimeError
+        """
+        prepared = self.prepare_build(verbose=verbose)
+        if prepared is None:
+            return
+
+        argv, digest, run_kwargs = prepared
+        self.finish_build(self.cmd, self.cmd.run(argv, verbose=verbose, **run_kwargs),
+                          digest, verbose=verbose)
+
+
+    async def build_async(self, verbose=True, command_runner=None):
+        """
+        Asynchronous counterpart of build. Packaging runs in the default executor
+        and docker in an AsyncCommandRunner, so several images can be built at once
+        (as long as they do not share the same code container).
+
+        :param command_runner: AsyncCommandRunner to use, a new one by default.
+        :raises: RuntimeError
+        """
+        prepared = await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.prepare_build, verbose=verbose))
+        if prepared is None:
+            return
+
+        cmd = command_runner if command_runner is not None else AsyncCommandRunner()
+        argv, digest, run_kwargs = prepared
+        self.finish_build(cmd, await cmd.run(argv, verbose=verbose, **run_kwargs),
+                          digest, verbose=verbose)
 
 
     def push(self, verbose=True, verbose_build=True):
@@ -127,11 +417,7 @@ class Image(object):
         """
         self.build(verbose=verbose_build)
 
-        returncode = self.cmd.run([
-            "bash",
-            self.path_delegate.join(self.code_container.path, "push.sh"),
-            self.code_container.name
-        ], verbose=verbose)
+        returncode = self.cmd.run(self.push_argv(), verbose=verbose)
 
         if returncode != 0:
             raise RuntimeError("docker could not push the image: {}".format(self.cmd.stderr))
@@ -139,6 +425,33 @@ class Image(object):
         self.cmd.reset()
 
 
+    async def push_async(self, verbose=True, verbose_build=True, command_runner=None):
+        """
+        Asynchronous counterpart of push.
+
+        :param command_runner: AsyncCommandRunner to use, a new one by default.
+        :raises: RuntimeError
+        """
+        cmd = command_runner if command_runner is not None else AsyncCommandRunner()
+        await self.build_async(verbose=verbose_build, command_runner=cmd)
+
+        returncode = await cmd.run(self.push_argv(), verbose=verbose)
+
+        if returncode != 0:
+            raise RuntimeError("docker could not push the image: {}".format(cmd.stderr))
+
+        cmd.reset()
+
+
+    def push_argv(self):
+        """nodoc"""
+        return [
+            "bash",
+            self.script_path("push.sh"),
+            self.tagged_name
+        ]
+
+
     def train(self, verbose=True, verbose_build=False):
         """
         Trains the Docker image "locally" (current machine running the calling program).
@@ -150,12 +463,7 @@ class Image(object):
         self.build(verbose=verbose_build)
         self.path_delegate.create_directory(self.output_dir)
 
-        returncode = self.cmd.run([
-            "bash",
-            self.path_delegate.join(self.code_container.path, "local_test", "train_local.sh"),
-            self.tagged_name,
-            self.output_dir
-        ], verbose=verbose)
+        returncode = self.cmd.run(self.train_argv(), verbose=verbose)
 
         if returncode != 0:
             raise RuntimeError("training the image failed: {}".format(self.cmd.stderr))
@@ -163,6 +471,37 @@ class Image(object):
         self.cmd.reset()
 
 
+    async def train_async(self, verbose=True, verbose_build=False, command_runner=None, timeout=None):
+        """
+        Asynchronous counterpart of train.
+
+        :param command_runner: AsyncCommandRunner to use, a new one by default.
+        :param timeout: seconds after which the training is killed
+                        and asyncio.TimeoutError raised, None to wait forever.
+        :raises: RuntimeError
+        """
+        cmd = command_runner if command_runner is not None else AsyncCommandRunner()
+        await self.build_async(verbose=verbose_build, command_runner=cmd)
+        self.path_delegate.create_directory(self.output_dir)
+
+        returncode = await cmd.run(self.train_argv(), verbose=verbose, timeout=timeout)
+
+        if returncode != 0:
+            raise RuntimeError("training the image failed: {}".format(cmd.stderr))
+
+        cmd.reset()
+
+
+    def train_argv(self):
+        """nodoc"""
+        return [
+            "bash",
+            self.script_path("local_test", "train_local.sh"),
+            self.tagged_name,
+            self.output_dir
+        ]
+
+
     def serve(self, verbose=True, verbose_build=False):
         """
         Experimental, work in progress.
@@ -171,7 +510,7 @@ class Image(object):
 
         returncode = self.cmd.run([
             "bash",
-            self.path_delegate.join(self.code_container.path, "local_test", "serve_local.sh"),
+            self.script_path("local_test", "serve_local.sh"),
             self.tagged_name,
 
             self.output_dir
@@ -1,8 +1,19 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from abc import abstractproperty, abstractmethod
+from collections import OrderedDict, deque
 from .path import PathDelegate
 
 
 class FileTransformer(object):
+    # bump when the output of transform changes, to invalidate cached results
+    version = "1"
+
+
     @abstractproperty
     def transforming(self):
         pass
@@ -13,25 +24,209 @@ class FileTransformer(object):
         pass
 
 
+    def transform_stream(self, input_stream, output_stream):
+        """
+        Transforms the content read from the binary :param input_stream: and writes
+        the result to the binary :param output_stream:, which is how transformers
+        are chained. Transformers able to work on streams should override this
+        default, which goes through temporary files.
+        """
+        ext1, ext2 = self.transforming
+        descriptor, input_filename = tempfile.mkstemp(suffix=ext1)
+        try:
+            with os.fdopen(descriptor, "wb") as input_file:
+                shutil.copyfileobj(input_stream, input_file)
+            descriptor, output_filename = tempfile.mkstemp(suffix=ext2)
+            os.close(descriptor)
+            try:
+                self.transform(input_filename, output_filename)
+                with open(output_filename, "rb") as output_file:
+                    shutil.copyfileobj(output_file, output_stream)
+            finally:
+                os.remove(output_filename)
+        finally:
+            os.remove(input_filename)
+
+
+class ChainedFileTransformer(FileTransformer):
+    """
+    Runs FileTransformer objects one after the other, e.g. ".ipynb" => ".py" => ".pyc",
+    as a streaming pipeline: every step runs in its own thread and hands its
+    output to the next one through a pipe, so no intermediate file is written.
+    """
+
+
+    def __init__(self, transformers):
+        """
+        :param transformers: FileTransformer objects, the output extension of each
+                             one being the input extension of the next one.
+        """
+        self.transformers = list(transformers)
+
+        for previous, following in zip(self.transformers, self.transformers[1:]):
+            if previous.transforming[1] != following.transforming[0]:
+                raise ValueError("cannot chain {}=>{} with {}=>{}".format(
+                    *previous.transforming, *following.transforming))
+
+
+    @property
+    def transforming(self):
+        return self.transformers[0].transforming[0], self.transformers[-1].transforming[1]
+
+
+    @property
+    def version(self):
+        return "+".join("{}.{}:{}".format(type(transformer).__module__, type(transformer).__name__,
+                                          transformer.version)
+                        for transformer in self.transformers)
+
+
+    def transform(self, input_filename, output_filename):
+        with open(input_filename, "rb") as input_stream, open(output_filename, "wb") as output_stream:
+            self.transform_stream(input_stream, output_stream)
+
+
+    def transform_stream(self, input_stream, output_stream):
+        """
+        :raises: the exception of the first failing step, if any.
+        """
+        if len(self.transformers) == 1:
+            return self.transformers[0].transform_stream(input_stream, output_stream)
+
+        pipes = [os.pipe() for _ in self.transformers[1:]]
+        inputs = [input_stream] + [os.fdopen(read_fd, "rb") for read_fd, _ in pipes]
+        outputs = [os.fdopen(write_fd, "wb") for _, write_fd in pipes] + [output_stream]
+        errors = [None] * len(self.transformers)
+
+        def run_step(index):
+            """nodoc"""
+            try:
+                self.transformers[index].transform_stream(inputs[index], outputs[index])
+            except Exception as error:
+                errors[index] = error
+            finally:
+                # unblocks the neighbour steps: EOF downstream, broken pipe upstream
+                if index > 0:
+                    inputs[index].close()
+                if index < len(self.transformers) - 1:
+                    try:
+                        outputs[index].close()
+                    except BrokenPipeError:
+                        pass
+
+        threads = [threading.Thread(target=run_step, args=(index,), daemon=True)
+                   for index in range(len(self.transformers) - 1)]
+        for thread in threads:
+            thread.start()
+        run_step(len(self.transformers) - 1)
+        for thread in threads:
+            thread.join()
+
+        # a broken pipe is the consequence of a later step failing, not the cause
+        for error in errors:
+            if error is not None and not isinstance(error, BrokenPipeError):
+                raise error
+        for error in errors:
+            if error is not None:
+                raise error
+
+
 class FileTransformerContainer(object):
+    """
+    FileTransformer objects indexed as a graph of file extensions. Looking up
+    a pair of extensions gives the direct transformer if there is one, otherwise
+    a ChainedFileTransformer along the shortest chain of transformers.
+    """
+
+
     def __init__(self):
-        self.transformers = {}
+        self.transformers = OrderedDict()
+        self.chains = {}
+
+
+    def chain(self, ext1, ext2):
+        """
+        :returns: list -- the shortest list of transformers turning :param ext1:
+                  files into :param ext2: files, None if there is none.
+        """
+        previous = {ext1: None}
+        pending = deque([ext1])
+
+        while len(pending) > 0:
+            extension = pending.popleft()
+            if extension == ext2:
+                chain = []
+                while previous[extension] is not None:
+                    extension, transformer = previous[extension]
+                    chain.insert(0, transformer)
+                return chain
+            for following, transformer in self.transformers.get(extension, {}).items():
+                if following not in previous:
+                    previous[following] = (extension, transformer)
+                    pending.append(following)
+
+        return None
+
+
+    def __contains__(self, exts):
+        ext1, ext2 = exts
+        return ext1 != ext2 and self.chain(ext1, ext2) is not None
 
 
     def __getitem__(self, exts):
         ext1, ext2 = exts
-        return self.transformers["{}=>{}".format(ext1, ext2)]
+        if exts not in self.chains:
+            chain = self.chain(ext1, ext2) if ext1 != ext2 else None
+            if chain is None:
+                raise KeyError("{}=>{}".format(ext1, ext2))
+            self.chains[exts] = chain[0] if len(chain) == 1 else ChainedFileTransformer(chain)
+        return self.chains[exts]
 
 
     def __setitem__(self, exts, transformer):
         ext1, ext2 = exts
-        self.transformers["{}=>{}".format(ext1, ext2)] = transformer
+        self.transformers.setdefault(ext1, OrderedDict())[ext2] = transformer
+        self.chains.clear()
+
+
+class TransformationError(RuntimeError):
+    """
+    Raised when files could not be transformed, listing every failure.
+    """
+
+
+    def __init__(self, errors):
+        """
+        :param errors: list of (source file, exception).
+        """
+        self.errors = errors
+        super().__init__("could not transform {} file(s):\n{}".format(
+            len(errors), "\n".join("{}: {!r}".format(source, error) for source, error in errors)))
+
+
+def _transform_file(transformer, source, destination):
+    """nodoc"""
+    transformer.transform(source, destination)
 
 
 class TransformationAwarePathDelegate(PathDelegate):
-    def __init__(self, file_transformers=[]):
-        super().__init__()
+    def __init__(self, file_transformers=[], cache=None, transform_workers=None,
+                 link_mode="copy", link_min_size=1 << 20):
+        """
+        :param file_transformers: FileTransformer objects applied when copying
+                                  a file to a different extension, chained
+                                  when no single one converts between them.
+        :param cache: TransformationCache keeping the transformed files,
+                      None to transform on every copy.
+        :param transform_workers: number of processes transform_files dispatches
+                                  transformations to, None to transform one
+                                  file after the other in this process.
+                                  The transformers must be picklable.
+        """
+        super().__init__(link_mode=link_mode, link_min_size=link_min_size)
         self.transformers = FileTransformerContainer()
+        self.cache = cache
+        self.transform_workers = transform_workers
 
         for file_transformer in file_transformers:
             self.register_file_transformer(file_transformer)
@@ -42,18 +237,104 @@ class TransformationAwarePathDelegate(PathDelegate):
         self.transformers[ext1, ext2] = transformer
 
 
-    def _original_copy(self, source, destination):
-        return super().copy(source, destination)
+    def _original_copy(self, source, destination, ignored=()):
+        return super().copy(source, destination, ignored=ignored)
 
 
-    def copy(self, source, destination):
+    def transformer(self, source, destination):
+        """
+        :returns: FileTransformer -- the transformer copying :param source: to
+                  :param destination: goes through, None for a plain copy.
+        :raises: KeyError -- if the files extensions differ but no chain
+                 of transformers converts between them.
+        """
         ext1 = self.file_extension(source)
         ext2 = self.file_extension(destination)
 
         if ext1 != ext2 and ext1 != '' and ext2 != '':
-            transformed = source + ".transformed" + ext2
-            self.transformers[ext1, ext2].transform(source, transformed)
-            self._original_copy(transformed, destination)
-            self.remove(transformed)
+            return self.transformers[ext1, ext2]
+        return None
+
+
+    @contextlib.contextmanager
+    def transformed_file(self, source, destination):
+        transformer = self.transformer(source, destination)
+
+        if transformer is None:
+            yield None
+        elif self.cache is not None:
+            yield self.cache.transformed_file(transformer, source)
         else:
-            self._original_copy(source, destination)
+            descriptor, filename = tempfile.mkstemp(suffix=self.file_extension(destination))
+            os.close(descriptor)
+            try:
+                transformer.transform(source, filename)
+                yield filename
+            finally:
+                os.remove(filename)
+
+
+    def copy(self, source, destination, ignored=()):
+        transformer = self.transformer(source, destination)
+
+        if transformer is None:
+            self._original_copy(source, destination, ignored=ignored)
+        elif self.cache is not None:
+            self._original_copy(self.cache.transformed_file(transformer, source), destination)
+        else:
+            transformer.transform(source, destination)
+
+
+    def transform_files(self, files):
+        """
+        Transforms the files needing it, in a pool of transform_workers processes,
+        cached transformations being copied from the cache instead.
+
+        :raises: TransformationError -- listing, in order, the files that could
+                 not be transformed, once all the others are.
+        """
+        errors, transformed, pending = [], set(), []
+
+        for source, destination in files:
+            try:
+                transformer = self.transformer(source, destination)
+            except KeyError as error:
+                errors.append((source, error))
+                continue
+            if transformer is None:
+                continue
+
+            entry, cached = None, False
+            if self.cache is not None:
+                entry, cached = self.cache.lookup(transformer, source)
+            if cached:
+                self._original_copy(entry, destination)
+                transformed.add(destination)
+            else:
+                pending.append((transformer, source, destination, entry))
+
+        workers = min(self.transform_workers or 1, len(pending))
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            if executor is not None:
+                futures = [executor.submit(_transform_file, transformer, source, destination)
+                           for transformer, source, destination, _ in pending]
+            for index, (transformer, source, destination, entry) in enumerate(pending):
+                try:
+                    if executor is not None:
+                        futures[index].result()
+                    else:
+                        _transform_file(transformer, source, destination)
+                    if entry is not None:
+                        self.cache.store(entry, lambda filename: shutil.copyfile(destination, filename))
+                except Exception as error:
+                    errors.append((source, error))
+                else:
+                    transformed.add(destination)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if len(errors) > 0:
+            raise TransformationError(errors)
+        return transformed
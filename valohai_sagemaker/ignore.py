@@ -0,0 +1,134 @@
+import re
+from .path import PathDelegate
+
+
+IGNORE_FILENAME = ".containerignore"
+
+
+def translate_pattern(pattern):
+    """
+    Translates a gitignore glob (without its negation or directory markers)
+    to a regular expression body matching "/" separated relative paths.
+    """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    index, length, parts = 0, len(pattern), []
+    while index < length:
+        character = pattern[index]
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+            continue
+        if character == "*":
+            parts.append("[^/]*")
+        elif character == "?":
+            parts.append("[^/]")
+        elif character == "[" and "]" in pattern[index + 2:]:
+            end = pattern.index("]", index + 2)
+            content = pattern[index + 1:end]
+            if content.startswith("!"):
+                content = "^" + content[1:]
+            parts.append("[{}]".format(content.replace("\\", "\\\\")))
+            index = end
+        elif character == "\\" and index + 1 < length:
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        else:
+            parts.append(re.escape(character))
+        index += 1
+
+    return ("" if anchored else "(?:.*/)?") + "".join(parts)
+
+
+class IgnoreMatcher(object):
+    """
+    Tells which paths of a directory are excluded from a container,
+    following .gitignore semantics: "#" comments, "!" negations, trailing "/"
+    for directories only, patterns with a "/" anchored to the directory root,
+    "*", "?", "[...]" and "**" globs, the last matching pattern winning.
+    Patterns are compiled once; without negations they form a single regex.
+    """
+
+
+    def __init__(self, patterns=[]):
+        """
+        :param patterns: iterable of gitignore pattern lines.
+        """
+        self.rules = []
+
+        for line in patterns:
+            line = line.rstrip("\n")
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            if line == "" or line.startswith("#"):
+                continue
+
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+
+            directory_only = line.endswith("/")
+            line = line.rstrip("/")
+            if line == "":
+                continue
+
+            self.rules.append((re.compile("^{}$".format(translate_pattern(line))),
+                               negated, directory_only))
+
+        self.combined = None
+        if len(self.rules) > 0 and not any(negated for _, negated, _ in self.rules):
+            self.combined = (self._combine(directory_only=False), self._combine(directory_only=True))
+
+
+    def _combine(self, directory_only):
+        """nodoc"""
+        patterns = ["(?:{})".format(regex.pattern) for regex, _, only in self.rules
+                    if only == directory_only]
+        return re.compile("|".join(patterns)) if len(patterns) > 0 else None
+
+
+    @classmethod
+    def from_file(cls, filename, patterns=[], path_delegate=None):
+        """
+        :returns: IgnoreMatcher -- the matcher of :param patterns: followed by
+                  the ones of the ignore file, if it exists.
+        """
+        if path_delegate is None:
+            path_delegate = PathDelegate()
+
+        patterns = list(patterns)
+        if path_delegate.exists(filename):
+            patterns += path_delegate.read_file(filename).splitlines()
+
+        return cls(patterns)
+
+
+    def __bool__(self):
+        return len(self.rules) > 0
+
+
+    def ignored(self, relative_path, is_directory=False):
+        """
+        :param relative_path: "/" separated path, relative to the matched directory.
+        :returns: bool -- whether the path is excluded.
+        """
+        if self.combined is not None:
+            files_regex, directories_regex = self.combined
+            if files_regex is not None and files_regex.match(relative_path):
+                return True
+            return is_directory and directories_regex is not None and \
+                directories_regex.match(relative_path) is not None
+
+        for regex, negated, directory_only in reversed(self.rules):
+            if directory_only and not is_directory:
+                continue
+            if regex.match(relative_path):
+                return not negated
+        return False
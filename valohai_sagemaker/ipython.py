@@ -1,10 +1,9 @@
-import json
-from functools import reduce
-from itertools import starmap
-import os
+import io
+from .json_stream import JSONStreamReader
 from .path import PathDelegate
 from .code_container import CodeContainer
 from .file_transformer import FileTransformer, TransformationAwarePathDelegate
+from .transformation_cache import TransformationCache
 
 
 BEGIN_TAG = "##BEGIN##"
@@ -20,6 +19,9 @@ class IPythonNotebookFileTransformer(FileTransformer):
     """
 
 
+    version = "2"
+
+
     def __init__(self, path_delegate=None):
         self.path_delegate = path_delegate
 
@@ -32,36 +34,92 @@ class IPythonNotebookFileTransformer(FileTransformer):
         return ".ipynb", ".py"
 
 
-    def get_tagged_code(self, filename):
-        content = json.loads(self.path_delegate.read_file(filename))
-
-        code_cells = filter(lambda x: x["cell_type"] == "code", content["cells"])
-        all_code_lines = reduce(lambda x, y: x + y, map(lambda x: x["source"], code_cells))
-        cleaned_code_lines = tuple(map(lambda line: line if line[-1] == "\n" else line + "\n",
-                                       all_code_lines))
-
-        begin_tag_line_indices = map(lambda pair: pair[0], filter(lambda pair: BEGIN_TAG in pair[1],
-                                                              enumerate(cleaned_code_lines)))
-        end_tag_line_indices = map(lambda pair: pair[0], filter(lambda pair: END_TAG in pair[1],
-                                                            enumerate(cleaned_code_lines)))
-        tagged_line_blocks = starmap(lambda begin, end: cleaned_code_lines[begin+1:end],
-                                         zip(begin_tag_line_indices, end_tag_line_indices))
+    def code_lines(self, stream):
+        """
+        Yields the source lines of every code cell of the notebook read from
+        :param stream:, one cell at a time: the rest of the notebook (outputs,
+        markdown cells, metadata) is skipped without being decoded.
+        """
+        reader = JSONStreamReader(stream)
+
+        for key in reader.iterate_object():
+            if key != "cells":
+                reader.skip_value()
+                continue
+
+            for _ in reader.iterate_array():
+                cell_type, source = None, []
+                for cell_key in reader.iterate_object():
+                    if cell_key == "cell_type":
+                        cell_type = reader.read_value()
+                    elif cell_key == "source":
+                        source = reader.read_value()
+                    else:
+                        reader.skip_value()
+
+                if cell_type == "code":
+                    yield from source.splitlines(True) if isinstance(source, str) else source
+
+
+    def write_tagged_code(self, input_stream, output_stream):
+        """
+        Writes to :param output_stream: the code lines in between tags of the notebook
+        read from :param input_stream:, in a single pass.
+        """
+        tagged = False
+
+        for line in self.code_lines(input_stream):
+            if not tagged:
+                tagged = BEGIN_TAG in line
+            elif END_TAG in line:
+                tagged = False
+            else:
+                output_stream.write(line if line.endswith("\n") else line + "\n")
 
-        all_blocks = reduce(lambda x, y: x + y, tagged_line_blocks)
 
-        return "".join(all_blocks)
+    def get_tagged_code(self, filename):
+        output = io.StringIO()
+        with self.path_delegate.open_file(filename, "r") as notebook:
+            self.write_tagged_code(notebook, output)
+        return output.getvalue()
 
 
     def transform(self, input_filename, output_filename):
         if self.path_delegate.file_extension(input_filename) == ".ipynb":
-            self.path_delegate.write_file(output_filename, self.get_tagged_code(input_filename))
+            with self.path_delegate.open_file(input_filename, "r") as notebook, \
+                    self.path_delegate.open_file(output_filename, "w") as script:
+                self.write_tagged_code(notebook, script)
+
+
+    def transform_stream(self, input_stream, output_stream):
+        notebook = io.TextIOWrapper(input_stream, encoding="utf8")
+        script = io.TextIOWrapper(output_stream, encoding="utf8")
+        try:
+            self.write_tagged_code(notebook, script)
+            script.flush()
+        finally:
+            notebook.detach()
+            script.detach()
 
 
-def create_ipython_code_container(name, **kwargs):
+def create_ipython_code_container(name, transformation_cache=None, file_transformers=[],
+                                  transform_workers=None, **kwargs):
     """
     Creates a CodeContainer object that transforms any .ipynb file mapped to a .py file to a .py file in the container.
+
+    :param file_transformers: other FileTransformer objects applied to the files
+                              to copy, e.g. data_transformer.CSVToNPYTransformer().
+    :param transformation_cache: TransformationCache keeping the transformed notebooks,
+                                 by default one in the user cache directory.
+                                 False to transform notebooks on every packaging.
+    :param transform_workers: number of processes transforming files concurrently,
+                              None to transform them one after the other.
     """
+    if transformation_cache is None:
+        transformation_cache = TransformationCache()
+
     return CodeContainer(name, **kwargs,
                          path_delegate=TransformationAwarePathDelegate(file_transformers=[
                              IPythonNotebookFileTransformer()
-                         ]))
+                         ] + list(file_transformers), cache=transformation_cache or None,
+                             transform_workers=transform_workers))
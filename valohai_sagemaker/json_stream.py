@@ -0,0 +1,215 @@
+import json
+import re
+
+
+class JSONStreamReader(object):
+    """
+    A minimal pull reader over a JSON text stream. Only a window of the input
+    is held in memory, and values can be skipped without being decoded, which
+    is what makes reading the few interesting fields of a huge document cheap.
+
+    Objects and arrays are walked with iterate_object and iterate_array, whose
+    caller must then consume every value with read_value or skip_value.
+    """
+
+
+    CHUNK_SIZE = 1 << 20
+    NON_WHITESPACE = re.compile(r"\S")
+    STRUCTURE = re.compile(r'["\[\]{}]')
+    STRING_END = re.compile(r'["\\]')
+    SCALAR_END = re.compile(r'[\s,\]}]')
+    DECODER = json.JSONDecoder()
+
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        """
+        :param stream: text stream to read the JSON document from.
+        :param chunk_size: number of characters read at once.
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.captured = None
+        self.eof = False
+
+
+    def _fill(self):
+        """
+        Reads one more chunk, dropping the consumed part of the buffer.
+
+        :returns: bool -- False at the end of the input.
+        """
+        if self.eof:
+            return False
+
+        chunk = self.stream.read(self.chunk_size)
+        if len(chunk) == 0:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+
+    def _consume(self, end):
+        """nodoc"""
+        if self.captured is not None:
+            self.captured.append(self.buffer[self.position:end])
+        self.position = end
+
+
+    def _error(self, expected):
+        """nodoc"""
+        return ValueError("invalid JSON: expected {} near '{}'".format(
+            expected, self.buffer[self.position:self.position + 20]))
+
+
+    def peek(self):
+        """
+        :returns: str -- the next non whitespace character, None at the end of the input.
+        """
+        while True:
+            match = self.NON_WHITESPACE.search(self.buffer, self.position)
+            if match is not None:
+                self.position = match.start()
+                return self.buffer[self.position]
+            self.position = len(self.buffer)
+            if not self._fill():
+                return None
+
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise self._error("'{}'".format(character))
+        self._consume(self.position + 1)
+
+
+    def _skip_string(self):
+        """nodoc"""
+        self._consume(self.position + 1)
+        while True:
+            match = self.STRING_END.search(self.buffer, self.position)
+            if match is None:
+                self._consume(len(self.buffer))
+            elif match.group() == '"':
+                self._consume(match.end())
+                return
+            elif match.end() < len(self.buffer):
+                self._consume(match.end() + 1)
+                continue
+            else:
+                self._consume(match.start())
+
+            if not self._fill():
+                raise self._error("end of string")
+
+
+    def _skip_container(self):
+        """nodoc"""
+        self._consume(self.position + 1)
+        depth = 1
+        while depth > 0:
+            match = self.STRUCTURE.search(self.buffer, self.position)
+            if match is None:
+                self._consume(len(self.buffer))
+                if not self._fill():
+                    raise self._error("end of array or object")
+                continue
+
+            self._consume(match.start())
+            if match.group() == '"':
+                self._skip_string()
+                continue
+
+            depth += 1 if match.group() in "[{" else -1
+            self._consume(match.end())
+
+
+    def _skip_scalar(self):
+        """nodoc"""
+        while True:
+            match = self.SCALAR_END.search(self.buffer, self.position)
+            if match is not None:
+                self._consume(match.start())
+                return
+            self._consume(len(self.buffer))
+            if not self._fill():
+                return
+
+
+    def skip_value(self):
+        """
+        Skips the next value, without decoding it nor holding it in memory.
+        """
+        character = self.peek()
+        if character is None:
+            raise self._error("a value")
+        if character == '"':
+            self._skip_string()
+        elif character in "[{":
+            self._skip_container()
+        else:
+            self._skip_scalar()
+
+
+    def read_value(self):
+        """
+        :returns: the next value, decoded.
+        """
+        # strings, arrays and objects are delimited: when they decode from the
+        # buffer, they are complete, so try that before the slower captured skip
+        for _ in range(2):
+            if self.peek() not in ('"', "[", "{"):
+                break
+            try:
+                value, self.position = self.DECODER.raw_decode(self.buffer, self.position)
+                return value
+            except ValueError:
+                if not self._fill():
+                    break
+
+        self.captured = []
+        try:
+            self.skip_value()
+            return json.loads("".join(self.captured))
+        finally:
+            self.captured = None
+
+
+    def _separators(self, closing):
+        """nodoc"""
+        if self.peek() == closing:
+            self._consume(self.position + 1)
+            return
+
+        while True:
+            yield
+            character = self.peek()
+            if character == closing:
+                self._consume(self.position + 1)
+                return
+            if character != ",":
+                raise self._error("',' or '{}'".format(closing))
+            self._consume(self.position + 1)
+
+
+    def iterate_object(self):
+        """
+        Yields the keys of the object starting at the current position.
+        """
+        self.expect("{")
+        for _ in self._separators("}"):
+            key = self.read_value()
+            self.expect(":")
+            yield key
+
+
+    def iterate_array(self):
+        """
+        Yields the indices of the array starting at the current position.
+        """
+        self.expect("[")
+        for index, _ in enumerate(self._separators("]")):
+            yield index
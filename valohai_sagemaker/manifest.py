@@ -0,0 +1,140 @@
+import json
+from .path import PathDelegate
+
+
+class PackageManifest(object):
+    """
+    Records the state of every file written to a .container directory,
+    so that a later packaging only has to copy the files that changed since.
+    Entries are keyed by destination path and hold the signature of the source
+    file as well as the size and modification time of the copy.
+    """
+
+
+    FILENAME = ".manifest.json"
+
+
+    def __init__(self, container_path, hash_contents=False, path_delegate=None):
+        """
+        :param container_path: path of the .container directory the manifest describes.
+        :param hash_contents: also compare sha256 digests when size or
+                              modification time of a source file changed,
+                              so that a touched but identical file is not copied.
+        :param path_delegate: path handling abstraction class,
+                              you most likely don't need to use it.
+        """
+        self.container_path = container_path
+        self.hash_contents = hash_contents
+        self.path_delegate = path_delegate
+        self.entries = {}
+
+        if self.path_delegate is None:
+            self.path_delegate = PathDelegate()
+
+
+    @property
+    def path(self):
+        """
+        :returns: str -- location of the manifest file in the container directory.
+        """
+        return self.path_delegate.join(self.container_path, self.FILENAME)
+
+
+    def load(self):
+        """
+        Reads the manifest from the container directory.
+
+        :returns: bool -- whether a manifest was found.
+        """
+        if not self.path_delegate.exists(self.path):
+            self.entries = {}
+            return False
+
+        try:
+            self.entries = json.loads(self.path_delegate.read_file(self.path))
+        except ValueError:
+            self.entries = {}
+            return False
+
+        return True
+
+
+    def save(self):
+        self.path_delegate.write_file(self.path, json.dumps(self.entries, sort_keys=True))
+
+
+    def signature(self, source):
+        """
+        :returns: dict -- the size and modification time of :param source:
+                  (plus its content digest when hashing is enabled).
+        """
+        stat = self.path_delegate.stat(source)
+        signature = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+        if self.hash_contents:
+            signature["sha256"] = self.path_delegate.file_digest(source)
+
+        return signature
+
+
+    def _source_unchanged(self, recorded, source):
+        stat = self.path_delegate.stat(source)
+
+        if recorded["size"] != stat.st_size:
+            return False
+        if recorded["mtime"] == stat.st_mtime_ns:
+            return True
+        if not self.hash_contents or "sha256" not in recorded:
+            return False
+
+        if recorded["sha256"] != self.path_delegate.file_digest(source):
+            return False
+
+        recorded["mtime"] = stat.st_mtime_ns
+        return True
+
+
+    def _destination_unchanged(self, recorded, destination):
+        if not self.path_delegate.exists(destination):
+            return False
+
+        stat = self.path_delegate.stat(destination)
+        return recorded == [stat.st_size, stat.st_mtime_ns]
+
+
+    def is_up_to_date(self, source, destination):
+        """
+        :returns: bool -- whether :param destination: still holds the copy of
+                  :param source: recorded in the manifest.
+        """
+        entry = self.entries.get(destination)
+
+        if entry is None:
+            return False
+
+        return self._destination_unchanged(entry["destination"], destination) and \
+            self._source_unchanged(entry["source"], source)
+
+
+    def record(self, source, destination):
+        """
+        Records that :param destination: was just written from :param source:.
+        """
+        stat = self.path_delegate.stat(destination)
+        self.entries[destination] = {
+            "source": self.signature(source),
+            "destination": [stat.st_size, stat.st_mtime_ns]
+        }
+
+
+    def stale(self, destinations):
+        """
+        :returns: list -- recorded destinations that are not part of :param destinations:.
+        """
+        destinations = set(destinations)
+        return sorted(destination for destination in self.entries
+                      if destination not in destinations)
+
+
+    def forget(self, destination):
+        self.entries.pop(destination, None)
@@ -1,13 +1,100 @@
+import contextlib
+import errno
 import os
 import shutil
+import hashlib
 import importlib
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+LINK_MODES = ("copy", "hardlink", "reflink")
+# ioctl request cloning a whole file (linux/fs.h), for reflinks on btrfs, XFS...
+FICLONE = 0x40049409
+
+
+# errors telling a kernel copy fast path is not available for a pair of files
+UNSUPPORTED_FAST_COPY_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ENOTSOCK)
+FAST_COPY_CHUNK_SIZE = 1 << 30
+
+
+def _copy_file_contents(source_fd, destination_fd, size):
+    """
+    Copies :param size: bytes between two file descriptors, in the kernel with
+    os.copy_file_range (which also reflinks on supporting filesystems) or
+    os.sendfile when available, falling back to plain reads and writes.
+    """
+    copied = 0
+
+    for fast_copy in [getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)]:
+        if fast_copy is None:
+            continue
+        try:
+            os.lseek(destination_fd, copied, os.SEEK_SET)
+            while copied < size:
+                if fast_copy is os.sendfile:
+                    count = os.sendfile(destination_fd, source_fd, copied,
+                                        min(FAST_COPY_CHUNK_SIZE, size - copied))
+                else:
+                    count = os.copy_file_range(source_fd, destination_fd,
+                                               min(FAST_COPY_CHUNK_SIZE, size - copied),
+                                               copied, copied)
+                if count == 0:
+                    break
+                copied += count
+            if copied >= size:
+                return
+        except OSError as error:
+            if error.errno not in UNSUPPORTED_FAST_COPY_ERRNOS:
+                raise
+
+    os.lseek(source_fd, copied, os.SEEK_SET)
+    os.lseek(destination_fd, copied, os.SEEK_SET)
+    while True:
+        chunk = os.read(source_fd, 1 << 20)
+        if len(chunk) == 0:
+            break
+        os.write(destination_fd, chunk)
+
+
+def check_link_mode(link_mode):
+    """
+    :raises: ValueError -- if link_mode is not one of LINK_MODES.
+    """
+    if link_mode not in LINK_MODES:
+        raise ValueError("bad link_mode '{}', should be one of {}".format(link_mode, LINK_MODES))
+
 
 class PathDelegate(object):
+    def __init__(self, link_mode="copy", link_min_size=1 << 20):
+        """
+        :param link_mode: how copy_file duplicates big files: "copy" them,
+                          "hardlink" them, or "reflink" them (copy-on-write clone).
+                          Links fall back to a copy when impossible, e.g. across devices.
+                          Hard links share the source's content: a file modified
+                          in place is modified in the container too.
+        :param link_min_size: files smaller than this, in bytes, are always copied,
+                              so small files written to afterwards (like config files)
+                              are never shared with their source.
+        """
+        check_link_mode(link_mode)
+
+        self.link_mode = link_mode
+        self.link_min_size = link_min_size
+
+
     def exists(self, path):
         return os.path.exists(path)
 
 
+    def open_file(self, path, mode="r"):
+        return open(path, mode, encoding=None if "b" in mode else "utf8")
+
+
     def read_file(self, path, mode="r"):
         with open(path, mode) as file:
             return file.read()
@@ -28,19 +115,163 @@ class PathDelegate(object):
             os.mkdir(path)
 
 
+    def create_directories(self, path):
+        os.makedirs(path, exist_ok=True)
+
+
+    def is_directory(self, path):
+        return os.path.isdir(path)
+
+
+    def stat(self, path):
+        return os.stat(path)
+
+
+    def file_digest(self, path, chunk_size=1 << 20):
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+    def walk_files(self, path, ignore=None, skipped=None):
+        """
+        Yields the path of every file under :param path:, relative to it,
+        in a stable order. A plain file yields itself as an empty relative path.
+
+        :param ignore: IgnoreMatcher (or any object with an ignored(relative_path,
+                       is_directory) method): ignored directories are not descended into.
+        :param skipped: list to which the full paths of the ignored files and
+                        directories are appended, as (path, is_directory) pairs.
+        """
+        if not os.path.isdir(path):
+            yield ""
+            return
+
+        # like shutil.copytree, linked directories are walked as if they were copies
+        for root, directories, files in os.walk(path, followlinks=True):
+            relative_root = os.path.relpath(root, path)
+            relative_root = "" if relative_root == os.curdir else relative_root.replace(os.sep, "/") + "/"
+
+            directories.sort()
+            if ignore:
+                for directory in [directory for directory in directories
+                                  if ignore.ignored(relative_root + directory, True)]:
+                    directories.remove(directory)
+                    if skipped is not None:
+                        skipped.append((os.path.join(root, directory), True))
+
+            for filename in sorted(files):
+                if ignore and ignore.ignored(relative_root + filename, False):
+                    if skipped is not None:
+                        skipped.append((os.path.join(root, filename), False))
+                    continue
+                yield os.path.relpath(os.path.join(root, filename), path)
+
+
     def join(self, *args):
         return os.path.join(*args)
 
 
+    def relative_path(self, path, start):
+        return os.path.relpath(path, start)
+
+
     def current_directory(self):
         return os.curdir
 
 
-    def copy(self, source, destination):
+    def copy(self, source, destination, ignored=()):
+        """
+        Copies a file, or a directory tree but for the names matching the
+        :param ignored: glob patterns.
+        """
         try:
-            shutil.copytree(source, destination)
+            shutil.copytree(source, destination, copy_function=self.copy_file,
+                            ignore=shutil.ignore_patterns(*ignored) if ignored else None)
         except NotADirectoryError:
-            shutil.copy2(source, destination)
+            self.copy_file(source, destination)
+
+
+    def copy_file(self, source, destination):
+        """
+        Copies a single file like shutil.copy2 (metadata included),
+        using the kernel copy fast paths when available.
+        """
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+
+        if self.link_mode != "copy" and os.stat(source).st_size >= self.link_min_size:
+            if self.link_file(source, destination):
+                return destination
+
+        # the destination may be a hard link to the source, left by a previous
+        # packaging: opening it for writing would truncate the source
+        if os.path.lexists(destination):
+            os.remove(destination)
+
+        with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+            _copy_file_contents(source_file.fileno(), destination_file.fileno(),
+                                os.fstat(source_file.fileno()).st_size)
+
+        shutil.copystat(source, destination)
+        return destination
+
+
+    def link_file(self, source, destination):
+        """
+        Hard links or reflinks, depending on link_mode, :param source: to :param destination:.
+
+        :returns: bool -- False if the filesystem could not link them.
+        """
+        try:
+            if os.path.lexists(destination):
+                if os.path.samefile(source, destination):
+                    return True
+                os.remove(destination)
+
+            if self.link_mode == "hardlink":
+                os.link(source, destination)
+                return True
+
+            if fcntl is None:
+                return False
+
+            with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+            shutil.copystat(source, destination)
+            return True
+        except OSError:
+            return False
+
+
+    def transformer(self, source, destination):
+        """
+        :returns: FileTransformer -- the transformer copying :param source: to
+                  :param destination: goes through, None for a plain copy.
+        """
+        return None
+
+
+    @contextlib.contextmanager
+    def transformed_file(self, source, destination):
+        """
+        Context manager yielding the path of a file holding what copying :param source:
+        to :param destination: would write if it is not a plain copy, None otherwise.
+        The file is only valid within the context.
+        """
+        yield None
+
+
+    def transform_files(self, files):
+        """
+        Writes, ahead of copying, the files of :param files: (source, destination)
+        pairs that are not plain copies, all at once.
+
+        :returns: set -- the destinations written, which must not be copied.
+        """
+        return set()
 
 
     def file_extension(self, filename):
@@ -70,6 +301,22 @@ class PathDelegate(object):
             os.remove(filename)
 
 
+    def prune_empty_directories(self, path, root):
+        """
+        Removes :param path: and its parents as long as they are empty,
+        stopping at (and never removing) :param root:.
+        """
+        root = os.path.realpath(root)
+        path = os.path.realpath(path)
+
+        while path != root and path.startswith(root + os.sep):
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            path = os.path.dirname(path)
+
+
 def module_rootdir(module_name):
     """
     Returns the absolute path of the installation location of a module.
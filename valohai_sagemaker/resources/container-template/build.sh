@@ -3,10 +3,17 @@
 # This script shows how to build the Docker image and push it to ECR to be ready for use
 # by SageMaker.
 
-# The argument to this script is the image name. This will be used as the image on the local
-# machine and combined with the account and region to form the repository name for ECR.
+# The argument to this script is the image name, optionally tagged (name:tag, "latest" by default).
+# This will be used as the image on the local machine and combined with the account and region
+# to form the repository name for ECR.
 container_dir=$(dirname $(realpath $0))
 name=$1
+repository=${name%%:*}
+tag=latest
+if [[ $name = *":"* ]]
+then
+    tag=${name#*:}
+fi
 files=${@:2}
 
 
@@ -61,7 +68,7 @@ region=${region:-us-west-2}
 # Get the account number associated with the current IAM credentials
 account=$(aws sts get-caller-identity --query Account --output text)
 
-fullname="${account}.dkr.ecr.${region}.amazonaws.com/${name}:latest"
+fullname="${account}.dkr.ecr.${region}.amazonaws.com/${repository}:${tag}"
 
 
 # Get the train and serve scripts executable
@@ -76,11 +83,11 @@ fi
 
 # If the repository doesn't exist in ECR, create it.
 
-aws ecr describe-repositories --repository-names "${name}" > /dev/null 2>&1
+aws ecr describe-repositories --repository-names "${repository}" > /dev/null 2>&1
 
 if [ $? -ne 0 ]
 then
-    aws ecr create-repository --repository-name "${name}" > /dev/null
+    aws ecr create-repository --repository-name "${repository}" > /dev/null
 fi
 
 # Get the login command from ECR and execute it directly
@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+
+import numpy
+
+
+class Histogram(object):
+    """Counts of values in power of two buckets: 1, 2, 3-4, 5-8, ..."""
+
+    def __init__(self):
+        self.counts = OrderedDict()
+        self.total = 0
+        self.sum = 0
+
+    def add(self, value):
+        bucket = 1
+        while bucket < value:
+            bucket *= 2
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.sum += value
+
+    def as_dict(self):
+        return {
+            'count': self.total,
+            'mean': float(self.sum) / self.total if self.total > 0 else 0.0,
+            'buckets': OrderedDict(('<={}'.format(bucket), self.counts[bucket]) for bucket in sorted(self.counts)),
+        }
+
+
+class Batch(object):
+    """Requests whose inputs are predicted together."""
+
+    def __init__(self):
+        self.inputs = []
+        self.rows = 0
+        self.closed = False
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.predictions = None
+        self.error = None
+
+    def add(self, input):
+        self.inputs.append(input)
+        self.rows += len(input)
+        return len(self.inputs) - 1
+
+    def run(self, predict):
+        try:
+            if len(self.inputs) == 1:
+                self.predictions = [predict(self.inputs[0])]
+            else:
+                predictions = numpy.asarray(predict(concatenate(self.inputs)))
+                if len(predictions) != self.rows:
+                    raise RuntimeError('the model returned {} predictions for {} rows'.format(
+                        len(predictions), self.rows))
+                offsets = numpy.cumsum([0] + [len(input) for input in self.inputs])
+                self.predictions = [predictions[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+        except Exception as error:
+            self.error = error
+        finally:
+            self.done.set()
+
+
+def concatenate(inputs):
+    if isinstance(inputs[0], numpy.ndarray):
+        return numpy.concatenate(inputs)
+
+    import pandas as pd
+    return pd.concat(inputs, ignore_index=True)
+
+
+def batch_key(input):
+    """Inputs can only be predicted together if they have the same type and row layout."""
+    if isinstance(input, numpy.ndarray):
+        return type(input), input.dtype.str, input.shape[1:]
+    return type(input), tuple(getattr(input, 'columns', ()))
+
+
+class MicroBatcher(object):
+    """Coalesces the inputs of concurrent requests (greenlets of a gevent worker or threads)
+    into a single call of predict. The first request of a batch waits up to window seconds
+    for others to join, or until the batch holds max_rows rows, then predicts the concatenated
+    inputs and hands every request its slice of the predictions. The batch sizes are kept in
+    the rows and requests histograms."""
+
+    def __init__(self, predict, max_rows=256, window=0.005):
+        self.predict_batch = predict
+        self.max_rows = max_rows
+        self.window = window
+        self.lock = threading.Lock()
+        self.open_batches = {}
+        self.rows = Histogram()
+        self.requests = Histogram()
+
+    def predict(self, input):
+        """Predictions of input, predicted along with the inputs of concurrent requests."""
+        key = batch_key(input)
+
+        with self.lock:
+            batch = self.open_batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = self.open_batches[key] = Batch()
+            index = batch.add(input)
+            if batch.rows >= self.max_rows:
+                self.close(key, batch)
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                self.close(key, batch)
+                self.rows.add(batch.rows)
+                self.requests.add(len(batch.inputs))
+            batch.run(self.predict_batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.predictions[index]
+
+    def close(self, key, batch):
+        """Stop batch from accepting inputs and wake its leader up. Called with the lock held."""
+        if not batch.closed:
+            batch.closed = True
+            if self.open_batches.get(key) is batch:
+                del self.open_batches[key]
+            batch.full.set()
+
+    def stats(self):
+        return {'max_rows': self.max_rows, 'window_ms': self.window * 1000.0,
+                'rows': self.rows.as_dict(), 'requests': self.requests.as_dict()}
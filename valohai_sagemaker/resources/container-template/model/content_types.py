@@ -0,0 +1,320 @@
+import io
+import struct
+from collections import OrderedDict
+
+import numpy
+
+
+# numpy.loadtxt is implemented in C from numpy 1.23, and numpy.fromstring before
+FAST_LOADTXT = numpy.lib.NumpyVersion(numpy.__version__) >= '1.23.0'
+
+
+def parse_csv(body, dtype, columns):
+    """Parse a headerless numeric CSV request body (bytes) straight into a 2D numpy array of
+    the given dtype and column count, in C: no str decoding, no per-value Python objects.
+    Raise ValueError if the body is not made of rows of exactly columns numbers."""
+    body = body.strip(b'\r\n')
+    if len(body) == 0:
+        return numpy.empty((0, columns), dtype=dtype)
+
+    if FAST_LOADTXT:
+        values = numpy.loadtxt(io.BytesIO(body), delimiter=',', dtype=dtype, ndmin=2)
+        if values.shape[1] != columns:
+            raise ValueError('expected rows of {} numeric values, got {}'.format(columns, values.shape[1]))
+        return values
+
+    body = body.replace(b'\r', b'')
+    rows = body.count(b'\n') + 1
+    values = numpy.fromstring(body.replace(b'\n', b','), dtype=dtype, sep=',')
+    if values.size != rows * columns:
+        raise ValueError('expected {} rows of {} numeric values'.format(rows, columns))
+    return values.reshape(rows, columns)
+
+
+def format_csv(predictions):
+    """Serialize predictions (one value, or one row of values, per prediction) as CSV lines,
+    the values being formatted to text by numpy at once."""
+    predictions = numpy.asarray(predictions)
+    if predictions.ndim == 0:
+        predictions = predictions.reshape(1)
+    if predictions.size == 0:
+        return ''
+
+    text = predictions.astype(str)
+    if text.ndim == 1:
+        lines = text.tolist()
+    else:
+        lines = [','.join(row) for row in text.reshape(len(text), -1).tolist()]
+    return '\n'.join(lines) + '\n'
+
+
+def csv_blocks(stream, block_size):
+    """Yield the CSV body read from stream (a file like object) in blocks of about block_size
+    bytes, each block ending at a line end so that it can be decoded on its own."""
+    remainder = b''
+    while True:
+        chunk = stream.read(block_size)
+        if not chunk:
+            break
+        block = remainder + chunk
+        end = block.rfind(b'\n') + 1
+        if end == 0:
+            remainder = block
+            continue
+        remainder = block[end:]
+        yield block[:end]
+    if remainder.strip(b'\r\n'):
+        yield remainder
+
+
+# {content type: function(request body bytes, model metadata) returning the model input}
+decoders = OrderedDict()
+# {content type: function(predictions) returning the response body, bytes or str}
+encoders = OrderedDict()
+
+
+def register_decoder(content_type, decoder):
+    """Register decoder for the requests of content_type, e.g. from predict.py.
+    decoder raises ValueError on malformed bodies."""
+    decoders[content_type] = decoder
+
+
+def register_encoder(content_type, encoder):
+    """Register encoder for the responses of content_type, e.g. from predict.py."""
+    encoders[content_type] = encoder
+
+
+def decode_csv(body, metadata):
+    """numpy array when the metadata gives the input dtype and column count, pandas data frame otherwise."""
+    if 'input_dtype' in metadata and 'input_columns' in metadata:
+        return parse_csv(body, metadata['input_dtype'], metadata['input_columns'])
+
+    import pandas as pd
+    return pd.read_csv(io.StringIO(body.decode('utf-8')), header=None)
+
+
+def decode_npy(body, metadata):
+    """The array of a .npy body, without copying its data: a read only view of the body."""
+    stream = io.BytesIO(body)
+    version = numpy.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(stream)
+    if dtype.hasobject:
+        raise ValueError('object arrays are not accepted')
+
+    count = int(numpy.prod(shape))
+    if len(body) - stream.tell() < count * dtype.itemsize:
+        raise ValueError('truncated .npy body')
+    values = numpy.frombuffer(body, dtype=dtype, count=count, offset=stream.tell())
+    return values.reshape(shape, order='F' if fortran_order else 'C')
+
+
+def encode_npy(predictions):
+    stream = io.BytesIO()
+    numpy.lib.format.write_array(stream, numpy.asarray(predictions), allow_pickle=False)
+    return stream.getvalue()
+
+
+def decode_arrow(body, metadata):
+    """A pandas data frame of the Arrow IPC stream body, converted a column at a time so that
+    the numeric columns without nulls are read only views of the body rather than copies
+    (consolidating them into a 2D block would copy them)."""
+    import pyarrow
+    try:
+        return pyarrow.ipc.open_stream(pyarrow.py_buffer(body)).read_all().to_pandas(split_blocks=True)
+    except pyarrow.ArrowInvalid as error:
+        raise ValueError(str(error))
+
+
+def encode_arrow(predictions):
+    """An Arrow IPC stream of a "results" column, or one "results_<index>" column per prediction value."""
+    import pyarrow
+    predictions = numpy.asarray(predictions)
+    if predictions.ndim <= 1:
+        table = pyarrow.table({'results': predictions.reshape(-1)})
+    else:
+        predictions = predictions.reshape(len(predictions), -1)
+        table = pyarrow.table(OrderedDict(('results_{}'.format(index), predictions[:, index])
+                                          for index in range(predictions.shape[1])))
+
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# SageMaker's RecordIO-protobuf: RecordIO framed aialgs.data.Record protobuf messages
+RECORDIO_MAGIC = 0xced7230a
+# aialgs.data.Value fields: tensor field number => numpy dtype of its values
+TENSOR_FIELDS = {2: numpy.dtype('<f4'), 3: numpy.dtype('<f8'), 7: numpy.dtype('int32')}
+
+
+def read_varint(buffer, position):
+    result, shift = 0, 0
+    while True:
+        if position >= len(buffer):
+            raise ValueError('truncated protobuf varint')
+        byte = buffer[position]
+        result |= (byte & 0x7f) << shift
+        position += 1
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def protobuf_fields(buffer):
+    """Yield (field number, value) of a protobuf message: int for varint fields,
+    memoryview for length delimited ones and bytes for fixed size ones."""
+    buffer = memoryview(buffer)
+    position = 0
+    while position < len(buffer):
+        key, position = read_varint(buffer, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(buffer, position)
+        elif wire_type == 2:
+            length, position = read_varint(buffer, position)
+            value = buffer[position:position + length]
+            position += length
+        elif wire_type in (1, 5):
+            size = 8 if wire_type == 1 else 4
+            value = bytes(buffer[position:position + size])
+            position += size
+        else:
+            raise ValueError('unsupported protobuf wire type {}'.format(wire_type))
+        if position > len(buffer):
+            raise ValueError('truncated protobuf message')
+        yield number, value
+
+
+def packed_varints(buffer):
+    values, position = [], 0
+    while position < len(buffer):
+        value, position = read_varint(buffer, position)
+        values.append(value)
+    return values
+
+
+def decode_tensor(buffer, dtype):
+    """Dense numpy vector of a Float32Tensor, Float64Tensor or Int32Tensor message."""
+    values, keys, shape = [], [], []
+    for number, value in protobuf_fields(buffer):
+        if number == 1:
+            if dtype.kind == 'f':
+                values.append(numpy.frombuffer(value, dtype=dtype))
+            else:
+                # int32 varints are sign extended to 64 bits
+                values.append(numpy.array(packed_varints(value), dtype=numpy.uint64).astype(numpy.int64)
+                              .astype(dtype))
+        elif number == 2:
+            keys.extend(packed_varints(value))
+        elif number == 3:
+            shape.extend(packed_varints(value))
+
+    values = numpy.concatenate(values) if len(values) > 0 else numpy.empty(0, dtype=dtype)
+    if len(keys) == 0:
+        return values
+
+    dense = numpy.zeros(int(numpy.prod(shape)) if len(shape) > 0 else max(keys) + 1, dtype=dtype)
+    dense[numpy.array(keys, dtype=numpy.int64)] = values
+    return dense
+
+
+def recordio_records(body):
+    """Yield the payloads of the RecordIO framed records of body."""
+    body = memoryview(body)
+    position = 0
+    while position < len(body):
+        if len(body) - position < 8:
+            raise ValueError('truncated RecordIO header')
+        magic, length = struct.unpack_from('<II', body, position)
+        if magic != RECORDIO_MAGIC:
+            raise ValueError('bad RecordIO magic number')
+        length &= (1 << 29) - 1
+        position += 8
+        if position + length > len(body):
+            raise ValueError('truncated RecordIO record')
+        yield body[position:position + length]
+        position += length + (-length % 4)
+
+
+def decode_recordio_protobuf(body, metadata):
+    """2D numpy array of the "values" feature tensors of the records, one row per record."""
+    rows = []
+    for record in recordio_records(body):
+        for number, entry in protobuf_fields(record):
+            if number != 1:
+                continue
+            key, value = None, None
+            for entry_number, entry_value in protobuf_fields(entry):
+                if entry_number == 1:
+                    key = bytes(entry_value).decode('utf-8')
+                elif entry_number == 2:
+                    value = entry_value
+            if key != 'values' or value is None:
+                continue
+            for tensor_number, tensor in protobuf_fields(value):
+                if tensor_number in TENSOR_FIELDS:
+                    rows.append(decode_tensor(tensor, TENSOR_FIELDS[tensor_number]))
+
+    if len(rows) == 0:
+        return numpy.empty((0, 0), dtype=numpy.float32)
+    if any(len(row) != len(rows[0]) for row in rows):
+        raise ValueError('the records do not all have the same number of values')
+    return numpy.vstack(rows)
+
+
+def write_varint(value):
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def protobuf_field(number, payload):
+    """A length delimited protobuf field."""
+    return write_varint(number << 3 | 2) + write_varint(len(payload)) + payload
+
+
+def encode_recordio_protobuf(predictions):
+    """One record per prediction, labelled {"score": Float32Tensor}, like SageMaker's built-in algorithms."""
+    predictions = numpy.asarray(predictions, dtype='<f4')
+    predictions = predictions.reshape(len(predictions) if predictions.ndim > 0 else 1, -1)
+
+    records = []
+    for row in predictions:
+        tensor = protobuf_field(1, row.tobytes())
+        value = protobuf_field(2, tensor)
+        entry = protobuf_field(1, b'score') + protobuf_field(2, value)
+        record = protobuf_field(2, entry)
+        records.append(struct.pack('<II', RECORDIO_MAGIC, len(record)) + record + b'\0' * (-len(record) % 4))
+    return b''.join(records)
+
+
+register_decoder('text/csv', decode_csv)
+register_decoder('application/x-npy', decode_npy)
+register_decoder('application/vnd.apache.arrow.stream', decode_arrow)
+register_decoder('application/x-recordio-protobuf', decode_recordio_protobuf)
+
+register_encoder('text/csv', format_csv)
+register_encoder('application/x-npy', encode_npy)
+register_encoder('application/vnd.apache.arrow.stream', encode_arrow)
+register_encoder('application/x-recordio-protobuf', encode_recordio_protobuf)
+
+
+def response_content_type(content_type, accept):
+    """The content type of the response: the best match of accept (a werkzeug MIMEAccept),
+    preferring the request content type, text/csv when nothing is asked for, None when
+    nothing asked for can be encoded."""
+    if not accept or accept.best == '*/*':
+        return content_type if content_type in encoders else 'text/csv'
+    preferred = [content_type] + [other for other in encoders if other != content_type] \
+        if content_type in encoders else list(encoders)
+    return accept.best_match(preferred)
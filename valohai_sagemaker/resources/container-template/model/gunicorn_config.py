@@ -0,0 +1,62 @@
+# gunicorn hooks of the inference server, see serve.py.
+import gc
+import os
+import time
+
+
+# CPU sets of the worker slots, e.g. 0,1;2,3 for 2 workers pinned to 2 CPUs each, set by serve.py
+cpu_sets = [[int(cpu) for cpu in cpu_set.split(',')]
+            for cpu_set in os.environ.get('MODEL_SERVER_CPU_SETS', '').split(';') if cpu_set]
+
+
+def memory_usage():
+    """Memory usage of the current process, in MB: rss, pss (rss with shared pages divided among
+    the processes sharing them), shared and private, from /proc/self/smaps_rollup when available."""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                fields = line.split()
+                if len(fields) == 3 and fields[2] == 'kB':
+                    usage[fields[0].rstrip(':')] = int(fields[1]) / 1024.0
+    except (IOError, OSError):
+        return {}
+    return {
+        'rss': usage.get('Rss', 0.0),
+        'pss': usage.get('Pss', 0.0),
+        'shared': usage.get('Shared_Clean', 0.0) + usage.get('Shared_Dirty', 0.0),
+        'private': usage.get('Private_Clean', 0.0) + usage.get('Private_Dirty', 0.0),
+    }
+
+
+def pre_fork(server, worker):
+    # move every object of the master (the preloaded model included) to the permanent
+    # generation, which collections ignore (python >= 3.7, see prediction_server_app.preload_model
+    # for older versions)
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+    # give the worker the first slot no other worker has, a restarted worker taking over the CPUs
+    # of the one it replaces
+    if cpu_sets:
+        used = set(getattr(other, 'cpu_slot', None) for other in server.WORKERS.values())
+        worker.cpu_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+
+def post_fork(server, worker):
+    gc.enable()
+
+    # pin the worker before it starts any BLAS or OpenMP thread, which then run on its CPUs
+    if cpu_sets and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpu_sets[worker.cpu_slot % len(cpu_sets)])
+
+
+def post_worker_init(worker):
+    usage = memory_usage()
+    start_time = float(os.environ.get('MODEL_SERVER_START_TIME', time.time()))
+    print('Worker {} ready {:.3f}s after the server start{}{}.'.format(
+        worker.pid, time.time() - start_time,
+        ' on CPUs {}'.format(','.join(str(cpu) for cpu in sorted(os.sched_getaffinity(0))))
+        if cpu_sets and hasattr(os, 'sched_getaffinity') else '',
+        ', memory (MB): rss {rss:.1f}, pss {pss:.1f}, shared {shared:.1f}, private {private:.1f}'.format(**usage)
+        if usage else ''))
@@ -0,0 +1,80 @@
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+
+prefix = '/opt/ml/'
+model_directory = os.path.join(prefix, 'model')
+
+# how the numpy arrays of a model are memory-mapped: 'r' maps them read only from the
+# artifact file, so the page cache holding them is shared by every worker, '' loads them in memory
+mmap_mode = os.environ.get('MODEL_SERVER_MMAP_MODE', 'r') or None
+
+# {file extension: function loading a model artifact from its path}, tried in this order
+model_loaders = OrderedDict()
+
+
+def register_model_loader(extension, loader):
+    """Register loader (a function taking the path of a model artifact and returning the model)
+    for the model artifacts ending with extension, e.g. register_model_loader('.onnx', load_onnx)
+    from predict.py. A loader registered later for the same extension replaces the previous one."""
+    model_loaders[extension] = loader
+
+
+def load_pickle(path):
+    with open(path, 'rb') as inp:
+        return pickle.load(inp)
+
+
+def load_joblib(path):
+    """Arrays of a model saved with joblib.dump(model, path) (uncompressed) are memory-mapped."""
+    import joblib
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def load_numpy(path):
+    import numpy
+    return numpy.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+
+
+register_model_loader('.joblib', load_joblib)
+register_model_loader('.npy', load_numpy)
+register_model_loader('.pkl', load_pickle)
+
+
+def find_model_file():
+    """Path of the model artifact: MODEL_SERVER_MODEL_PATH if set, otherwise /opt/ml/model.pkl,
+    otherwise the first /opt/ml/model/model.<extension> with a registered extension."""
+    if os.environ.get('MODEL_SERVER_MODEL_PATH'):
+        return os.environ['MODEL_SERVER_MODEL_PATH']
+
+    candidates = [os.path.join(prefix, 'model.pkl')] + \
+                 [os.path.join(model_directory, 'model' + extension) for extension in model_loaders]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    raise IOError('no model artifact found, tried: {}'.format(', '.join(candidates)))
+
+
+def load_model(path=None):
+    """Load the model artifact at path (by default find_model_file()) with the loader
+    registered for its extension."""
+    if path is None:
+        path = find_model_file()
+
+    extension = os.path.splitext(path)[1]
+    if extension not in model_loaders:
+        raise ValueError('no model loader registered for {} files ({})'.format(extension, path))
+    return model_loaders[extension](path)
+
+
+def load_model_metadata():
+    """Model metadata from MODEL_SERVER_METADATA_PATH, by default /opt/ml/model/metadata.json,
+    e.g. {"input_dtype": "float32", "input_columns": 12} for the CSV fast path of /invocations.
+    Empty if there is no metadata file."""
+    path = os.environ.get('MODEL_SERVER_METADATA_PATH') or os.path.join(model_directory, 'metadata.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as inp:
+        return json.load(inp)
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy
+
+
+# rough memory cost of a cache entry besides its key and prediction: dict slot, tuple, objects
+ENTRY_OVERHEAD = 200
+
+
+def row_keys(input):
+    """One hashable key per row of input: the raw bytes of the rows of a numpy array,
+    or the pandas 64 bits hash of the rows of a data frame, both computed at once."""
+    if isinstance(input, numpy.ndarray):
+        rows = numpy.ascontiguousarray(input.reshape(len(input), -1))
+        return rows.view(numpy.dtype((numpy.void, rows.dtype.itemsize * rows.shape[1]))).ravel().tolist()
+
+    import pandas as pd
+    return pd.util.hash_pandas_object(input, index=False).values.tolist()
+
+
+def take_rows(input, indices):
+    if isinstance(input, numpy.ndarray):
+        return input[indices]
+    return input.iloc[indices]
+
+
+class PredictionCache(object):
+    """Row level cache of predictions, least recently used entries being evicted beyond
+    max_bytes and entries older than ttl seconds (0 for never) ignored. Only the rows missing
+    from the cache (once each) are predicted, the predictions of the others being gathered
+    from the cache into the result with numpy indexing."""
+
+    def __init__(self, max_bytes, ttl=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def predict(self, input, predict):
+        """Predictions of input (one per row), predict being called on the rows missing from the cache."""
+        keys = row_keys(input)
+        now = time.time()
+
+        with self.lock:
+            cached = [self.lookup(key, now) for key in keys]
+            hit_rows = [index for index, value in enumerate(cached) if value is not None]
+            self.hits += len(hit_rows)
+            self.misses += len(keys) - len(hit_rows)
+
+        if len(hit_rows) == len(keys):
+            return numpy.stack(cached) if len(cached) > 0 else numpy.asarray(predict(input))
+
+        # predict every distinct missing row once
+        missing_keys = OrderedDict()
+        missing_rows = []
+        for index, value in enumerate(cached):
+            if value is None and keys[index] not in missing_keys:
+                missing_keys[keys[index]] = len(missing_rows)
+                missing_rows.append(index)
+        computed = numpy.asarray(predict(take_rows(input, numpy.array(missing_rows, dtype=numpy.int64))))
+        if len(computed) != len(missing_rows):
+            raise RuntimeError('the model returned {} predictions for {} rows'.format(len(computed), len(missing_rows)))
+
+        with self.lock:
+            for key, position in missing_keys.items():
+                self.store(key, computed[position].copy(), now)
+
+        if len(hit_rows) == 0 and len(missing_rows) == len(keys):
+            return computed
+
+        result = numpy.empty((len(keys),) + computed.shape[1:], dtype=computed.dtype)
+        missing = numpy.array([index for index, value in enumerate(cached) if value is None], dtype=numpy.int64)
+        result[missing] = computed[[missing_keys[keys[index]] for index in missing.tolist()]]
+        if len(hit_rows) > 0:
+            result[numpy.array(hit_rows, dtype=numpy.int64)] = numpy.stack([cached[index] for index in hit_rows])
+        return result
+
+    def lookup(self, key, now):
+        """The cached prediction of key, None if missing or expired. Called with the lock held."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value, size = entry
+        if self.ttl > 0 and now - stored_at > self.ttl:
+            del self.entries[key]
+            self.bytes -= size
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value, now):
+        """Cache the prediction value of key, evicting the least recently used entries
+        beyond max_bytes. Called with the lock held."""
+        size = ENTRY_OVERHEAD + value.nbytes + (len(key) if isinstance(key, bytes) else 8)
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[2]
+        self.entries[key] = (now, value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self.entries) > 0:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups > 0 else 0.0,
+                'entries': len(self.entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                'ttl': self.ttl}
@@ -1,42 +1,116 @@
 import os
+import gc
 import json
-import pickle
-import io
 import sys
 import signal
+import time
 import traceback
 
 import flask
 
-import pandas as pd
-
 from predict import predict as predict_from_clf 
+from model_loader import load_model, load_model_metadata
+from content_types import decoders, encoders, response_content_type, csv_blocks
+from batching import MicroBatcher
+from prediction_cache import PredictionCache
+
+
+# set by serve.py: load the model in the gunicorn master, before it forks the workers
+preload = os.environ.get('MODEL_SERVER_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+start_time = float(os.environ.get('MODEL_SERVER_START_TIME', time.time()))
+
+# e.g. the input dtype and column count with which CSV requests are parsed to numpy arrays
+# directly from the request bytes instead of going through pandas (see content_types.decode_csv)
+metadata = load_model_metadata()
 
+# dynamic batching of concurrent requests: predict at most once per window, on up to max rows
+batch_max_rows = int(os.environ.get('MODEL_SERVER_BATCH_MAX_ROWS', 0))
+batch_window = float(os.environ.get('MODEL_SERVER_BATCH_WINDOW_MS', 5)) / 1000.0
 
-prefix = '/opt/ml/'
+# row level prediction cache of each worker: memory bound and time to live of its entries
+cache_max_bytes = int(float(os.environ.get('MODEL_SERVER_CACHE_MAX_MB', 0)) * 1024 * 1024)
+cache_ttl = float(os.environ.get('MODEL_SERVER_CACHE_TTL', 0))
+
+# set by serve.py: CSV invocations are read, predicted and answered in blocks of rows of about
+# streaming_block_size bytes, so that batch transform payloads are never held in memory whole
+streaming = os.environ.get('MODEL_SERVER_STREAMING', 'false').lower() in ('1', 'true', 'yes')
+streaming_block_size = int(float(os.environ.get('MODEL_SERVER_STREAMING_BLOCK_MB', 1)) * 1024 * 1024)
 
 # A singleton for holding the model. This simply loads the model and holds it.
 # It has a predict function that does a prediction based on the model and the input data.
 
 class ScoringService(object):
     model = None                # Where we keep the model when it's loaded
+    served = False              # Whether this process served a prediction yet
 
     @classmethod
     def get_model(cls):
         """Get the model object for this instance, loading it if it's not already loaded."""
-        if cls.model == None:
-            with open(os.path.join(prefix, 'model.pkl'), 'rb') as inp:
-                cls.model = pickle.load(inp)
+        if cls.model is None:
+            load_start = time.time()
+            cls.model = load_model()
+            print('Loaded the model in {:.3f}s (pid {}).'.format(time.time() - load_start, os.getpid()))
         return cls.model
 
+    batcher = None              # MicroBatcher coalescing concurrent predictions, if enabled
+    cache = None                # PredictionCache of the predictions of rows seen before, if enabled
+
     @classmethod
     def predict(cls, input):
         """For the input, do the predictions and return them.
         Args:
             input (a pandas dataframe): The data on which to do the predictions. There will be
                 one prediction per row in the dataframe"""
+        if cls.cache is not None:
+            return cls.cache.predict(input, cls.predict_uncached)
+        return cls.predict_uncached(input)
+
+    @classmethod
+    def predict_uncached(cls, input):
+        if cls.batcher is not None:
+            return cls.batcher.predict(input)
+        return cls.predict_batch(input)
+
+    @classmethod
+    def predict_batch(cls, input):
+        """Run the model on input, the inputs of several requests when batching."""
         clf = cls.get_model()
-        return predict_with_clf(clf, input)
+        predict_start = time.time()
+        predictions = predict_from_clf(clf, input)
+        if not cls.served:
+            cls.served = True
+            print('First prediction of pid {} in {:.3f}s, {:.3f}s after the server start.'.format(
+                os.getpid(), time.time() - predict_start, time.time() - start_time))
+        return predictions
+
+def preload_model():
+    """Load the model in the gunicorn master (gunicorn --preload) so that the workers it forks
+    share the model memory pages copy-on-write instead of each loading its own copy. The garbage
+    collector stays disabled in the master so that no collection reshuffles those pages; the
+    gunicorn hooks (gunicorn_config.py) freeze the loaded objects before forking, so collections
+    in the workers never write to them, and enable the garbage collector in the workers.
+
+    Python < 3.7 cannot freeze objects: a collection before forking moves them to the oldest
+    generation instead, which the frequent young collections of the workers leave alone, but
+    which their full collections still go through, unsharing the pages they touch. Full
+    collections only run once the objects created since the last one outnumber a quarter of
+    the oldest generation, which a large model makes rare, yet the memory saved is less certain."""
+    gc.disable()
+    ScoringService.get_model()
+    if not hasattr(gc, 'freeze'):
+        gc.collect()
+
+if preload:
+    preload_model()
+
+if batch_max_rows > 0:
+    ScoringService.batcher = MicroBatcher(ScoringService.predict_batch, max_rows=batch_max_rows,
+                                          window=batch_window)
+    print('Batching predictions of up to {} rows within {:.1f}ms.'.format(batch_max_rows, batch_window * 1000))
+
+if cache_max_bytes > 0:
+    ScoringService.cache = PredictionCache(cache_max_bytes, ttl=cache_ttl)
+    print('Caching predictions in up to {} bytes per worker.'.format(cache_max_bytes))
 
 # The flask app for serving predictions
 app = flask.Flask(__name__)
@@ -50,30 +124,72 @@ def ping():
     status = 200 if health else 404
     return flask.Response(response='\n', status=status, mimetype='application/json')
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Serving statistics of this worker: the batch size histograms when batching,
+    the prediction cache hit rate when caching."""
+    stats = {'pid': os.getpid()}
+    if ScoringService.batcher is not None:
+        stats['batching'] = ScoringService.batcher.stats()
+    if ScoringService.cache is not None:
+        stats['cache'] = ScoringService.cache.stats()
+    return flask.Response(response=json.dumps(stats), status=200, mimetype='application/json')
+
 @app.route('/invocations', methods=['POST'])
 def transformation():
-    """Do an inference on a single batch of data. In this sample server, we take data as CSV, convert
-    it to a pandas data frame for internal use and then convert the predictions back to CSV (which really
-    just means one prediction per line, since there's a single column.
+    """Do an inference on a single batch of data. In this sample server, the data is decoded according
+    to its Content-Type (see content_types.decoders: CSV, NPY, Arrow IPC stream or RecordIO-protobuf),
+    CSV data to a pandas data frame, or to a numpy array when the model metadata gives its dtype and
+    column count. The predictions are encoded back according to the Accept header, by default to
+    the request content type (for CSV, one prediction per line).
     """
-    data = None
+    content_type = (flask.request.mimetype or '').lower()
+    if content_type not in decoders:
+        return flask.Response(response='This predictor only supports {} data'.format(', '.join(decoders)),
+                              status=415, mimetype='text/plain')
 
-    # Convert from CSV to pandas
-    if flask.request.content_type == 'text/csv':
-        data = flask.request.data.decode('utf-8')
-        s = io.StringIO(data)
-        data = pd.read_csv(s, header=None)
-    else:
-        return flask.Response(response='This predictor only supports CSV data', status=415, mimetype='text/plain')
+    accept = response_content_type(content_type, flask.request.accept_mimetypes)
+    if accept is None:
+        return flask.Response(response='This predictor only responds with {}'.format(', '.join(encoders)),
+                              status=406, mimetype='text/plain')
+
+    if streaming and content_type == 'text/csv' and accept == 'text/csv':
+        return streaming_transformation()
+
+    try:
+        data = decoders[content_type](flask.request.get_data(), metadata)
+    except ValueError as error:
+        return flask.Response(response='Bad {} data: {}'.format(content_type, error), status=400,
+                              mimetype='text/plain')
 
     print('Invoked with {} records'.format(data.shape[0]))
 
     # Do the prediction
     predictions = ScoringService.predict(data)
 
-    # Convert from numpy back to CSV
-    out = io.StringIO()
-    pd.DataFrame({'results':predictions}).to_csv(out, header=False, index=False)
-    result = out.getvalue()
-
-    return flask.Response(response=result, status=200, mimetype='text/csv')
+    return flask.Response(response=encoders[accept](predictions), status=200, mimetype=accept)
+
+def streaming_transformation():
+    """Predict a CSV request block by block as its body is read, streaming the CSV predictions of
+    every block back (chunked) before reading the next. A malformed first block is answered with
+    a 400; later errors can only abort the response, which the client sees as a failed request."""
+    blocks = csv_blocks(flask.request.stream, streaming_block_size)
+    first = next(blocks, b'')
+    try:
+        data = decoders['text/csv'](first, metadata)
+    except ValueError as error:
+        return flask.Response(response='Bad text/csv data: {}'.format(error), status=400, mimetype='text/plain')
+
+    def generate(data):
+        records = 0
+        while True:
+            if len(data) > 0:
+                records += len(data)
+                yield encoders['text/csv'](ScoringService.predict(data))
+            block = next(blocks, None)
+            if block is None:
+                break
+            data = decoders['text/csv'](block, metadata)
+        print('Invoked with {} records, streamed'.format(records))
+
+    return flask.Response(flask.stream_with_context(generate(data)), status=200, mimetype='text/csv')
@@ -1,13 +1,69 @@
-import multiprocessing
 import os
 import signal
 import subprocess
 import sys
+import time
 
-cpu_count = multiprocessing.cpu_count()
+from serving_profile import serving_settings, blas_environment, available_cpus
+
+# the cores this container may run on, fewer than the machine's under a CPU set
+cpu_count = len(available_cpus())
 
 model_server_timeout = os.environ.get('MODEL_SERVER_TIMEOUT', 60)
-model_server_workers = int(os.environ.get('MODEL_SERVER_WORKERS', cpu_count))
+# gunicorn and nginx topology: MODEL_SERVER_PROFILE (gevent, sync, gthread or auto) and
+# the MODEL_SERVER_<SETTING> overrides of its settings, see serving_profile.py
+model_server_settings = serving_settings(os.environ, cpu_count)
+# load the model once in the gunicorn master, before forking the workers, which share its memory
+# pages; the image's python 3.6 cannot keep the garbage collector of the workers off those pages
+# (gc.freeze is python >= 3.7), so that the memory saved there is limited, see
+# prediction_server_app.preload_model
+model_server_preload = os.environ.get('MODEL_SERVER_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+# stream CSV invocations: predict and respond block of rows by block of rows (see prediction_server_app.py)
+model_server_streaming = os.environ.get('MODEL_SERVER_STREAMING', 'false').lower() in ('1', 'true', 'yes')
+
+# nginx settings: largest request body (unlimited, 0, by default when streaming), and whether request
+# and response bodies are buffered by nginx (on) or streamed through (off, the default when streaming)
+nginx_settings = {
+    'max_body_size': os.environ.get('MODEL_SERVER_MAX_BODY_SIZE', '0' if model_server_streaming else '5m'),
+    'proxy_request_buffering': os.environ.get('MODEL_SERVER_PROXY_REQUEST_BUFFERING',
+                                              'off' if model_server_streaming else 'on'),
+    'proxy_buffering': os.environ.get('MODEL_SERVER_PROXY_BUFFERING', 'off' if model_server_streaming else 'on'),
+    'proxy_read_timeout': str(model_server_timeout),
+    'nginx_workers': str(model_server_settings['nginx_workers']),
+    'keepalive_timeout': str(model_server_settings['keepalive_timeout']),
+    'upstream_keepalive': 'keepalive {};'.format(model_server_settings['upstream_keepalive'])
+                          if model_server_settings['upstream_keepalive'] > 0 else '',
+}
+
+program_directory = os.path.dirname(os.path.abspath(__file__))
+gunicorn_config = os.path.join(program_directory, 'gunicorn_config.py')
+
+def write_nginx_config(path='/tmp/nginx.conf'):
+    with open(os.path.join(program_directory, 'nginx.conf')) as template:
+        config = template.read()
+    for name, value in nginx_settings.items():
+        config = config.replace('{{' + name + '}}', value)
+    with open(path, 'w') as output:
+        output.write(config)
+    return path
+
+# seconds gunicorn keeps idle connections open when nginx keeps connections to it alive: longer than
+# nginx's own 60s idle upstream timeout (not settable before nginx 1.15.3), so that nginx never sends
+# a request on a connection gunicorn is closing, which would fail it with a 502 (POSTs are not retried)
+gunicorn_keepalive = 75
+
+def gunicorn_command(settings, bind='unix:/tmp/gunicorn.sock'):
+    return ['gunicorn',
+            '-c', gunicorn_config,
+            '--timeout', str(model_server_timeout),
+            '-k', settings['worker_class'],
+            '--threads', str(settings['threads']),
+            '--backlog', str(settings['backlog']),
+            '-b', bind,
+            '-w', str(settings['workers'])] + \
+           (['--keep-alive', str(gunicorn_keepalive)] if settings['upstream_keepalive'] > 0 else []) + \
+           (['--preload'] if model_server_preload else []) + \
+           ['wsgi:app']
 
 def sigterm_handler(nginx_pid, gunicorn_pid):
     try:
@@ -22,20 +78,23 @@ def sigterm_handler(nginx_pid, gunicorn_pid):
     sys.exit(0)
 
 def start_server():
-    print('Starting the inference server with {} workers.'.format(model_server_workers))
+    print('Starting the inference server with {} {} workers{}{}{}.'.format(
+        model_server_settings['workers'], model_server_settings['worker_class'],
+        ' of {} threads'.format(model_server_settings['threads'])
+        if model_server_settings['worker_class'] == 'gthread' else '',
+        ', preloading the model' if model_server_preload else '',
+        ', each pinned to {} CPU(s)'.format(max(1, model_server_settings['blas_threads']))
+        if model_server_settings['cpu_affinity'] else ''))
+    os.environ['MODEL_SERVER_START_TIME'] = str(time.time())
 
 
     # link the log streams to stdout/err so they will be logged to the container logs
     subprocess.check_call(['ln', '-sf', '/dev/stdout', '/var/log/nginx/access.log'])
     subprocess.check_call(['ln', '-sf', '/dev/stderr', '/var/log/nginx/error.log'])
 
-    nginx = subprocess.Popen(['nginx', '-c', '/opt/program/nginx.conf'])
-    gunicorn = subprocess.Popen(['gunicorn',
-                                 '--timeout', str(model_server_timeout),
-                                 '-k', 'gevent',
-                                 '-b', 'unix:/tmp/gunicorn.sock',
-                                 '-w', str(model_server_workers),
-                                 'wsgi:app'])
+    nginx = subprocess.Popen(['nginx', '-c', write_nginx_config()])
+    gunicorn = subprocess.Popen(gunicorn_command(model_server_settings),
+                                env=blas_environment(model_server_settings, os.environ))
 
     signal.signal(signal.SIGTERM, lambda a, b: sigterm_handler(nginx.pid, gunicorn.pid))
 
@@ -0,0 +1,165 @@
+import os
+from collections import OrderedDict
+
+from model_loader import find_model_file
+
+
+def flag(value):
+    """1 for the true values of the boolean environment variables (1, true, yes), 0 otherwise."""
+    return int(str(value).lower() in ('1', 'true', 'yes'))
+
+
+# the settings of a serving profile, each of which its MODEL_SERVER_<NAME> environment variable overrides:
+# gunicorn worker class (sync, gthread or gevent), worker processes, threads per gthread worker,
+# BLAS threads per worker (0 leaves the BLAS libraries to their default of one thread per core),
+# gunicorn listen backlog, nginx worker processes, client and nginx to gunicorn keepalive, and whether
+# each worker is pinned to its own blas_threads CPUs (1) or not (0)
+SETTINGS = OrderedDict([
+    ('worker_class', str),
+    ('workers', int),
+    ('threads', int),
+    ('blas_threads', int),
+    ('backlog', int),
+    ('nginx_workers', int),
+    ('keepalive_timeout', int),
+    ('upstream_keepalive', int),
+    ('cpu_affinity', flag),
+])
+
+# environment variables capping the thread pools of numpy's and scikit-learn's BLAS and OpenMP libraries
+BLAS_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                         'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# model artifacts from which the auto profile stops running one worker per core, so as to bound memory
+LARGE_MODEL_BYTES = 512 * 1024 * 1024
+
+
+def profile(worker_class, workers, threads=1, blas_threads=1, backlog=2048, nginx_workers=1,
+            keepalive_timeout=5, upstream_keepalive=0, cpu_affinity=0):
+    return OrderedDict([
+        ('worker_class', worker_class),
+        ('workers', workers),
+        ('threads', threads),
+        ('blas_threads', blas_threads),
+        ('backlog', backlog),
+        ('nginx_workers', nginx_workers),
+        ('keepalive_timeout', keepalive_timeout),
+        ('upstream_keepalive', upstream_keepalive),
+        ('cpu_affinity', cpu_affinity),
+    ])
+
+
+def profiles(cpu_count):
+    """{profile name: settings} for a machine of cpu_count cores.
+
+    gevent: the historical settings, one gevent worker per core, for models waiting on I/O.
+    sync: one single threaded worker per core, each with a single BLAS thread and pinned to its
+    core, for CPU bound numpy and scikit-learn models: as many busy threads as cores.
+    gthread: half as many workers with 4 threads each, sharing the cores of their worker in BLAS,
+    for large models or requests that mix parsing and computation."""
+    gthread_workers = max(1, cpu_count // 2)
+    return {
+        'gevent': profile('gevent', cpu_count, blas_threads=0),
+        'sync': profile('sync', cpu_count, cpu_affinity=1),
+        'gthread': profile('gthread', gthread_workers, threads=4, blas_threads=max(1, cpu_count // gthread_workers),
+                           upstream_keepalive=gthread_workers * 4),
+    }
+
+
+def auto_profile(cpu_count, model_path=None):
+    """The settings picked from the core count and the model artifact: a single core is
+    kept busy by the threads of one gthread worker, large pickled models (which, unlike
+    memory-mapped .npy and .joblib arrays, every worker holds its own copy of) are served by
+    a gthread worker per 4 cores, and other models by the sync profile. Machines of 8 cores
+    or more run 2 nginx workers."""
+    if model_path is None:
+        try:
+            model_path = find_model_file()
+        except IOError:
+            model_path = None
+    model_size = os.path.getsize(model_path) if model_path and os.path.exists(model_path) else 0
+    nginx_workers = 2 if cpu_count >= 8 else 1
+
+    if cpu_count == 1:
+        return profile('gthread', 1, threads=4, upstream_keepalive=4)
+
+    if model_size >= LARGE_MODEL_BYTES and not model_path.endswith(('.npy', '.joblib')):
+        workers = max(1, cpu_count // 4)
+        return profile('gthread', workers, threads=4, blas_threads=cpu_count // workers,
+                       nginx_workers=nginx_workers, upstream_keepalive=workers * 4, cpu_affinity=1)
+
+    return profile('sync', cpu_count, nginx_workers=nginx_workers, cpu_affinity=1)
+
+
+def available_cpus():
+    """The CPUs this process may run on, which in a container can be fewer than the machine's."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_layout(layout):
+    """(workers, threads per worker) of a "<workers>x<threads>" layout, e.g. "4x2".
+
+    :raises: ValueError on malformed layouts."""
+    parts = layout.lower().replace('\u00d7', 'x').split('x')
+    try:
+        workers, threads = [int(part) for part in parts]
+    except ValueError:
+        raise ValueError('bad CPU layout {}, expected <workers>x<threads>, e.g. 4x2'.format(layout))
+    if workers < 1 or threads < 1:
+        raise ValueError('bad CPU layout {}, expected at least 1 worker of 1 thread'.format(layout))
+    return workers, threads
+
+
+def cpu_sets(cpus, workers, threads):
+    """Sets of threads CPUs of cpus, one per worker, disjoint as long as workers x threads
+    is at most the CPU count, wrapping around (and thus overlapping) otherwise."""
+    if workers * threads > len(cpus):
+        print('Warning: {} workers x {} threads is more than the {} CPUs, the workers share CPUs.'.format(
+            workers, threads, len(cpus)))
+    return [[cpus[(worker * threads + thread) % len(cpus)] for thread in range(threads)]
+            for worker in range(workers)]
+
+
+def serving_settings(environ, cpu_count):
+    """The settings of the MODEL_SERVER_PROFILE profile (gevent by default, or auto),
+    with MODEL_SERVER_CPU_LAYOUT ("<workers>x<threads>") setting the workers and their BLAS
+    threads and pinning them, overridden by the MODEL_SERVER_<SETTING> variables of environ.
+
+    :raises: ValueError on unknown profiles or worker classes, and malformed CPU layouts."""
+    name = environ.get('MODEL_SERVER_PROFILE', 'gevent').lower()
+    if name == 'auto':
+        settings = auto_profile(cpu_count)
+    elif name in profiles(cpu_count):
+        settings = profiles(cpu_count)[name]
+    else:
+        raise ValueError('unknown serving profile {}, expected auto, {}'.format(
+            name, ', '.join(sorted(profiles(cpu_count)))))
+
+    if environ.get('MODEL_SERVER_CPU_LAYOUT'):
+        settings['workers'], settings['blas_threads'] = parse_cpu_layout(environ['MODEL_SERVER_CPU_LAYOUT'])
+        settings['cpu_affinity'] = 1
+
+    for setting, parse in SETTINGS.items():
+        value = environ.get('MODEL_SERVER_{}'.format(setting.upper()))
+        if value:
+            settings[setting] = parse(value)
+
+    if settings['worker_class'] not in ('sync', 'gthread', 'gevent'):
+        raise ValueError('unknown worker class {}, expected sync, gthread or gevent'.format(settings['worker_class']))
+    return settings
+
+
+def blas_environment(settings, environ, cpus=None):
+    """environ with its BLAS thread pools capped at blas_threads threads per worker,
+    thread counts already set in environ taking precedence, and with the CPU sets of
+    the workers in MODEL_SERVER_CPU_SETS (see gunicorn_config.py) when pinning them."""
+    environ = dict(environ)
+    if settings['blas_threads'] > 0:
+        for variable in BLAS_THREAD_VARIABLES:
+            environ.setdefault(variable, str(settings['blas_threads']))
+    if settings['cpu_affinity']:
+        sets = cpu_sets(cpus or available_cpus(), settings['workers'], max(1, settings['blas_threads']))
+        environ['MODEL_SERVER_CPU_SETS'] = ';'.join(','.join(str(cpu) for cpu in cpu_set) for cpu_set in sets)
+    return environ
@@ -1,6 +1,12 @@
 #!/bin/sh
 
+# the image name, optionally tagged (name:tag, "latest" by default)
 name=$1
+repository=${name%%:*}
+tag=latest
+case $name in
+    *:*) tag=${name#*:} ;;
+esac
 
 # Get the region defined in the current configuration (default to us-west-2 if none defined)
 region=$(aws configure get region)
@@ -9,6 +15,19 @@ region=${region:-us-west-2}
 # Get the account number associated with the current IAM credentials
 account=$(aws sts get-caller-identity --query Account --output text)
 
-fullname="${account}.dkr.ecr.${region}.amazonaws.com/${name}:latest"
+fullname="${account}.dkr.ecr.${region}.amazonaws.com/${repository}:${tag}"
+
+# The image may have been built without build.sh (streamed build context),
+# so make sure the repository exists, we are logged in and the ECR tag is set.
+aws ecr describe-repositories --repository-names "${repository}" > /dev/null 2>&1
+
+if [ $? -ne 0 ]
+then
+    aws ecr create-repository --repository-name "${repository}" > /dev/null
+fi
+
+$(aws ecr get-login --region ${region} --no-include-email)
+
+docker tag ${name} ${fullname}
 
 docker push $fullname
@@ -1,17 +1,102 @@
+import asyncio
+import collections
+import os
+import queue
 import subprocess
 import sys
+import threading
+import time
+
+
+class StdinWriter(object):
+    """
+    Feeds a process' standard input from a thread, through a pipe, so that
+    arbitrarily large inputs (like a build context tar) are streamed without
+    being held in memory. Errors of the writing function are kept in error.
+    """
+
+
+    def __init__(self, write):
+        """
+        :param write: function writing the input to the binary stream it is given.
+        """
+        self.write = write
+        self.error = None
+        self.read_fd, self.write_fd = os.pipe()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+
+    def _run(self):
+        """nodoc"""
+        with os.fdopen(self.write_fd, "wb") as stream:
+            try:
+                self.write(stream)
+            except BrokenPipeError:
+                pass
+            except Exception as error:
+                self.error = error
+
+
+    def start(self):
+        """
+        Starts writing, once the process holds the read end of the pipe.
+        """
+        os.close(self.read_fd)
+        self.thread.start()
+
+
+    def join(self):
+        """
+        Waits for the writing to end.
+
+        :raises: the exception raised by the writing function, if any.
+        """
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
 
 
 class CommandRunner(object):
-    def __init__(self):
+    """
+    Runs commands while pumping their stdout and stderr concurrently,
+    one reader thread per stream, so that neither pipe can fill up and block
+    the process. Lines are handed to the calling thread through a bounded queue
+    and kept in out and err, and with timestamps, also interleaved with their
+    reception time in lines.
+    """
+
+
+    # seconds between two checks of the process status while no output comes
+    POLL_INTERVAL = 0.1
+
+
+    def __init__(self, max_lines=None, timestamps=False, queue_size=1024, drain_timeout=1.0):
+        """
+        :param max_lines: keep only the last max_lines lines of each stream
+                          (ring buffer), None to keep everything.
+        :param timestamps: prefix the lines echoed in verbose mode with their
+                           reception time, and keep (timestamp, stream name, line)
+                           tuples in lines.
+        :param queue_size: maximum number of lines waiting between the reader
+                           threads and the calling thread.
+        :param drain_timeout: seconds to wait for remaining output once the process
+                              exited, in case a child process keeps the pipes open.
+        """
+        self.max_lines = max_lines
+        self.timestamps = timestamps
+        self.queue_size = queue_size
+        self.drain_timeout = drain_timeout
         self.out = None
         self.err = None
+        self.lines = None
         self.reset()
 
 
     def reset(self):
-        self.out = []
-        self.err = []
+        self.out = collections.deque(maxlen=self.max_lines)
+        self.err = collections.deque(maxlen=self.max_lines)
+        self.lines = collections.deque(maxlen=None if self.max_lines is None else 2 * self.max_lines) \
+            if self.timestamps else None
 
 
     @property
@@ -24,26 +109,144 @@ class CommandRunner(object):
         return "".join(self.err)
 
 
-    def run(self, argv, output=sys.stdout, encoding="utf8", verbose=True, popen_kwargs={}):
+    def _pump(self, istream, name, lines, errors):
+        """nodoc"""
+        try:
+            for line in iter(istream.readline, ""):
+                lines.put((time.time(), name, line))
+        except Exception as error:
+            errors.append(error)
+            # keep draining the pipe, lest the process block writing to it
+            while istream.buffer.read(2 ** 16):
+                pass
+        finally:
+            lines.put(None)
+
+
+    def _record(self, timestamp, name, line, output, verbose):
+        """nodoc"""
+        (self.out if name == "stdout" else self.err).append(line)
+        if self.lines is not None:
+            self.lines.append((timestamp, name, line))
+
+        if verbose:
+            if self.timestamps:
+                output.write("[{}.{:03d}] ".format(time.strftime("%H:%M:%S", time.localtime(timestamp)),
+                                                   int(timestamp * 1000) % 1000))
+            output.write(line)
+
+
+    def run(self, argv, output=sys.stdout, encoding="utf8", verbose=True, popen_kwargs={},
+            stdin_writer=None):
+        """
+        :param stdin_writer: function writing the standard input of the process
+                             to the binary stream it is given, from another thread.
+        :returns: int -- the return code of the process.
+        :raises: the exception raised reading the output of the process, if any.
+        """
+        writer = StdinWriter(stdin_writer) if stdin_writer is not None else None
+
         process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                   encoding=encoding, **popen_kwargs)
-        return_code = None
-
-        def get_output(oarray, ostream, istream, verbose):
-            while True:
-                gotten_line = istream.readline()
-                if len(gotten_line) == 0:
-                    break
-                oarray.append(gotten_line)
-                if verbose:
-                    ostream.write(oarray[-1])
-
-        while return_code is None:
-            get_output(self.out, output, process.stdout, verbose)
-            get_output(self.err, output, process.stderr, verbose)
-            return_code = process.poll()
-
-        get_output(self.out, output, process.stdout, verbose)
-        get_output(self.err, output, process.stderr, verbose)
+                                   stdin=writer.read_fd if writer is not None else None,
+                                   encoding=encoding, errors="replace", **popen_kwargs)
+        if writer is not None:
+            writer.start()
+
+        lines = queue.Queue(maxsize=self.queue_size)
+        errors = []
+
+        readers = [threading.Thread(target=self._pump, args=(stream, name, lines, errors), daemon=True)
+                   for stream, name in [(process.stdout, "stdout"), (process.stderr, "stderr")]]
+        for reader in readers:
+            reader.start()
 
+        finished = 0
+        deadline = None
+        while finished < len(readers):
+            try:
+                item = lines.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                if process.poll() is not None:
+                    if deadline is None:
+                        deadline = time.monotonic() + self.drain_timeout
+                    elif time.monotonic() > deadline:
+                        break
+                continue
+
+            if item is None:
+                finished += 1
+            else:
+                self._record(*item, output=output, verbose=verbose)
+
+        return_code = process.wait()
+        if writer is not None:
+            writer.join()
+        if errors:
+            raise errors[0]
         return return_code
+
+
+class AsyncCommandRunner(CommandRunner):
+    """
+    asyncio counterpart of CommandRunner: run is a coroutine, so that many
+    commands (builds, pushes, executions) can run concurrently from one event loop.
+    Cancelling run, or exceeding its timeout, kills the process.
+    """
+
+
+    def __init__(self, max_lines=None, timestamps=False, line_limit=2 ** 24):
+        """
+        :param max_lines: keep only the last max_lines lines of each stream
+                          (ring buffer), None to keep everything.
+        :param timestamps: prefix the lines echoed in verbose mode with their
+                           reception time, and keep (timestamp, stream name, line)
+                           tuples in lines.
+        :param line_limit: longest line, in bytes, the stream readers accept.
+        """
+        super().__init__(max_lines=max_lines, timestamps=timestamps)
+        self.line_limit = line_limit
+
+
+    async def _pump_async(self, istream, name, encoding, output, verbose):
+        """nodoc"""
+        while True:
+            line = await istream.readline()
+            if len(line) == 0:
+                break
+            self._record(time.time(), name, line.decode(encoding, errors="replace"),
+                         output=output, verbose=verbose)
+
+
+    async def run(self, argv, output=sys.stdout, encoding="utf8", verbose=True, popen_kwargs={},
+                  stdin_writer=None, timeout=None):
+        """
+        :param stdin_writer: function writing the standard input of the process
+                             to the binary stream it is given, from another thread.
+        :param timeout: seconds after which the process is killed and
+                        asyncio.TimeoutError raised, None to wait forever.
+        :returns: int -- the return code of the process.
+        """
+        writer = StdinWriter(stdin_writer) if stdin_writer is not None else None
+
+        process = await asyncio.create_subprocess_exec(*argv, stdout=subprocess.PIPE,
+                                                       stderr=subprocess.PIPE,
+                                                       stdin=writer.read_fd if writer is not None else None,
+                                                       limit=self.line_limit, **popen_kwargs)
+        if writer is not None:
+            writer.start()
+
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                self._pump_async(process.stdout, "stdout", encoding, output, verbose),
+                self._pump_async(process.stderr, "stderr", encoding, output, verbose),
+                process.wait()
+            ), timeout)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await asyncio.shield(process.wait())
+            raise
+
+        if writer is not None:
+            await asyncio.get_running_loop().run_in_executor(None, writer.join)
+        return process.returncode
@@ -1,6 +1,11 @@
 import os
 
 
+# byte code of the serving code of the container template, compiled in place when it is imported
+# (by its tests, say), which is never part of a container
+CONTAINER_TEMPLATE_IGNORED = ("__pycache__", "*.pyc")
+
+
 def container_template_path():
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), "resources", "container-template")
 
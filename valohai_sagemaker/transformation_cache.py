@@ -0,0 +1,129 @@
+import hashlib
+import os
+import tempfile
+from .path import PathDelegate
+
+
+def default_cache_directory():
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                        "valohai_sagemaker", "transformations")
+
+
+class TransformationCache(object):
+    """
+    A persistent cache of FileTransformer results, so that an unchanged file
+    is never transformed twice. Entries are keyed by the transformer (class,
+    version and extensions) and the content digest of the input file, and the
+    least recently used ones are evicted once the cache exceeds max_size.
+    """
+
+
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024, path_delegate=None):
+        """
+        :param directory: where the transformed files are kept, by default
+                          in "valohai_sagemaker/transformations" of the user cache directory.
+        :param max_size: size, in bytes, above which the least recently used
+                         entries are evicted.
+        :param path_delegate: path handling abstraction class,
+                              you most likely don't need to use it.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.path_delegate = path_delegate
+        self.hits = 0
+        self.misses = 0
+
+        if self.directory is None:
+            self.directory = default_cache_directory()
+
+        if self.path_delegate is None:
+            self.path_delegate = PathDelegate()
+
+
+    def key(self, transformer, input_filename):
+        """
+        :returns: str -- the cache key of transforming :param input_filename:
+                  with :param transformer:.
+        """
+        ext1, ext2 = transformer.transforming
+        identity = "{}.{}:{}:{}=>{}:{}".format(type(transformer).__module__, type(transformer).__name__,
+                                               transformer.version, ext1, ext2,
+                                               self.path_delegate.file_digest(input_filename))
+        return hashlib.sha256(identity.encode("utf8")).hexdigest()
+
+
+    def lookup(self, transformer, input_filename):
+        """
+        Looks the transformation of :param input_filename: with :param transformer: up,
+        marking the entry as recently used when it exists.
+
+        :returns: tuple -- (path of the cache entry, whether it exists).
+        """
+        _, ext2 = transformer.transforming
+        entry = self.path_delegate.join(self.directory, self.key(transformer, input_filename) + ext2)
+
+        if self.path_delegate.exists(entry):
+            self.hits += 1
+            os.utime(entry)
+            return entry, True
+        return entry, False
+
+
+    def store(self, entry, write):
+        """
+        Creates the cache entry :param entry: (see lookup) atomically, so that
+        concurrent packagings never see a partial entry, then evicts old entries.
+
+        :param write: function writing the entry content to the filename it is given.
+        """
+        self.misses += 1
+        self.path_delegate.create_directories(self.directory)
+        descriptor, transformed = tempfile.mkstemp(suffix=self.path_delegate.file_extension(entry),
+                                                   dir=self.directory)
+        os.close(descriptor)
+        try:
+            write(transformed)
+            os.replace(transformed, entry)
+        except BaseException:
+            os.remove(transformed)
+            raise
+
+        self.evict(keep=entry)
+
+
+    def transformed_file(self, transformer, input_filename):
+        """
+        Transforms :param input_filename: with :param transformer:, unless the
+        result is already cached.
+
+        :returns: str -- path of the cached transformed file, only valid
+                  until the next eviction.
+        """
+        entry, cached = self.lookup(transformer, input_filename)
+        if not cached:
+            self.store(entry, lambda filename: transformer.transform(input_filename, filename))
+        return entry
+
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache fits in max_size,
+        never removing :param keep:.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
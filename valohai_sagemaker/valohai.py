@@ -1,10 +1,11 @@
+import asyncio
 import os
 import codecs
 import json
 import yaml
 from .path import PathDelegate
 from .code_container import CodeContainer
-from .shell import CommandRunner
+from .shell import CommandRunner, AsyncCommandRunner
 import valohai_cli as vh
 import valohai_cli.settings
 import valohai_cli.commands
@@ -192,8 +193,34 @@ class ValohaiAdapter(object):
         self.code_container.package()
         self.save_local_configs(inputs, parameters)
 
+        CommandRunner().run(["vh", "execution", "run", "--adhoc", "execution"] + self.cli_args,
+                            popen_kwargs=self.execution_popen_kwargs())
+
+
+    async def launch_execution_async(self, inputs={}, parameters={}, command_runner=None, timeout=None):
+        """
+        Asynchronous counterpart of launch_execution, so that several executions
+        (of distinct code containers) can be launched at once.
+
+        :params command_runner: AsyncCommandRunner to use, a new one by default.
+        :params timeout: seconds after which the vh command is killed
+                         and asyncio.TimeoutError raised, None to wait forever.
+        :returns: int -- return code of the vh command.
+        """
+        def prepare():
+            """nodoc"""
+            self.code_container.package()
+            self.save_local_configs(inputs, parameters)
+
+        await asyncio.get_running_loop().run_in_executor(None, prepare)
+
+        cmd = command_runner if command_runner is not None else AsyncCommandRunner()
+        return await cmd.run(["vh", "execution", "run", "--adhoc", "execution"] + self.cli_args,
+                             popen_kwargs=self.execution_popen_kwargs(), timeout=timeout)
+
+
+    def execution_popen_kwargs(self):
+        """nodoc"""
         env = os.environ.copy()
         env.update({"VALOHAI_CONFIG_DIR": self.path_delegate.realpath(self.path_delegate.dirname(self.valohai_delegate.config.config_filepath))})
-
-        CommandRunner().run(["vh", "execution", "run", "--adhoc", "execution"] + self.cli_args,
-                            popen_kwargs={"env": env, "cwd": self.project_path})
+        return {"env": env, "cwd": self.project_path}